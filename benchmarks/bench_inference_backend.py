@@ -0,0 +1,114 @@
+"""
+推理后端对比：PyTorch vs ONNX Runtime int8
+
+每个后端在独立子进程中加载向量模型和交叉编码器（与 Web 服务相同的 VectorIndexer / Reranker 路径），
+测量单查询向量化、单查询重排（--candidates 个候选）的延迟和进程常驻内存峰值。
+输出一致性请用 python src/onnx_backend.py verify 校验。
+
+用法:
+    python benchmarks/bench_inference_backend.py --threads 4 --output backends.json
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def max_rss_mb():
+    # Linux 上 ru_maxrss 的单位为 KB，macOS 上为字节
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_backend(backend, args):
+    """在当前进程中加载并测量一个后端，结果以 JSON 打印到标准输出"""
+    from chunking import iter_chunks
+    from indexing import VectorIndexer
+    from onnx_backend import backend_options_from_env
+    from reranking import Reranker
+
+    options = None
+    if backend == 'onnx':
+        options = dict(backend_options_from_env(), num_threads=args.threads)
+    elif args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    start = time.perf_counter()
+    indexer = VectorIndexer(store="numpy", lexical=False, backend=backend, backend_options=options)
+    reranker = Reranker(cache_size=0, backend=backend, backend_options=options)
+    load_seconds = time.perf_counter() - start
+
+    with open(os.path.join(ROOT, 'data', 'query_examples.json'), 'r', encoding='utf-8') as f:
+        queries = [question for questions in json.load(f).values() for question in questions]
+    passages = [chunk.text for chunk in iter_chunks(os.path.join(ROOT, 'data', 'doc.md'))][:args.candidates]
+
+    # 预热
+    indexer.embed_chunk(queries[0])
+    reranker.score(queries[0], passages)
+
+    embed_ms, rerank_ms = [], []
+    for query in queries:
+        start = time.perf_counter()
+        indexer.embed_chunk(query)
+        embed_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        reranker.score(query, passages)
+        rerank_ms.append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({
+        'backend': backend,
+        'load_seconds': round(load_seconds, 2),
+        'embed_p50_ms': round(statistics.median(embed_ms), 3),
+        'embed_p95_ms': round(percentile(embed_ms, 95), 3),
+        'rerank_p50_ms': round(statistics.median(rerank_ms), 3),
+        'rerank_p95_ms': round(percentile(rerank_ms, 95), 3),
+        'max_rss_mb': max_rss_mb(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the PyTorch and ONNX int8 inference backends")
+    parser.add_argument('--backends', default='torch,onnx', help='comma separated backends')
+    parser.add_argument('--threads', type=int, default=None, help='inference threads for both backends')
+    parser.add_argument('--candidates', type=int, default=5, help='passages scored per rerank call')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.worker:
+        run_backend(args.worker, args)
+        return
+
+    results = []
+    for backend in args.backends.split(','):
+        # 每个后端单独一个进程，内存峰值互不影响
+        command = [sys.executable, os.path.abspath(__file__), '--worker', backend, '--candidates', str(args.candidates)]
+        if args.threads:
+            command += ['--threads', str(args.threads)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{backend:>6} load={result['load_seconds']:>6.2f}s embed p50={result['embed_p50_ms']:>8.3f}ms "
+              f"p95={result['embed_p95_ms']:>8.3f}ms rerank p50={result['rerank_p50_ms']:>8.3f}ms "
+              f"p95={result['rerank_p95_ms']:>8.3f}ms rss={result['max_rss_mb']:>8.1f}MB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
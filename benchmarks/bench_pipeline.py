@@ -0,0 +1,175 @@
+"""
+问答管线各阶段的离线基准测试
+
+在不同规模的合成知识库上分别计时：分块（语义 / 字符）、建索引（全量 / 增量）、召回（向量 / 混合）、
+重排和生成（非流式与流式首 token）。向量模型和交叉编码器使用 standins.py 中的本地替身，
+LLM 使用 llm_stub.py 启动的本地桩服务，因此无需模型下载和 API Key，结果可以在提交之间直接对比；
+测得的是模型推理以外的开销，LLM 部分为客户端与 prompt 组装的开销加上桩服务的配置延迟。
+
+用法:
+    python benchmarks/bench_pipeline.py --sizes 100,1000,5000 --output pipeline.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chunking import iter_chunks
+from generation import ResponseGenerator
+from indexing import VectorIndexer
+from llm_client import LLMClient
+from reranking import Reranker
+from retrieval import Retriever
+
+from llm_stub import start_stub_server
+from standins import HashingEmbedder, OverlapCrossEncoder, make_corpus
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(samples_ms):
+    return {
+        'runs': len(samples_ms),
+        'p50_ms': round(statistics.median(samples_ms), 3),
+        'p95_ms': round(percentile(samples_ms, 95), 3),
+        'mean_ms': round(statistics.mean(samples_ms), 3),
+    }
+
+
+def time_call(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def time_each(fn, items):
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def first_token_ms(generator, query, chunks):
+    start = time.perf_counter()
+    elapsed = None
+    for _ in generator.generate_stream(query, chunks, query_type="concept"):
+        if elapsed is None:
+            elapsed = (time.perf_counter() - start) * 1000
+    return elapsed
+
+
+def bench_size(size, args, llm_client, work_dir):
+    doc_file = os.path.join(work_dir, f"corpus_{size}.md")
+    titles = make_corpus(doc_file, size)
+    queries = [f"{titles[i % len(titles)]}是什么？" for i in range(args.queries)]
+    embedder = HashingEmbedder(dim=args.dim)
+    stages = {}
+
+    stages['chunking_semantic'] = time_call(lambda: list(iter_chunks(doc_file, use_semantic=True)), args.repeats)
+    stages['chunking_chars'] = time_call(lambda: list(iter_chunks(doc_file, use_semantic=False)), args.repeats)
+
+    cold, incremental = [], []
+    for repeat in range(args.repeats):
+        indexer = VectorIndexer(persist_dir=os.path.join(work_dir, f"index_{size}_{repeat}"), store="numpy",
+                                embedding_model=embedder)
+        cold += time_call(lambda: indexer.build_index(iter_chunks(doc_file)), 1)
+        incremental += time_call(lambda: indexer.build_index(iter_chunks(doc_file)), 1)
+    stages['build_index_cold'] = cold
+    stages['build_index_incremental'] = incremental
+
+    # 关闭缓存，测量每次查询的完整开销
+    vector_retriever = Retriever(indexer, cache_size=0, mode="vector")
+    hybrid_retriever = Retriever(indexer, cache_size=0, mode="hybrid")
+    stages['retrieve_vector'] = time_each(lambda q: vector_retriever.retrieve(q, top_k=args.top_k_retrieve), queries)
+    stages['retrieve_hybrid'] = time_each(lambda q: hybrid_retriever.retrieve(q, top_k=args.top_k_retrieve), queries)
+
+    reranker = Reranker(cross_encoder=OverlapCrossEncoder(), cache_size=0)
+    candidates = {q: hybrid_retriever.retrieve(q, top_k=args.top_k_retrieve) for q in queries}
+    stages['rerank'] = time_each(lambda q: reranker.rerank(q, candidates[q], top_k=args.top_k_rerank), queries)
+
+    generator = ResponseGenerator(llm_client=llm_client)
+    llm_queries = queries[:args.llm_queries]
+    contexts = {q: reranker.rerank(q, candidates[q], top_k=args.top_k_rerank) for q in llm_queries}
+    stages['generate'] = time_each(lambda q: generator.generate(q, contexts[q], query_type="concept"), llm_queries)
+    stages['generate_first_token'] = [first_token_ms(generator, q, contexts[q]) for q in llm_queries]
+
+    return {
+        'size': size,
+        'chunks': len(indexer.store),
+        'stages': {stage: summarize(samples) for stage, samples in stages.items()},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the RAG pipeline offline")
+    parser.add_argument('--sizes', default='100,1000,5000', help='comma separated numbers of teaching modules')
+    parser.add_argument('--queries', type=int, default=100, help='queries per retrieval and rerank run')
+    parser.add_argument('--llm-queries', type=int, default=10, help='queries per generation run')
+    parser.add_argument('--repeats', type=int, default=3, help='runs of the chunking and indexing stages')
+    parser.add_argument('--dim', type=int, default=768, help='stand-in embedding dimension')
+    parser.add_argument('--top-k-retrieve', type=int, default=5)
+    parser.add_argument('--top-k-rerank', type=int, default=3)
+    parser.add_argument('--first-token-ms', type=float, default=200.0, help='LLM stub delay before the first token')
+    parser.add_argument('--token-ms', type=float, default=10.0, help='LLM stub delay between streamed tokens')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(first_token_ms=args.first_token_ms, token_ms=args.token_ms)
+    llm_client = LLMClient(api_key="stub", base_url=base_url, max_retries=0)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            for size in [int(s) for s in args.sizes.split(',')]:
+                result = bench_size(size, args, llm_client, work_dir)
+                results.append(result)
+                print(f"n={size} ({result['chunks']} chunks)")
+                for stage, summary in result['stages'].items():
+                    print(f"  {stage:>24} p50={summary['p50_ms']:>10.3f}ms p95={summary['p95_ms']:>10.3f}ms "
+                          f"mean={summary['mean_ms']:>10.3f}ms")
+    finally:
+        llm_client.close()
+        server.shutdown()
+
+    if args.output:
+        report = {
+            'metadata': {
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'config': vars(args),
+            },
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+向量存储后端性能对比：ChromaDB vs NumPy
+
+使用随机单位向量模拟不同规模的知识库，对比写入耗时、单条查询延迟、批量查询吞吐，
+以及粗排后端（numpy-int8 / numpy-pca）相对精确检索的 recall@k。
+
+用法:
+    python benchmarks/bench_vector_store.py --sizes 1000,5000,20000 --output results.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from vector_store import create_vector_store
+
+
+def random_unit_vectors(rng, count, dim):
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def bench_backend(backend, options, embeddings, queries, top_k, batch_size, persist_dir):
+    start = time.perf_counter()
+    store = create_vector_store(backend, persist_dir, **options)
+    init_ms = (time.perf_counter() - start) * 1000
+
+    ids = [f"doc-{i}" for i in range(len(embeddings))]
+    documents = [f"document {i}" for i in range(len(embeddings))]
+    start = time.perf_counter()
+    for offset in range(0, len(ids), 1000):
+        store.add(ids[offset:offset + 1000], embeddings[offset:offset + 1000].tolist(), documents[offset:offset + 1000])
+    store.persist()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        store.query([query.tolist()], top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    found = []
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch_size):
+        found.extend(store.query(queries[offset:offset + batch_size].tolist(), top_k)['ids'])
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        'init_ms': round(init_ms, 2),
+        'build_ms': round(build_ms, 2),
+        'query_p50_ms': round(statistics.median(latencies), 3),
+        'query_p95_ms': round(percentile(latencies, 95), 3),
+        'batched_qps': round(len(queries) / batch_seconds, 1),
+    }, found
+
+
+def recall_at_k(found, exact):
+    """与精确检索结果相比的平均召回率"""
+    return statistics.mean(len(set(a) & set(b)) / len(b) for a, b in zip(found, exact))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vector store backends")
+    parser.add_argument('--sizes', default='1000,5000,20000', help='comma separated corpus sizes')
+    parser.add_argument('--dim', type=int, default=768, help='embedding dimension')
+    parser.add_argument('--queries', type=int, default=200, help='number of queries per run')
+    parser.add_argument('--batch-size', type=int, default=32, help='queries per batched call')
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    backends = [
+        ('numpy-float32', 'numpy', {'dtype': 'float32'}),
+        ('numpy-float16', 'numpy', {'dtype': 'float16'}),
+        ('numpy-int8', 'numpy', {'first_pass': 'int8'}),
+        ('numpy-pca', 'numpy', {'first_pass': 'pca'}),
+    ]
+    try:
+        import chromadb  # noqa: F401
+        backends.insert(0, ('chroma', 'chroma', {}))
+    except ImportError:
+        print("chromadb not installed, skipping chroma backend")
+
+    rng = np.random.default_rng(0)
+    results = []
+    for size in [int(s) for s in args.sizes.split(',')]:
+        embeddings = random_unit_vectors(rng, size, args.dim)
+        queries = random_unit_vectors(rng, args.queries, args.dim)
+        exact = None
+        for name, backend, options in backends:
+            with tempfile.TemporaryDirectory() as persist_dir:
+                result, found = bench_backend(backend, options, embeddings, queries, args.top_k, args.batch_size,
+                                              persist_dir)
+            # 以 numpy-float32 的精确结果为基准；随机向量没有聚类结构，降维粗排的召回会明显低于真实语料
+            if name == 'numpy-float32':
+                exact = found
+            result.update({'backend': name, 'size': size, 'dim': args.dim})
+            if exact is not None:
+                result['recall'] = round(recall_at_k(found, exact), 4)
+            results.append(result)
+            print(f"{name:>14} n={size:<7} build={result['build_ms']:>9.1f}ms "
+                  f"p50={result['query_p50_ms']:>7.3f}ms p95={result['query_p95_ms']:>7.3f}ms "
+                  f"batched={result['batched_qps']:>9.1f} q/s recall={result.get('recall', float('nan')):.3f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+召回与重排的效果 / 延迟评估，用于选择 top_k_retrieve、top_k_rerank 和检索后端
+
+对标注问题集（默认 data/retrieval_eval.json，每个问题标注应命中的教学模块标题）在 data/doc.md 上
+遍历存储后端、检索模式（向量 / 混合）、召回深度和重排深度，报告：
+
+- hit@k：最终结果中至少包含一个标注模块的问题比例
+- recall@k：标注模块被最终结果覆盖的平均比例
+- MRR：第一个相关结果排名的倒数的均值
+- 每个查询的召回、重排和总延迟（p50/p95，毫秒，查询缓存关闭）
+
+rerank_k 为 "-" 的行是不经重排、直接取召回结果的前 k 个。
+最后给出在效果不低于基线（默认 hybrid、召回 5、重排 3）的前提下总延迟最低的配置。
+字符分块的片段可能跨越模块，按字节范围与模块的重叠判定相关。
+
+用法:
+    python benchmarks/eval_retrieval.py --retrieve-k 3,5,8,10,15 --rerank-k 1,2,3,5 --output eval.json
+    python benchmarks/eval_retrieval.py --standins    # 使用本地替身模型快速检查流程
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chunking import iter_chunks, iter_chunks_by_title
+from indexing import VectorIndexer
+from reranking import Reranker
+from retrieval import Retriever
+
+STORES = {
+    'numpy': ('numpy', {}),
+    'numpy-float16': ('numpy', {'dtype': 'float16'}),
+    'numpy-int8': ('numpy', {'first_pass': 'int8'}),
+    'numpy-pca': ('numpy', {'first_pass': 'pca'}),
+    'chroma': ('chroma', {}),
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def parse_ints(text):
+    return [int(value) for value in text.split(',') if value]
+
+
+def module_labels(doc_file, chunking):
+    """
+    文本块 -> 其覆盖的模块标题集合
+
+    语义分块时每个块就是一个模块；字符分块时按字节范围与各模块的重叠判定
+    """
+    modules = [(chunk.heading_path[-1], chunk.start_byte, chunk.end_byte) for chunk in iter_chunks_by_title(doc_file)]
+    labels = {}
+    for chunk in iter_chunks(doc_file, use_semantic=(chunking == 'semantic')):
+        labels.setdefault(chunk.text, set()).update(
+            heading for heading, start, end in modules if chunk.start_byte < end and start < chunk.end_byte)
+    return labels
+
+
+def score(ranked, expected, labels):
+    """返回 (是否命中, 覆盖比例, 倒数排名)"""
+    found = set()
+    reciprocal_rank = 0.0
+    for rank, text in enumerate(ranked, start=1):
+        matched = labels.get(text, set()) & expected
+        if matched and not reciprocal_rank:
+            reciprocal_rank = 1.0 / rank
+        found |= matched
+    return bool(found), len(found) / len(expected), reciprocal_rank
+
+
+def timed(fn, repeats):
+    """执行 repeats 次，返回最后一次的结果和最快一次的耗时（毫秒）"""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def evaluate(retriever, reranker, questions, labels, retrieve_ks, rerank_ks, repeats):
+    """对一个检索器遍历召回深度和重排深度，返回结果行"""
+    rows = []
+    for retrieve_k in retrieve_ks:
+        per_query = []
+        for item in questions:
+            candidates, retrieve_ms = timed(lambda: retriever.retrieve(item['question'], top_k=retrieve_k), repeats)
+            # 重排开销取决于候选数，与保留几个结果无关：整体排序一次，再按各 rerank_k 截取
+            reranked, rerank_ms = timed(lambda: reranker.rerank(item['question'], candidates, top_k=len(candidates)),
+                                        repeats)
+            per_query.append((set(item['expected']), candidates, reranked, retrieve_ms, rerank_ms))
+
+        retrieve_latencies = [query[3] for query in per_query]
+        rerank_latencies = [query[4] for query in per_query]
+        total_latencies = [query[3] + query[4] for query in per_query]
+        for rerank_k in [None] + [k for k in rerank_ks if k <= retrieve_k]:
+            scores = [score(candidates if rerank_k is None else reranked[:rerank_k], expected, labels)
+                      for expected, candidates, reranked, _, _ in per_query]
+            row = {
+                'retrieve_k': retrieve_k,
+                'rerank_k': rerank_k,
+                'hit': round(statistics.mean(hit for hit, _, _ in scores), 4),
+                'recall': round(statistics.mean(recall for _, recall, _ in scores), 4),
+                'mrr': round(statistics.mean(rr for _, _, rr in scores), 4),
+                'retrieve_p50_ms': round(percentile(retrieve_latencies, 50), 3),
+                'retrieve_p95_ms': round(percentile(retrieve_latencies, 95), 3),
+            }
+            latencies = retrieve_latencies if rerank_k is None else total_latencies
+            if rerank_k is not None:
+                row['rerank_p50_ms'] = round(percentile(rerank_latencies, 50), 3)
+                row['rerank_p95_ms'] = round(percentile(rerank_latencies, 95), 3)
+            row['total_p50_ms'] = round(percentile(latencies, 50), 3)
+            row['total_p95_ms'] = round(percentile(latencies, 95), 3)
+            rows.append(row)
+    return rows
+
+
+def recommend(rows, baseline, tolerance):
+    """效果不低于基线（允许 tolerance 的差距）的重排配置中，总延迟 p50 最低的一个"""
+    store, mode, retrieve_k, rerank_k = baseline
+    reference = next((row for row in rows if (row['store'], row['mode'], row['retrieve_k'], row['rerank_k'])
+                      == (store, mode, retrieve_k, rerank_k)), None)
+    if reference is None:
+        return None, None
+    candidates = [row for row in rows if row['rerank_k'] is not None
+                  and row['hit'] >= reference['hit'] - tolerance
+                  and row['recall'] >= reference['recall'] - tolerance
+                  and row['mrr'] >= reference['mrr'] - tolerance]
+    return reference, min(candidates, key=lambda row: row['total_p50_ms'])
+
+
+def describe(row):
+    rerank = '-' if row['rerank_k'] is None else row['rerank_k']
+    return f"{row['store']}/{row['mode']} retrieve={row['retrieve_k']} rerank={rerank}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval and rerank depth against labelled questions")
+    parser.add_argument('--doc', default=os.path.join(ROOT, 'data', 'doc.md'), help='knowledge base document')
+    parser.add_argument('--questions', default=os.path.join(ROOT, 'data', 'retrieval_eval.json'),
+                        help='JSON list of {"question", "expected": [module headings]}')
+    parser.add_argument('--chunking', choices=['semantic', 'chars'], default='semantic')
+    parser.add_argument('--stores', default='numpy,chroma', help=f"comma separated, from {', '.join(STORES)}")
+    parser.add_argument('--modes', default='vector,hybrid', help='comma separated retrieval modes')
+    parser.add_argument('--retrieve-k', default='3,5,8,10,15', help='comma separated retrieval depths')
+    parser.add_argument('--rerank-k', default='1,2,3,5', help='comma separated rerank depths')
+    parser.add_argument('--repeats', type=int, default=3, help='runs per query; the fastest is reported')
+    parser.add_argument('--baseline', default='hybrid:5:3', help='mode:retrieve_k:rerank_k to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.0, help='allowed drop in hit/recall/MRR vs baseline')
+    parser.add_argument('--embedding-model', default='shibing624/text2vec-base-chinese')
+    parser.add_argument('--cross-encoder', default='cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
+    parser.add_argument('--standins', action='store_true', help='use local stand-in models instead of real ones')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    with open(args.questions, 'r', encoding='utf-8') as f:
+        questions = json.load(f)
+    labels = module_labels(args.doc, args.chunking)
+
+    if args.standins:
+        from standins import HashingEmbedder, OverlapCrossEncoder
+        embedding_model, cross_encoder = HashingEmbedder(), OverlapCrossEncoder()
+    else:
+        from sentence_transformers import CrossEncoder, SentenceTransformer
+        embedding_model = SentenceTransformer(args.embedding_model)
+        cross_encoder = CrossEncoder(args.cross_encoder)
+    reranker = Reranker(cross_encoder=cross_encoder, cache_size=0)
+
+    stores = args.stores.split(',')
+    if 'chroma' in stores:
+        try:
+            import chromadb  # noqa: F401
+        except ImportError:
+            print("chromadb not installed, skipping chroma backend")
+            stores.remove('chroma')
+
+    rows = []
+    for store in stores:
+        backend, options = STORES[store]
+        indexer = VectorIndexer(args.embedding_model, store=backend, store_options=options,
+                                embedding_model=embedding_model)
+        indexer.build_index(iter_chunks(args.doc, use_semantic=(args.chunking == 'semantic')))
+        for mode in args.modes.split(','):
+            retriever = Retriever(indexer, cache_size=0, mode=mode)
+            for row in evaluate(retriever, reranker, questions, labels, parse_ints(args.retrieve_k),
+                                parse_ints(args.rerank_k), args.repeats):
+                row.update(store=store, mode=mode)
+                rows.append(row)
+                rerank_ms = f"{row['rerank_p50_ms']:>8.2f}" if 'rerank_p50_ms' in row else f"{'-':>8}"
+                print(f"{describe(row):<40} hit={row['hit']:.3f} recall={row['recall']:.3f} mrr={row['mrr']:.3f} "
+                      f"retrieve={row['retrieve_p50_ms']:>7.2f}ms rerank={rerank_ms}ms "
+                      f"total p50={row['total_p50_ms']:>8.2f}ms p95={row['total_p95_ms']:>8.2f}ms")
+
+    mode, retrieve_k, rerank_k = args.baseline.split(':')
+    reference, best = recommend(rows, (stores[0], mode, int(retrieve_k), int(rerank_k)), args.tolerance)
+    if reference is None:
+        print(f"baseline {args.baseline} was not part of the sweep")
+    else:
+        print(f"\nbaseline:    {describe(reference)} hit={reference['hit']:.3f} recall={reference['recall']:.3f} "
+              f"mrr={reference['mrr']:.3f} total p50={reference['total_p50_ms']:.2f}ms")
+        print(f"recommended: {describe(best)} hit={best['hit']:.3f} recall={best['recall']:.3f} "
+              f"mrr={best['mrr']:.3f} total p50={best['total_p50_ms']:.2f}ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'config': vars(args),
+                'questions': len(questions),
+                'results': rows,
+                'baseline': reference,
+                'recommended': best,
+            }, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+本地 OpenAI 兼容的 LLM 桩服务，用于离线基准测试和压测
+
+只实现 POST /v1/chat/completions（流式与非流式），按配置的首 token 延迟和逐 token 间隔返回固定文本，
+usage 中带有 DeepSeek 格式的 prompt_cache_hit_tokens / prompt_cache_miss_tokens。
+
+用法:
+    python benchmarks/llm_stub.py --port 8089 --first-token-ms 300 --token-ms 20
+    LLM_BASE_URL=http://127.0.0.1:8089/v1 LLM_API_KEY=stub python web/app.py
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "摩擦力是阻碍物体相对运动或相对运动趋势的力，它的方向与相对运动方向相反。"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+        config = self.server.config
+
+        prompt_chars = sum(len(message.get('content') or '') for message in request.get('messages', []))
+        # 粗略模拟上下文缓存：system 消息视为命中
+        cached_chars = sum(len(message.get('content') or '') for message in request.get('messages', [])
+                           if message.get('role') == 'system')
+        tokens = [config['reply'][i:i + 2] for i in range(0, len(config['reply']), 2)][:request.get('max_tokens') or None]
+        usage = {
+            'prompt_tokens': prompt_chars,
+            'completion_tokens': len(tokens),
+            'total_tokens': prompt_chars + len(tokens),
+            'prompt_cache_hit_tokens': cached_chars,
+            'prompt_cache_miss_tokens': prompt_chars - cached_chars,
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request.get('model', 'stub')
+
+        time.sleep(config['first_token_ms'] / 1000)
+        if not request.get('stream'):
+            time.sleep(config['token_ms'] * max(0, len(tokens) - 1) / 1000)
+            self._send_json({
+                'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': ''.join(tokens)}}],
+                'usage': usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for index, token in enumerate(tokens):
+            if index:
+                time.sleep(config['token_ms'] / 1000)
+            self._send_event({'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                              'model': model, 'choices': [{'index': 0, 'delta': {'content': token},
+                                                           'finish_reason': None}]})
+        self._send_event({'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                          'model': model, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+        if (request.get('stream_options') or {}).get('include_usage'):
+            self._send_event({'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                              'model': model, 'choices': [], 'usage': usage})
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _send_json(self, payload):
+
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_event(self, payload):
+
+        self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+
+def start_stub_server(host='127.0.0.1', port=0, first_token_ms=200.0, token_ms=10.0, reply=DEFAULT_REPLY):
+    """
+    在后台线程启动桩服务
+
+    Returns:
+        tuple: (server, base_url)，用完后调用 server.shutdown()
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.config = {'first_token_ms': first_token_ms, 'token_ms': token_ms, 'reply': reply}
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible LLM stub server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--first-token-ms', type=float, default=200.0, help='delay before the first token')
+    parser.add_argument('--token-ms', type=float, default=10.0, help='delay between streamed tokens')
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.host, args.port, args.first_token_ms, args.token_ms)
+    print(f"LLM stub listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,395 @@
+"""
+Web 服务端到端压测
+
+模拟学生的一轮对话：提问（/api/ask 或 /api/ask/stream）、追加消息，并按比例查看对话列表和对话详情，
+每个对话首轮前新建对话。按接口统计吞吐、p50/p95/p99 延迟和错误率，另有整轮对话（student_turn）的延迟。
+
+- 闭环（--mode closed）：--concurrency 个虚拟学生在 --ramp 秒内逐个加入，每轮结束后思考 --think-ms 再提问
+- 开环（--mode open）：按 --rate 轮/秒的泊松到达发起，到达率在 --ramp 秒内线性升到目标值；
+  整轮延迟从计划到达时刻算起，包含排队时间，超过 --max-in-flight 的到达记为丢弃
+
+--spawn 时在本地启动 LLM 桩服务和 web/app.py（关闭调试模式、使用临时会话数据库），就绪后开始压测；
+否则压测 --url 指向的已有服务，此时应让该服务的 LLM_BASE_URL 指向 llm_stub.py。
+
+用法:
+    python benchmarks/load_test.py --spawn --mode closed --concurrency 16 --ramp 10 --duration 60
+    python benchmarks/load_test.py --url http://localhost:5000 --mode open --rate 20 --output load.json
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from llm_stub import start_stub_server
+
+DEFAULT_QUESTIONS_FILE = os.path.join(ROOT, 'data', 'query_examples.json')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def load_questions(path):
+    """按类别的样例问题（data/query_examples.json），返回 (类别, 问题) 列表"""
+    with open(path, 'r', encoding='utf-8') as f:
+        examples = json.load(f)
+    return [(label, question) for label, questions in examples.items() for question in questions]
+
+
+class Recorder:
+    """线程安全地收集每个请求的 (接口, 开始时刻, 延迟, 是否成功, 状态码, 首字节延迟)"""
+
+    def __init__(self, started_at):
+
+        self.started_at = started_at
+        self.samples = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, start, latency_ms, ok, status, ttfb_ms=None):
+
+        with self._lock:
+            self.samples.append((endpoint, start - self.started_at, latency_ms, ok, status, ttfb_ms))
+
+    def drop(self):
+
+        with self._lock:
+            self.dropped += 1
+
+
+class Client:
+    """每个线程一个保持连接的 HTTP 客户端，出错后重新连接"""
+
+    def __init__(self, base_url, recorder, timeout):
+
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.recorder = recorder
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, endpoint, method, path, body=None, stream=False):
+        """
+        发送请求并记录到 endpoint 名下
+
+        Returns:
+            dict: 成功时为解析后的 JSON 响应（流式请求为 done 事件的数据），失败时为 None
+        """
+        start = time.perf_counter()
+        status, ttfb_ms, result = 0, None, None
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            payload = json.dumps(body, ensure_ascii=False).encode('utf-8') if body is not None else None
+            headers = {'Content-Type': 'application/json'} if payload is not None else {}
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            status = response.status
+            if stream and status == 200:
+                result, ttfb_ms = self._read_events(response, start)
+            else:
+                data = response.read()
+                result = json.loads(data) if data and status < 400 else None
+            if response.will_close:
+                self._reset()
+        except Exception:
+            self._reset()
+        latency_ms = (time.perf_counter() - start) * 1000
+        ok = 200 <= status < 300 and result is not None and result.get('success', True) is not False
+        self.recorder.record(endpoint, start, latency_ms, ok, status, ttfb_ms)
+        return result if ok else None
+
+    @staticmethod
+    def _read_events(response, start):
+        """读取 server-sent events，返回 done 事件的数据和首个 token 的延迟"""
+        ttfb_ms, result, event = None, None, None
+        for raw in response:
+            line = raw.decode('utf-8').rstrip('\n')
+            if line.startswith('event: '):
+                event = line[len('event: '):]
+                if event == 'token' and ttfb_ms is None:
+                    ttfb_ms = (time.perf_counter() - start) * 1000
+            elif line.startswith('data: ') and event in ('done', 'error'):
+                result = json.loads(line[len('data: '):])
+        return result, ttfb_ms
+
+    def _reset(self):
+
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = None
+
+
+class Scenario:
+    """一轮学生对话的请求组合"""
+
+    def __init__(self, args, questions):
+
+        self.args = args
+        self.questions = questions
+
+    def turn(self, client, rng, conversation):
+        """
+        执行一轮对话
+
+        Args:
+            conversation: 该虚拟学生当前对话的状态 {'id': ..., 'turns': ...}，按需新建
+        """
+        args = self.args
+        if conversation.get('id') is None or conversation['turns'] >= args.turns_per_conversation:
+            created = client.request('POST /api/conversations', 'POST', '/api/conversations', {'title': '压测对话'})
+            conversation.update(id=created['_id'] if created else None, turns=0)
+
+        _, question = rng.choice(self.questions)
+        if rng.random() < args.stream_ratio:
+            answer = client.request('POST /api/ask/stream', 'POST', '/api/ask/stream', {'question': question},
+                                    stream=True)
+        else:
+            answer = client.request('POST /api/ask', 'POST', '/api/ask', {'question': question})
+
+        if conversation['id'] is None:
+            return
+        conversation['turns'] += 1
+        messages = [{'role': 'user', 'content': question},
+                    {'role': 'assistant', 'content': (answer or {}).get('answer', '')}]
+        client.request('POST /api/conversations/<id>/messages', 'POST',
+                       f"/api/conversations/{conversation['id']}/messages", {'messages': messages})
+        if rng.random() < args.list_ratio:
+            client.request('GET /api/conversations', 'GET', '/api/conversations?limit=20')
+        if rng.random() < args.load_ratio:
+            client.request('GET /api/conversations/<id>', 'GET', f"/api/conversations/{conversation['id']}")
+
+
+def run_closed_loop(args, scenario, recorder, end_time):
+
+    def worker(index):
+        # 在 ramp 秒内逐个加入
+        time.sleep(args.ramp * index / max(1, args.concurrency))
+        rng = random.Random(args.seed + index)
+        client = Client(args.url, recorder, args.timeout)
+        conversation = {}
+        while time.perf_counter() < end_time:
+            start = time.perf_counter()
+            scenario.turn(client, rng, conversation)
+            recorder.record('student_turn', start, (time.perf_counter() - start) * 1000, True, 200)
+            if args.think_ms:
+                time.sleep(rng.expovariate(1000 / args.think_ms))
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_open_loop(args, scenario, recorder, end_time):
+
+    local = threading.local()
+    in_flight = threading.Semaphore(args.max_in_flight)
+    rng = random.Random(args.seed)
+
+    def task(scheduled_at, seed):
+        try:
+            if not hasattr(local, 'client'):
+                local.client = Client(args.url, recorder, args.timeout)
+                local.conversation = {}
+            scenario.turn(local.client, random.Random(seed), local.conversation)
+            # 从计划到达时刻算起，包含排队等待的时间
+            recorder.record('student_turn', scheduled_at, (time.perf_counter() - scheduled_at) * 1000, True, 200)
+        finally:
+            in_flight.release()
+
+    start = time.perf_counter()
+    next_arrival = start + rng.expovariate(args.rate)
+    with ThreadPoolExecutor(max_workers=args.max_in_flight, thread_name_prefix="load") as executor:
+        while next_arrival < end_time:
+            # 爬坡阶段按 当前到达率 / 目标到达率 的概率保留到达（泊松过程稀疏化）
+            ramp_share = min(1.0, (next_arrival - start) / args.ramp) if args.ramp else 1.0
+            if rng.random() < ramp_share:
+                now = time.perf_counter()
+                if next_arrival > now:
+                    time.sleep(next_arrival - now)
+                if in_flight.acquire(blocking=False):
+                    executor.submit(task, next_arrival, rng.random())
+                else:
+                    recorder.drop()
+            next_arrival += rng.expovariate(args.rate)
+
+
+def summarize(recorder, window_start, window_seconds):
+    """按接口汇总 window_start 之后开始的请求"""
+    by_endpoint = defaultdict(list)
+    for sample in recorder.samples:
+        if sample[1] >= window_start:
+            by_endpoint[sample[0]].append(sample)
+
+    summary = {}
+    for endpoint, samples in sorted(by_endpoint.items()):
+        latencies = [sample[2] for sample in samples]
+        errors = sum(1 for sample in samples if not sample[3])
+        status_codes = defaultdict(int)
+        for sample in samples:
+            status_codes[str(sample[4])] += 1
+        result = {
+            'requests': len(samples),
+            'errors': errors,
+            'error_rate': round(errors / len(samples), 4),
+            'throughput_rps': round(len(samples) / window_seconds, 2),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'mean_ms': round(statistics.mean(latencies), 2),
+            'max_ms': round(max(latencies), 2),
+            'status_codes': dict(status_codes),
+        }
+        ttfb = [sample[5] for sample in samples if sample[5] is not None]
+        if ttfb:
+            result['first_token_p50_ms'] = round(percentile(ttfb, 50), 2)
+            result['first_token_p95_ms'] = round(percentile(ttfb, 95), 2)
+            result['first_token_p99_ms'] = round(percentile(ttfb, 99), 2)
+        summary[endpoint] = result
+    return summary
+
+
+def timeline(recorder):
+    """每秒完成的整轮对话数和请求错误数，用于观察爬坡过程中延迟开始恶化的位置"""
+    seconds = defaultdict(lambda: {'turns': 0, 'requests': 0, 'errors': 0, 'turn_latencies': []})
+    for endpoint, start, latency_ms, ok, _, _ in recorder.samples:
+        bucket = seconds[int(start + latency_ms / 1000)]
+        if endpoint == 'student_turn':
+            bucket['turns'] += 1
+            bucket['turn_latencies'].append(latency_ms)
+        else:
+            bucket['requests'] += 1
+            bucket['errors'] += 0 if ok else 1
+    return [{'second': second, 'turns': bucket['turns'], 'requests': bucket['requests'], 'errors': bucket['errors'],
+             'turn_p95_ms': round(percentile(bucket['turn_latencies'], 95), 2) if bucket['turn_latencies'] else None}
+            for second, bucket in sorted(seconds.items())]
+
+
+def wait_until_ready(base_url, timeout):
+    """轮询 /api/ready，返回服务的运行模式（production / demo）"""
+    parsed = urllib.parse.urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=5)
+            conn.request('GET', '/api/ready')
+            response = conn.getresponse()
+            body = json.loads(response.read() or b'{}')
+            conn.close()
+            if response.status == 200:
+                return body.get('mode')
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{base_url} was not ready after {timeout}s")
+
+
+def spawn_server(args, work_dir):
+    """启动 LLM 桩服务和 web/app.py，返回 (桩服务, 子进程)"""
+    stub, llm_base_url = start_stub_server(first_token_ms=args.first_token_ms, token_ms=args.token_ms)
+    env = dict(os.environ, LLM_BASE_URL=llm_base_url, LLM_API_KEY='stub', EDUAGENT_PORT=str(args.port),
+               EDUAGENT_DEBUG='0', EDUAGENT_CONVERSATION_DB=os.path.join(work_dir, 'conversations.db'))
+    log = open(os.path.join(work_dir, 'server.log'), 'w')
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'web', 'app.py')], cwd=os.path.join(ROOT, 'web'),
+                               env=env, stdout=log, stderr=subprocess.STDOUT)
+    args.url = f"http://127.0.0.1:{args.port}"
+    return stub, process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the EduAgent web service")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='base URL of a running server')
+    parser.add_argument('--spawn', action='store_true', help='start web/app.py against a local LLM stub')
+    parser.add_argument('--port', type=int, default=5055, help='port for the spawned server')
+    parser.add_argument('--ready-timeout', type=float, default=600, help='seconds to wait for /api/ready')
+    parser.add_argument('--mode', choices=['closed', 'open'], default='closed')
+    parser.add_argument('--concurrency', type=int, default=8, help='virtual students in closed-loop mode')
+    parser.add_argument('--rate', type=float, default=5.0, help='student turns per second in open-loop mode')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='open-loop turns in flight before dropping')
+    parser.add_argument('--ramp', type=float, default=10.0, help='seconds to ramp up users or arrival rate')
+    parser.add_argument('--duration', type=float, default=60.0, help='total run time in seconds, including ramp')
+    parser.add_argument('--warmup', type=float, default=None,
+                        help='seconds excluded from the summary (defaults to the ramp)')
+    parser.add_argument('--think-ms', type=float, default=1000.0, help='mean think time between closed-loop turns')
+    parser.add_argument('--stream-ratio', type=float, default=0.8, help='share of questions sent to /api/ask/stream')
+    parser.add_argument('--list-ratio', type=float, default=0.3, help='share of turns that list conversations')
+    parser.add_argument('--load-ratio', type=float, default=0.1, help='share of turns that load the conversation')
+    parser.add_argument('--turns-per-conversation', type=int, default=5)
+    parser.add_argument('--questions', default=DEFAULT_QUESTIONS_FILE, help='JSON file of questions by type')
+    parser.add_argument('--timeout', type=float, default=120.0, help='per-request timeout in seconds')
+    parser.add_argument('--first-token-ms', type=float, default=300.0, help='LLM stub delay before the first token')
+    parser.add_argument('--token-ms', type=float, default=20.0, help='LLM stub delay between streamed tokens')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    scenario = Scenario(args, load_questions(args.questions))
+    warmup = args.ramp if args.warmup is None else args.warmup
+    stub = process = None
+    with tempfile.TemporaryDirectory() as work_dir:
+        try:
+            if args.spawn:
+                stub, process = spawn_server(args, work_dir)
+            server_mode = wait_until_ready(args.url, args.ready_timeout)
+            print(f"{args.url} ready ({server_mode}), running {args.mode}-loop load for {args.duration:.0f}s")
+
+            started_at = time.perf_counter()
+            recorder = Recorder(started_at)
+            end_time = started_at + args.duration
+            if args.mode == 'closed':
+                run_closed_loop(args, scenario, recorder, end_time)
+            else:
+                run_open_loop(args, scenario, recorder, end_time)
+            elapsed = time.perf_counter() - started_at
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+            if stub is not None:
+                stub.shutdown()
+
+    summary = summarize(recorder, warmup, max(1e-9, elapsed - warmup))
+    for endpoint, result in summary.items():
+        print(f"{endpoint:>38} n={result['requests']:<6} {result['throughput_rps']:>7.2f}/s "
+              f"p50={result['p50_ms']:>9.1f}ms p95={result['p95_ms']:>9.1f}ms p99={result['p99_ms']:>9.1f}ms "
+              f"errors={result['error_rate']:.2%}")
+    if recorder.dropped:
+        print(f"dropped arrivals: {recorder.dropped}")
+
+    if args.output:
+        report = {
+            'metadata': {
+                'url': args.url,
+                'server_mode': server_mode,
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'config': vars(args),
+            },
+            'elapsed_seconds': round(elapsed, 2),
+            'dropped': recorder.dropped,
+            'endpoints': summary,
+            'timeline': timeline(recorder),
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+基准测试用的本地替身：不依赖模型下载和网络，接口与管线中使用的模型一致
+
+- HashingEmbedder：字符二元组哈希向量，接口同 SentenceTransformer.encode
+- OverlapCrossEncoder：按查询与文本的字符二元组重合度打分，接口同 CrossEncoder.predict
+- make_corpus：生成与 data/doc.md 结构相同的合成知识库
+
+替身只用于测量模型以外各环节的开销，结果中不包含真实模型的推理时间。
+"""
+import os
+import random
+import zlib
+
+import numpy as np
+
+
+def _bigrams(text):
+    return [text[i:i + 2] for i in range(len(text) - 1)] or [text]
+
+
+class HashingEmbedder:
+
+    def __init__(self, dim=768, max_seq_length=512):
+
+        self.dim = dim
+        self.max_seq_length = max_seq_length
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, **kwargs):
+
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for gram in _bigrams(text[:self.max_seq_length]):
+                embeddings[row, zlib.crc32(gram.encode('utf-8')) % self.dim] += 1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.maximum(norms, 1e-12)
+        return embeddings[0] if single else embeddings
+
+
+class OverlapCrossEncoder:
+
+    def predict(self, sentences, batch_size=32, **kwargs):
+
+        scores = []
+        for query, text in sentences:
+            query_grams = set(_bigrams(query))
+            text_grams = set(_bigrams(text))
+            scores.append(len(query_grams & text_grams) / max(1, len(query_grams)))
+        return np.array(scores, dtype=np.float32)
+
+
+TOPICS = ["摩擦力", "弹力", "重力", "压强", "浮力", "杠杆", "滑轮", "功率", "机械能", "电流",
+          "电压", "电阻", "磁场", "光的折射", "凸透镜", "比热容", "内能", "声音", "密度", "惯性"]
+ASPECTS = ["基本定义", "单位", "产生条件", "方向判断", "大小计算", "典型案例", "实验探究", "常见误区"]
+FILLER = ("学生在分析受力时需要明确研究对象，先判断物体的运动状态，再根据平衡条件列出方程。"
+          "实验中应控制变量，每次只改变一个因素，多次测量取平均值以减小误差。"
+          "教师可以先让学生预测结果，再通过演示实验验证，引导学生发现预测与现象之间的差异。")
+
+
+def make_corpus(path, n_modules, seed=0):
+    """
+    生成合成知识库：n_modules 个教学模块，每个模块包含标题、【知识点】、【易错点】、【启发式教学建议】
+
+    Returns:
+        list: 每个模块的标题，可用作基准查询
+    """
+    rng = random.Random(seed)
+    titles = []
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(n_modules):
+            topic = TOPICS[i % len(TOPICS)]
+            aspect = ASPECTS[(i // len(TOPICS)) % len(ASPECTS)]
+            title = f"{topic}的{aspect}（{i + 1}）"
+            titles.append(title)
+            level = '#' if i % 4 == 0 else '##'
+            f.write(f"{level} {i + 1}. {title}\n")
+            for section in ("知识点", "易错点", "启发式教学建议"):
+                start = rng.randrange(len(FILLER) // 2)
+                body = FILLER[start:] + FILLER[:start]
+                f.write(f"【{section}】关于{topic}的{aspect}：{body}\n\n")
+    return titles
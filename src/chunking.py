@@ -1,7 +1,67 @@
-from typing import List
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import bisect
+import glob
+import os
 import re
 
-def split_into_chunks(doc_file: str, use_semantic: bool = True, chunk_size: int = 500, overlap: int = 100) -> List[str]:
+# 匹配标题的正则表达式 (# ## ### 等)
+TITLE_PATTERN = re.compile(r'^(#+)\s+(.+)$')
+
+# 字符数分块时可作为分割点的标点
+PUNCTUATION = ['。', '！', '？', '.', '!', '?', '\n', '；', ';']
+
+# 教学模块中的结构化小节，及其在元数据中的字段名
+SECTION_KEYS = {'知识点': 'knowledge', '易错点': 'misconceptions', '启发式教学建议': 'teaching_tips'}
+SECTION_PATTERN = re.compile(r'【(' + '|'.join(SECTION_KEYS) + r')】')
+
+# 句子切分：中文句末标点，或后接空白/行尾的英文句末标点（避免切开 0.3 这样的小数）
+SENTENCE_PATTERN = re.compile(r'.*?(?:[。！？；;]|[.!?](?=\s|$))+|.+$')
+
+
+class Chunk(NamedTuple):
+    """流式分块产出的文本块及其来源信息"""
+    text: str
+    source: str
+    heading_path: Tuple[str, ...]
+    start_byte: int
+    end_byte: int
+
+    def metadata(self) -> Dict[str, Any]:
+        """转换为向量库可存储的元数据，包含解析出的【知识点】【易错点】【启发式教学建议】小节"""
+        metadata = {
+            'source': self.source,
+            'heading_path': ' > '.join(self.heading_path),
+            'start_byte': self.start_byte,
+            'end_byte': self.end_byte
+        }
+        for name, content in parse_sections(self.text).items():
+            if name in SECTION_KEYS:
+                metadata[SECTION_KEYS[name]] = content
+        return metadata
+
+def parse_sections(text: str) -> Dict[str, str]:
+    """
+    解析教学模块中的【知识点】【易错点】【启发式教学建议】小节
+    
+    Returns:
+        Dict[str, str]: 小节名 -> 内容；第一个小节之前的文本（通常是标题）保存在 'heading' 中。
+        没有任何小节标记时返回空字典
+    """
+    parts = SECTION_PATTERN.split(text)
+    if len(parts) == 1:
+        return {}
+    sections = {}
+    if parts[0].strip():
+        sections['heading'] = parts[0].strip()
+    # split 的结果为 [前缀, 小节名, 内容, 小节名, 内容, ...]
+    for name, content in zip(parts[1::2], parts[2::2]):
+        content = content.strip()
+        if content:
+            sections[name] = f"{sections[name]}\n{content}" if name in sections else content
+    return sections
+
+def split_into_chunks(doc_file: str, use_semantic: bool = True, chunk_size: int = 500, overlap: int = 100,
+                      tokenizer=None, max_tokens: Optional[int] = None, overlap_sentences: int = 1) -> List[str]:
     """
     文档分块的统一入口
     
@@ -10,12 +70,17 @@ def split_into_chunks(doc_file: str, use_semantic: bool = True, chunk_size: int
         use_semantic: 是否使用语义分块（按标题），默认True
         chunk_size: 字符数分块时的大小（仅在use_semantic=False时使用）
         overlap: 字符数分块时的重叠（仅在use_semantic=False时使用）
+        tokenizer: 向量模型的分词器；use_semantic=False 时提供则按token数分块
+        max_tokens: 按token数分块时每块的token上限
+        overlap_sentences: 按token数分块时相邻块重叠的句子数
     
     Returns:
         List[str]: 分割后的文本块列表
     """
     if use_semantic:
         return split_into_chunks_by_title(doc_file)
+    elif tokenizer is not None:
+        return split_into_chunks_by_tokens(doc_file, tokenizer, max_tokens, overlap_sentences)
     else:
         return split_into_chunks_by_chars(doc_file, chunk_size, overlap)
 
@@ -30,103 +95,331 @@ def split_into_chunks_by_title(file_path: str) -> List[str]:
     Returns:
         List[str]: 分割后的文本块列表，每个块包含完整的教学模块
     """
+    return [chunk.text for chunk in iter_chunks_by_title(file_path)]
+
+def split_into_chunks_by_chars(file_path: str, chunk_size: int = 500, overlap: int = 100) -> List[str]:
+    """
+    基于字符数的传统分块方法（备用方案）
+    """
+    return [chunk.text for chunk in iter_chunks_by_chars(file_path, chunk_size, overlap)]
+
+def split_into_chunks_by_tokens(file_path: str, tokenizer, max_tokens: Optional[int] = None,
+                                overlap_sentences: int = 1) -> List[str]:
+    """
+    按向量模型token数的句子级分块
+    """
+    return [chunk.text for chunk in iter_chunks_by_tokens(file_path, tokenizer, max_tokens, overlap_sentences)]
+
+def iter_document_files(source: str, pattern: str = "*.md") -> Iterator[str]:
+    """
+    展开文档来源：单个文件、目录（递归匹配 pattern）或通配符表达式
+    
+    Args:
+        source: 文件路径、目录路径或 glob 表达式
+        pattern: source 为目录时匹配的文件名模式
+    
+    Yields:
+        str: 按路径排序的文档文件路径
+    """
+    if os.path.isfile(source):
+        yield source
+    elif os.path.isdir(source):
+        yield from sorted(glob.glob(os.path.join(source, '**', pattern), recursive=True))
+    else:
+        matches = sorted(path for path in glob.glob(source, recursive=True) if os.path.isfile(path))
+        if not matches:
+            print(f"文件未找到: {source}")
+        yield from matches
+
+def iter_chunks(source: str, use_semantic: bool = True, chunk_size: int = 500, overlap: int = 100,
+                tokenizer=None, max_tokens: Optional[int] = None, overlap_sentences: int = 1) -> Iterator[Chunk]:
+    """
+    流式分块的统一入口，逐行读取文档并惰性产出文本块
+    
+    Args:
+        source: 文件路径、目录路径或 glob 表达式
+        use_semantic: 是否使用语义分块（按标题），默认True
+        chunk_size: 字符数分块时的大小（仅在use_semantic=False时使用）
+        overlap: 字符数分块时的重叠（仅在use_semantic=False时使用）
+        tokenizer: 向量模型的分词器；use_semantic=False 时提供则按token数分块
+        max_tokens: 按token数分块时每块的token上限
+        overlap_sentences: 按token数分块时相邻块重叠的句子数
+    
+    Yields:
+        Chunk: 文本块及其来源文件、标题路径和字节偏移
+    """
+    for file_path in iter_document_files(source):
+        if use_semantic:
+            yield from iter_chunks_by_title(file_path)
+        elif tokenizer is not None:
+            yield from iter_chunks_by_tokens(file_path, tokenizer, max_tokens, overlap_sentences)
+        else:
+            yield from iter_chunks_by_chars(file_path, chunk_size, overlap)
+
+def _iter_lines(file_path: str) -> Iterator[Tuple[str, int, int]]:
+    """逐行读取文件，产出 (行文本, 起始字节, 结束字节)，读取失败时打印错误并停止"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
+        with open(file_path, 'rb') as file:
+            offset = 0
+            for raw_line in file:
+                line = raw_line.decode('utf-8')
+                yield line, offset, offset + len(raw_line.rstrip(b'\r\n'))
+                offset += len(raw_line)
     except FileNotFoundError:
         print(f"文件未找到: {file_path}")
-        return []
     except Exception as e:
         print(f"读取文件时出错: {e}")
-        return []
-    
-    # 按行分割内容
-    lines = content.split('\n')
-    
-    chunks = []
-    current_chunk = []
+
+def iter_chunks_by_title(file_path: str) -> Iterator[Chunk]:
+    """基于标题的流式语义分块，每遇到一个标题行就产出前一个教学模块"""
+    heading_stack: List[Tuple[int, str]] = []
+    current_chunk: List[str] = []
+    chunk_path: Tuple[str, ...] = ()
+    start_byte = end_byte = 0
     
-    # 匹配标题的正则表达式 (# ## ### 等)
-    title_pattern = re.compile(r'^#+\s+(.+)$')
+    def make_chunk():
+        chunk_text = '\n'.join(current_chunk).strip()
+        if chunk_text:
+            return Chunk(chunk_text, file_path, chunk_path, start_byte, end_byte)
+        return None
     
-    for line in lines:
-        line = line.strip()
+    for raw_line, line_start, line_end in _iter_lines(file_path):
+        line = raw_line.strip()
+        title_match = TITLE_PATTERN.match(line)
         
         # 检查是否是标题行
-        if title_pattern.match(line):
-            # 如果当前chunk不为空，保存它
+        if title_match:
+            # 如果当前chunk不为空，产出它
             if current_chunk:
-                chunk_text = '\n'.join(current_chunk).strip()
-                if chunk_text:
-                    chunks.append(chunk_text)
+                chunk = make_chunk()
+                if chunk:
+                    yield chunk
                 current_chunk = []
             
+            # 维护标题层级路径
+            level = len(title_match.group(1))
+            while heading_stack and heading_stack[-1][0] >= level:
+                heading_stack.pop()
+            heading_stack.append((level, title_match.group(2).strip()))
+            chunk_path = tuple(title for _, title in heading_stack)
+            
             # 开始新的chunk
             current_chunk.append(line)
+            start_byte = line_start
+            end_byte = line_end
         else:
             # 添加到当前chunk
             if line:  # 只添加非空行
+                if not current_chunk:
+                    start_byte = line_start
                 current_chunk.append(line)
+                end_byte = line_end
             elif current_chunk and current_chunk[-1]:  # 保留段落间的空行
                 current_chunk.append('')
     
-    # 添加最后一个chunk
+    # 产出最后一个chunk
     if current_chunk:
-        chunk_text = '\n'.join(current_chunk).strip()
-        if chunk_text:
-            chunks.append(chunk_text)
-    
-    return chunks
+        chunk = make_chunk()
+        if chunk:
+            yield chunk
 
-def split_into_chunks_by_chars(file_path: str, chunk_size: int = 500, overlap: int = 100) -> List[str]:
+def iter_chunks_by_chars(file_path: str, chunk_size: int = 500, overlap: int = 100) -> Iterator[Chunk]:
     """
-    基于字符数的传统分块方法（备用方案）
+    基于字符数的流式分块：逐行读入并合并空白，缓冲区足够长时切出一个块，
+    只在内存中保留尚未切分的尾部文本
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-    except FileNotFoundError:
-        print(f"文件未找到: {file_path}")
-        return []
-    except Exception as e:
-        print(f"读取文件时出错: {e}")
-        return []
-    
-    # 移除多余的空白字符
-    content = ' '.join(content.split())
+    buffer = ''
+    # 缓冲区中每行文本的起始位置，以及该行在文件中的字节范围
+    anchor_positions: List[int] = []
+    anchor_bytes: List[Tuple[int, int]] = []
     
-    chunks = []
-    start = 0
+    def byte_range(start: int, end: int) -> Tuple[int, int]:
+        first = max(bisect.bisect_right(anchor_positions, start) - 1, 0)
+        last = max(bisect.bisect_left(anchor_positions, end) - 1, first)
+        return anchor_bytes[first][0], anchor_bytes[last][1]
     
-    while start < len(content):
-        # 计算当前块的结束位置
-        end = start + chunk_size
-        
-        # 如果不是最后一块，尝试在合适位置分割
-        if end < len(content):
-            # 寻找最近的句子结束符或标点符号
-            punctuation = ['。', '！', '？', '.', '!', '?', '\n', '；', ';']
-            best_split = end
+    def cut(final: bool) -> Iterator[Chunk]:
+        nonlocal buffer, anchor_positions, anchor_bytes
+        # 非最后阶段时，需保证缓冲区比当前块更长，切分结果才与整篇处理一致
+        while buffer and (final or len(buffer) > chunk_size):
+            # 计算当前块的结束位置
+            end = chunk_size
             
-            # 在chunk_size的前100个字符内寻找合适的分割点
-            search_start = max(start + chunk_size - 100, start + chunk_size // 2)
-            for i in range(end, search_start - 1, -1):
-                if i < len(content) and content[i] in punctuation:
-                    best_split = i + 1
-                    break
+            # 如果不是最后一块，尝试在合适位置分割
+            if end < len(buffer):
+                # 在chunk_size的前100个字符内寻找最近的句子结束符或标点符号
+                best_split = end
+                search_start = max(chunk_size - 100, chunk_size // 2)
+                for i in range(end, search_start - 1, -1):
+                    if buffer[i] in PUNCTUATION:
+                        best_split = i + 1
+                        break
+                end = best_split
             
-            end = best_split
-        
-        # 提取当前块
-        chunk = content[start:end].strip()
-        if chunk:  # 只添加非空块
-            chunks.append(chunk)
-        
-        # 计算下一块的开始位置（考虑重叠）
-        start = end - overlap
-        
-        # 避免无限循环
-        if start >= end:
-            start = end
+            # 提取当前块
+            chunk = buffer[:end].strip()
+            if chunk:  # 只添加非空块
+                yield Chunk(chunk, file_path, (), *byte_range(0, end))
+            
+            # 计算下一块的开始位置（考虑重叠），并丢弃已处理的文本
+            drop = max(end - overlap, 1)
+            buffer = buffer[drop:]
+            keep = max(bisect.bisect_right(anchor_positions, drop) - 1, 0)
+            anchor_positions = [position - drop for position in anchor_positions[keep:]]
+            anchor_bytes = anchor_bytes[keep:]
     
-    return chunks
+    first_line = True
+    for raw_line, line_start, line_end in _iter_lines(file_path):
+        # 移除多余的空白字符，行与行之间以单个空格连接
+        line = ' '.join(raw_line.split())
+        if not line:
+            continue
+        if not first_line:
+            buffer += ' '
+        first_line = False
+        anchor_positions.append(len(buffer))
+        anchor_bytes.append((line_start, line_end))
+        buffer += line
+        yield from cut(final=False)
+    
+    yield from cut(final=True)
+
+def _iter_sentences(file_path: str) -> Iterator[Tuple[str, int, int, bool, Optional[re.Match], str]]:
+    """
+    一次遍历切分句子，产出 (句子, 起始字节, 结束字节, 前面是否有空白或换行, 标题匹配结果, 原文)，
+    标题行（如 "# 1. 摩擦力的基本定义" 会被切成两句）中的每个句子都带有该行同一个标题匹配结果
+    """
+    for raw_line, line_start, _ in _iter_lines(file_path):
+        line = raw_line.rstrip('\r\n')
+        offset = line_start
+        first = True
+        title_match = TITLE_PATTERN.match(line.strip())
+        for match in SENTENCE_PATTERN.finditer(line):
+            piece = match.group()
+            piece_bytes = len(piece.encode('utf-8'))
+            sentence = ' '.join(piece.split())
+            if sentence:
+                yield sentence, offset, offset + piece_bytes, first or piece[0].isspace(), title_match, piece
+                first = False
+            offset += piece_bytes
+
+def _split_long_sentence(sentence: str, tokenizer, max_tokens: int,
+                         first_max_tokens: Optional[int] = None) -> Iterator[Tuple[str, int]]:
+    """将超过token上限的句子按字符切成多段，产出 (片段, token数)；first_max_tokens 为第一段的上限"""
+    limit = first_max_tokens or max_tokens
+    while sentence:
+        size = min(len(sentence), limit)
+        num_tokens = len(tokenizer.tokenize(sentence[:size]))
+        while num_tokens > limit and size > 1:
+            size = max(1, size * limit // num_tokens - 1)
+            num_tokens = len(tokenizer.tokenize(sentence[:size]))
+        yield sentence[:size].rstrip(), num_tokens
+        sentence = sentence[size:].lstrip()
+        limit = max_tokens
+
+def _piece_byte_ranges(raw: str, start_byte: int, pieces: List[str]) -> Iterator[Tuple[int, int]]:
+    """把合并空白后的句子片段依次对应回原文，产出每段的 (起始字节, 结束字节)"""
+    position = 0
+    offset = start_byte
+    for piece in pieces:
+        # 跳过片段之间的空白，再数出与片段相同个数的非空白字符
+        while position < len(raw) and raw[position].isspace():
+            offset += len(raw[position].encode('utf-8'))
+            position += 1
+        begin = offset
+        remaining = len(piece) - piece.count(' ')
+        while position < len(raw) and remaining:
+            if not raw[position].isspace():
+                remaining -= 1
+            offset += len(raw[position].encode('utf-8'))
+            position += 1
+        yield begin, offset
+
+def iter_chunks_by_tokens(file_path: str, tokenizer, max_tokens: Optional[int] = None,
+                          overlap_sentences: int = 1) -> Iterator[Chunk]:
+    """
+    按向量模型token数的流式分块
+
+    一次遍历切出句子并逐句计算token数，把完整句子装入不超过 max_tokens 的块，
+    相邻块之间重叠 overlap_sentences 个完整句子，避免块尾被向量模型截断。
+    块尾的标题行不留在上一块，而是带到下一块开头，与其后的正文放在一起。
+
+    Args:
+        file_path: 文档文件路径
+        tokenizer: 向量模型的分词器（如 SentenceTransformer.tokenizer）
+        max_tokens: 每块的token上限，默认取分词器的最大长度减去特殊token
+        overlap_sentences: 相邻块重叠的句子数
+
+    Yields:
+        Chunk: 文本块及其来源文件、标题路径和字节偏移
+    """
+    if max_tokens is None:
+        max_tokens = min(getattr(tokenizer, 'model_max_length', 512), 512) - 2
+
+    heading_stack: List[Tuple[int, str]] = []
+    # 当前块中的句子：(文本, token数, 起始字节, 结束字节, 前面是否有空白或换行, 是否为标题行)
+    window: List[Tuple[str, int, int, int, bool, bool]] = []
+    window_tokens = 0
+    chunk_path: Tuple[str, ...] = ()
+    has_new = False
+    current_title: Optional[re.Match] = None
+
+    def make_chunk(items) -> Chunk:
+        parts = []
+        for i, (text, _, _, _, space_before, _) in enumerate(items):
+            if i and space_before:
+                parts.append(' ')
+            parts.append(text)
+        return Chunk(''.join(parts), file_path, chunk_path, items[0][2], items[-1][3])
+
+    def trailing_titles() -> int:
+        count = 0
+        while count < len(window) and window[len(window) - count - 1][5]:
+            count += 1
+        return count
+
+    for sentence, start_byte, end_byte, space_before, title_match, raw in _iter_sentences(file_path):
+        if title_match and title_match is not current_title:
+            current_title = title_match
+            level = len(title_match.group(1))
+            while heading_stack and heading_stack[-1][0] >= level:
+                heading_stack.pop()
+            heading_stack.append((level, title_match.group(2).strip()))
+
+        # 块尾的标题行会带到下一块，长句的第一段要给它留出位置
+        carry_tokens = sum(item[1] for item in window[len(window) - trailing_titles():])
+        first_limit = max_tokens - carry_tokens if 0 < carry_tokens < max_tokens else max_tokens
+        num_tokens = len(tokenizer.tokenize(sentence))
+        if num_tokens > first_limit:
+            texts, counts = zip(*_split_long_sentence(sentence, tokenizer, max_tokens, first_limit))
+            pieces = list(zip(texts, counts, _piece_byte_ranges(raw, start_byte, texts)))
+        else:
+            pieces = [(sentence, num_tokens, (start_byte, end_byte))]
+
+        for i, (piece, piece_tokens, (piece_start, piece_end)) in enumerate(pieces):
+            if window and window_tokens + piece_tokens > max_tokens:
+                carry = trailing_titles()
+                if carry < len(window) and has_new:
+                    yield make_chunk(window[:len(window) - carry])
+                if carry:
+                    # 标题行与其后的正文一起开始新块，不与上一节的句子重叠
+                    window = window[len(window) - carry:]
+                    chunk_path = tuple(title for _, title in heading_stack)
+                else:
+                    # 以完整句子作为重叠
+                    window = window[len(window) - overlap_sentences:] if overlap_sentences > 0 else []
+                has_new = bool(carry)
+                window_tokens = sum(item[1] for item in window)
+                # 保证保留部分加上新句子不超过上限
+                while window and window_tokens + piece_tokens > max_tokens:
+                    window_tokens -= window.pop(0)[1]
+            if not window:
+                chunk_path = tuple(title for _, title in heading_stack)
+            window.append((piece, piece_tokens, piece_start, piece_end, space_before or i > 0,
+                           title_match is not None))
+            window_tokens += piece_tokens
+            has_new = True
+
+    # 最后一块只剩重叠句子时不再产出
+    if window and has_new:
+        yield make_chunk(window)
@@ -1,55 +1,203 @@
-from typing import List, Literal
+from typing import Callable, Dict, Iterator, List, Literal, Optional
 import os
-from dotenv import load_dotenv
-from openai import OpenAI
+import threading
+import re
+from chunking import parse_sections
+from llm_client import LLMClient, get_llm_client, prompt_cache_usage
+from metrics import record_token_usage
 from query_classifier import QueryClassifier
 
+# 每类问题在用户消息末尾的引导语
+CLOSING_LINES = {
+    "concept": "请以老师的身份对该学生进行回应：",
+    "calculation": "请以老师的身份对该学生开始计算指导：",
+    "experiment": "请以老师的身份对该学生开始实验指导：",
+    "other": "请以老师的身份对该学生友善地回应并引导：",
+}
+
+# 每类问题从最相关的片段中选用的小节，与各自的教学指令对应；其余片段只补充【知识点】
+# 概念题的指令同时用到误区诊断、定义和引导方式，保留全部小节（这类问题的 prompt 不因小节选取而缩短）；计算题需要公式和常见错误；实验题侧重误解诊断和引导方式
+SECTIONS_BY_TYPE = {
+    "concept": ("知识点", "易错点", "启发式教学建议"),
+    "calculation": ("知识点", "易错点"),
+    "experiment": ("易错点", "启发式教学建议"),
+}
+SUPPORTING_SECTIONS = ("知识点",)
+
+# 去重时按句切分小节内容
+_SECTION_SENTENCE_PATTERN = re.compile(r'.*?(?:[。！？；]|$)', re.S)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文字符约 0.6 个token，其他字符约 0.3 个token（DeepSeek 分词器的经验值）"""
+    cjk = sum(1 for char in text if '\u4e00' <= char <= '\u9fff')
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
 
 class ResponseGenerator:
+    """
+    回答生成器
+
+    每类问题的教学指令固定不变，作为 system 消息放在最前面，构成逐字节稳定的前缀，
+    可被服务端的上下文缓存复用；每次变化的参考片段和学生提问放在最后的 user 消息中。
+    """
     
-    def __init__(self, model_name: str = "deepseek-chat"):
-        load_dotenv()
-        api_key = os.getenv("DEEPSEEK_API_KEY")
-        if not api_key:
-            raise ValueError("DEEPSEEK_API_KEY not found in environment variables")
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com"
-        )
+    def __init__(self, model_name: str = "deepseek-chat", classifier: Optional[QueryClassifier] = None,
+                 llm_client: Optional[LLMClient] = None, timeout: Optional[float] = None,
+                 max_context_tokens: Optional[int] = None, token_counter: Callable[[str], int] = estimate_tokens):
+        """
+        Args:
+            model_name: LLM模型名
+            classifier: 查询分类器，默认新建
+            llm_client: LLM 客户端，默认使用进程内共享的客户端
+            timeout: 生成调用的截止时间（秒），默认使用客户端的设置
+            max_context_tokens: 参考片段的token预算，超出时截断或丢弃排在后面的片段；
+                默认读取环境变量 EDUAGENT_MAX_CONTEXT_TOKENS（默认 2000）
+            token_counter: token计数函数
+        """
+        # 默认与查询分类器共用同一个 LLM 客户端（连接池、超时与重试策略）
+        self.llm = llm_client or get_llm_client()
         self.model_name = model_name
-        self.classifier = QueryClassifier(model_name)
+        self.timeout = timeout
+        self.classifier = classifier or QueryClassifier(model_name, llm_client=self.llm)
+        self.max_context_tokens = max_context_tokens or int(os.getenv("EDUAGENT_MAX_CONTEXT_TOKENS", "2000"))
+        self.token_counter = token_counter
+        self.instructions = {
+            "concept": self._get_concept_instructions(),
+            "calculation": self._get_calculation_instructions(),
+            "experiment": self._get_experiment_instructions(),
+            "other": self._get_other_instructions(),
+        }
+        self._usage_lock = threading.Lock()
+        self._usage_totals = {'calls': 0, 'prompt_tokens': 0, 'cached_prompt_tokens': 0,
+                              'uncached_prompt_tokens': 0, 'completion_tokens': 0}
     
-    def generate(self, query: str, chunks: List[str]) -> str:
+    def generate(self, query: str, chunks: List[str], query_type: Optional[str] = None,
+                 usage: Optional[Dict[str, int]] = None) -> str:
+        """
+        生成回答
 
-        # 1. 首先对查询进行分类
-        query_type = self.classifier.classify(query)
+        Args:
+            usage: 传入字典时填入本次调用的token用量（含命中上下文缓存的prompt token数）
+        """
+        messages = self._build_messages(query, chunks, query_type)
+        response = self.llm.chat(messages, model=self.model_name, timeout=self.timeout, latency_group="generate")
+        self._record_usage(prompt_cache_usage(response.usage), usage)
+        
+        return response.choices[0].message.content
+    
+    def generate_stream(self, query: str, chunks: List[str], query_type: Optional[str] = None,
+                        usage: Optional[Dict[str, int]] = None) -> Iterator[str]:
+        """
+        流式生成回答，逐段返回模型输出的文本
+        
+        Args:
+            query: 学生提问
+            chunks: 重排后的参考文本块
+            query_type: 已知的查询类型，为None时在此处分类
+            usage: 传入字典时，在流结束后填入本次调用的token用量
         
-        # 2. 根据分类选择对应的prompt
-        chunks_text = "\n\n".join(chunks)
+        Yields:
+            str: 模型新生成的文本片段
+        """
+        messages = self._build_messages(query, chunks, query_type)
+        raw_usage = {}
+        yield from self.llm.chat_stream(messages, model=self.model_name, timeout=self.timeout, usage=raw_usage)
+        self._record_usage(raw_usage, usage)
+    
+    def usage_stats(self) -> Dict[str, float]:
+        """累计的token用量与prompt缓存命中率"""
+        with self._usage_lock:
+            stats = dict(self._usage_totals)
+        prompt_tokens = stats['cached_prompt_tokens'] + stats['uncached_prompt_tokens']
+        stats['prompt_cache_hit_rate'] = round(stats['cached_prompt_tokens'] / prompt_tokens, 4) if prompt_tokens else 0.0
+        return stats
+    
+    def _record_usage(self, call_usage: Dict[str, int], usage: Optional[Dict[str, int]]) -> None:
+
+        if not call_usage:
+            return
+        if usage is not None:
+            usage.update(call_usage)
+        record_token_usage(call_usage)
+        with self._usage_lock:
+            self._usage_totals['calls'] += 1
+            for key, value in call_usage.items():
+                self._usage_totals[key] += value
+    
+    def _build_messages(self, query: str, chunks: List[str], query_type: Optional[str] = None) -> List[Dict[str, str]]:
+
+        # 1. 首先对查询进行分类（调用方可能已并行完成分类）
+        if query_type is None:
+            query_type = self.classifier.classify(query)
+        if query_type not in self.instructions:
+            query_type = "other"
         
-        if query_type == "concept":
-            prompt = self._get_concept_prompt(query, chunks_text)
-        elif query_type == "calculation":
-            prompt = self._get_calculation_prompt(query, chunks_text)
-        elif query_type == "experiment":
-            prompt = self._get_experiment_prompt(query, chunks_text)
-        else:  # query_type == "other"
-            prompt = self._get_other_prompt(query, chunks_text)
+        # 2. 固定的教学指令在前（system），参考片段和提问在后（user）
+        if query_type == "other":
+            content = f"【学生提问】\n{query}\n\n{CLOSING_LINES[query_type]}"
+        else:
+            chunks_text = "\n\n".join(self._fit_chunks(self._assemble_context(chunks, query_type)))
+            content = f"【参考知识库】\n{chunks_text}\n\n【学生提问】\n{query}\n\n{CLOSING_LINES[query_type]}"
         
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant"},
-                {"role": "user", "content": prompt},
-            ],
-            stream=False
-        )
+        return [
+            {"role": "system", "content": self.instructions[query_type]},
+            {"role": "user", "content": content},
+        ]
+    
+    def _assemble_context(self, chunks: List[str], query_type: str) -> List[str]:
+        """
+        按问题类型从各片段中选取需要的小节，并去掉与前面片段重复的句子
         
-        return response.choices[0].message.content
+        最相关的片段保留该类问题需要的全部小节，其余片段只保留【知识点】；
+        没有小节标记的片段（如按字符数分块）整体保留。
+        """
+        seen = set()
+        blocks = []
+        for rank, chunk in enumerate(chunks):
+            sections = parse_sections(chunk)
+            if not sections:
+                key = re.sub(r'\s+', '', chunk)
+                if key not in seen:
+                    seen.add(key)
+                    blocks.append(chunk)
+                continue
+            
+            lines = [sections['heading']] if 'heading' in sections else []
+            for name in SECTIONS_BY_TYPE[query_type] if rank == 0 else SUPPORTING_SECTIONS:
+                if name not in sections:
+                    continue
+                sentences = []
+                for sentence in _SECTION_SENTENCE_PATTERN.findall(sections[name]):
+                    key = re.sub(r'\s+', '', sentence)
+                    if key and key not in seen:
+                        seen.add(key)
+                        sentences.append(sentence.strip())
+                if sentences:
+                    lines.append(f"【{name}】" + "".join(sentences))
+            if len(lines) > ('heading' in sections):
+                blocks.append("\n".join(lines))
+        return blocks
+    
+    def _fit_chunks(self, chunks: List[str]) -> List[str]:
+        """按重排顺序装入参考片段，超出token预算的片段截断，其后的片段丢弃"""
+        budget = self.max_context_tokens
+        fitted = []
+        for chunk in chunks:
+            tokens = self.token_counter(chunk)
+            if tokens <= budget:
+                fitted.append(chunk)
+                budget -= tokens
+                continue
+            # 剩余预算太少时不再截断，避免塞入没有意义的半句话；第一个片段总是保留
+            if budget >= 64 or not fitted:
+                fitted.append(chunk[:int(len(chunk) * budget / tokens)])
+            break
+        return fitted
     
-    def _get_concept_prompt(self, query: str, chunks_text: str) -> str:
+    def _get_concept_instructions(self) -> str:
         
-        prompt = f"""
+        return """
         ## 角色定位
         你是一位拥有15年教龄的中学物理高级教师，擅长通过"启发式教学"引导学生理解物理概念。你说话风格亲切、严谨、简练，善于发现学生思维中的底层误区。
 
@@ -67,21 +215,11 @@ class ResponseGenerator:
         2. **自然交互**：以老师的身份自然对话（利用换行符来模拟教学中的自然停顿），语言尽可能地简练和严谨。
         3. **因材施教**：根据【学生提问】的识别情况从差异化策略中选择合适的教学策略
         4. **纯净对话文本**：你的回复只能包含老师的“台词”，直接输出指导学生时的对话内容。严禁出现任何形如（停顿）、（引导）、（微笑）或其他描述动作、神态、心理的括号或文字。
-
-        ---
-        【参考知识库】
-        {chunks_text}
-
-        【学生提问】
-        {query}
-        ---
-        请以老师的身份对该学生进行回应：
         """
-        return prompt
 
-    def _get_calculation_prompt(self, query: str, chunks_text: str) -> str:
+    def _get_calculation_instructions(self) -> str:
 
-        prompt = f"""
+        return """
         ## 角色定位
         你是一位拥有15年教龄的中学物理高级教师，擅长通过"启发式教学"引导学生进行物理计算问题的分析。你注重培养学生的分析思维和解题方法。
 
@@ -91,7 +229,7 @@ class ResponseGenerator:
         ### 重要：智能识别与差异化回应
         1. **错误诊断**：仔细分析【学生提问】中的计算思路或题目理解，看是否存在【易错点】中的典型错误
         2. **差异化策略**：
-           - **如果发现计算错误或理解偏差**：通过情境引导和提问让学生自主发现问题，可以参考【启发式教学建议】中类似的方式进行引导。
+           - **如果发现计算错误或理解偏差**：不要直接给出正确做法，而是结合【易错点】中对应的错误成因，通过追问受力分析、公式选用或单位换算等关键步骤，让学生自主发现问题。
            - **如果是正常求助**：直接提供清晰的解题指导和步骤分析
 
         ### 回应要求
@@ -100,21 +238,11 @@ class ResponseGenerator:
         3. **过程清晰**：无论是纠错还是正常教学，计算过程都要步骤明确，逻辑清楚
         4. **培养思维**：注重培养学生求解分析的思维和方法，而不只是给答案
         5. **纯净对话文本**：你的回复只能包含老师的“台词”，直接输出指导学生时的对话内容。严禁出现任何形如（停顿）、（引导）、（微笑）或其他描述动作、神态、心理的括号或文字。
-
-        ---
-        【参考知识库】
-        {chunks_text}
-
-        【学生提问】
-        {query}
-        ---
-        请以老师的身份对该学生开始计算指导：
         """
-        return prompt
     
-    def _get_experiment_prompt(self, query: str, chunks_text: str) -> str:
+    def _get_experiment_instructions(self) -> str:
         """实验应用型prompt"""
-        prompt = f"""
+        return """
         ## 角色定位
         你是一位拥有15年教龄的中学物理高级教师，擅长通过"启发式教学"引导学生进行实验设计，善于将理论知识与实际应用结合，培养学生的实践能力和科学思维。
 
@@ -133,21 +261,11 @@ class ResponseGenerator:
         3. **实验可行性**：确保建议的实验方案在中学物理课条件下可行
         4. **安全意识**：适当提醒实验安全注意事项
         5. **纯净对话文本**：你的回复只能包含老师的“台词”，直接输出指导学生时的对话内容。严禁出现任何形如（停顿）、（引导）、（微笑）或其他描述动作、神态、心理的括号或文字。
-
-        ---
-        【参考知识库】
-        {chunks_text}
-
-        【学生提问】
-        {query}
-        ---
-        请以老师的身份对该学生开始实验指导：
         """
-        return prompt
     
-    def _get_other_prompt(self, query: str, chunks_text: str) -> str:
+    def _get_other_instructions(self) -> str:
 
-        prompt = f"""
+        return """
         ## 角色定位
         你是一位经验丰富的中学物理教师，但现在学生问的问题似乎超出了当前摩擦力课程的范围。
 
@@ -164,12 +282,4 @@ class ResponseGenerator:
         - 如果是其他物理知识：简要说明这属于物理的其他分支，鼓励课后深入学习
         - 如果是非物理问题：友好地说明当前是物理课堂时间
         - 总是以积极、鼓励的语气回应，不要让学生感到被拒绝
-
-        ---
-        【学生提问】
-        {query}
-
-        ---
-        请以老师的身份对该学生友善地回应并引导：
         """
-        return prompt
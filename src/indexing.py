@@ -1,34 +1,185 @@
-from typing import List
-import chromadb
-from sentence_transformers import SentenceTransformer
+from typing import Any, Dict, Iterable, List, Optional, Union
+import hashlib
+import time
+from lexical_index import BM25Index
+from vector_store import VectorStore, create_vector_store
+from chunking import Chunk
+from metrics import observe, timed_iter, timer
+
+
+def chunk_id(chunk: str, model_name: str) -> str:
+    """根据文本内容和向量模型名称生成稳定的chunk ID"""
+    return hashlib.sha256(f"{model_name}\n{chunk}".encode("utf-8")).hexdigest()
+
 
 class VectorIndexer:
     
-    def __init__(self, model_path: str = "shibing624/text2vec-base-chinese"):
+    def __init__(self, model_path: str = "shibing624/text2vec-base-chinese", persist_dir: Optional[str] = None,
+                 batch_size: int = 32, write_batch_size: int = 1000, show_progress: bool = False,
+                 lexical: bool = True, store: str = "chroma", store_options: Optional[Dict] = None,
+                 embedding_model=None, backend: str = "torch", backend_options: Optional[Dict] = None):
 
-        self.embedding_model = SentenceTransformer(model_path, cache_folder="d:/MyProject/EduAgent/models")
-        self.chromadb_client = chromadb.EphemeralClient()
-        self.collection = self.chromadb_client.get_or_create_collection(name="documents")
+        self.model_name = model_path
+        self.batch_size = batch_size
+        self.write_batch_size = write_batch_size
+        self.show_progress = show_progress
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Unknown inference backend: {backend}")
+        # 推理后端：torch（SentenceTransformer）或 onnx（ONNX Runtime int8，见 onnx_backend.py）
+        if embedding_model is None and backend == "onnx":
+            from onnx_backend import load_embedding_model
+            embedding_model = load_embedding_model(model_path, **(backend_options or {}))
+            # 量化模型的向量与原模型略有差异，chunk ID 中区分后端，切换后端时重新生成向量
+            self.model_name = f"{model_path}@onnx"
+        elif embedding_model is None:
+            from sentence_transformers import SentenceTransformer
+            embedding_model = SentenceTransformer(model_path, cache_folder="d:/MyProject/EduAgent/models")
+        # 可传入已加载的模型或接口兼容的替身（encode / max_seq_length），如基准测试中的本地模型
+        self.embedding_model = embedding_model
+        # 向量存储后端：chroma 或 numpy；指定 persist_dir 时使用持久化索引，重启后只需增量更新
+        self.store: VectorStore = create_vector_store(store, persist_dir, **(store_options or {}))
+        # 与向量索引同步构建的BM25倒排索引，供混合检索使用
+        self.lexical_index = BM25Index() if lexical else None
+    
+    @property
+    def max_chunk_tokens(self) -> int:
+        """向量模型单次可编码的token数（扣除 [CLS]/[SEP]），按token分块时用作块大小上限"""
+        return self.embedding_model.max_seq_length - 2
     
     def embed_chunk(self, chunk: str) -> List[float]:
 
         embedding = self.embedding_model.encode(chunk, normalize_embeddings=True)
         return embedding.tolist()
     
-    def embed_chunks(self, chunks: List[str]) -> List[List[float]]:
-
-        return [self.embed_chunk(chunk) for chunk in chunks]
+    def embed_chunks(self, chunks: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """
+        批量生成向量，按长度排序后分批编码以减少padding
+        
+        Args:
+            chunks: 文本块列表
+            batch_size: 每批编码的文本数，默认使用构造时的 batch_size
+        
+        Returns:
+            List[List[float]]: 与输入顺序一致的向量列表
+        """
+        batch_size = batch_size or self.batch_size
+        # 按长度降序排列，使同一批内的文本长度接近
+        order = sorted(range(len(chunks)), key=lambda i: len(chunks[i]), reverse=True)
+        embeddings: List[Optional[List[float]]] = [None] * len(chunks)
+        
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start:start + batch_size]
+            batch_embeddings = self.embedding_model.encode(
+                [chunks[i] for i in batch_indices],
+                batch_size=batch_size,
+                normalize_embeddings=True
+            )
+            for i, embedding in zip(batch_indices, batch_embeddings):
+                embeddings[i] = embedding.tolist()
+            
+            if self.show_progress:
+                done = min(start + batch_size, len(order))
+                print(f"向量化进度: {done}/{len(order)}")
+        
+        return embeddings
     
-    def save_embeddings(self, chunks: List[str], embeddings: List[List[float]]) -> None:
+    def save_embeddings(self, chunks: List[str], embeddings: List[List[float]], ids: Optional[List[str]] = None,
+                        metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
 
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            self.collection.add(
-                documents=[chunk],
-                embeddings=[embedding],
-                ids=[str(i)]
+        if ids is None:
+            ids = [chunk_id(chunk, self.model_name) for chunk in chunks]
+        for start in range(0, len(chunks), self.write_batch_size):
+            end = start + self.write_batch_size
+            self.store.add(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                documents=chunks[start:end],
+                metadatas=metadatas[start:end] if metadatas else None
             )
+            
+            if self.show_progress:
+                print(f"写入进度: {min(end, len(chunks))}/{len(chunks)}")
     
-    def build_index(self, chunks: List[str]) -> None:
-
-        embeddings = self.embed_chunks(chunks)
-        self.save_embeddings(chunks, embeddings)
+    def build_index(self, chunks: Iterable[Union[str, Chunk]]) -> Dict[str, int]:
+        """
+        增量构建索引：只为新增或修改过的chunk生成向量，并删除已不存在的chunk
+        
+        chunks 可以是文本列表，也可以是 iter_chunks 产出的 Chunk 流；
+        后者按 write_batch_size 分批向量化和写入，来源信息作为元数据保存。
+        
+        Args:
+            chunks: 当前文档的全部文本块
+        
+        Returns:
+            Dict[str, int]: 新增、删除、未变化的chunk数量
+        """
+        build_start = time.perf_counter()
+        existing_ids = set(self.store.get_ids())
+        seen_ids = set()
+        lexical_ids: List[str] = []
+        lexical_documents: List[str] = []
+        pending: List[tuple] = []
+        added = 0
+        
+        # 分块是惰性的，单独统计从分块器取出chunk所花的时间
+        for chunk in timed_iter(chunks, 'chunking'):
+            if isinstance(chunk, Chunk):
+                text, metadata = chunk.text, chunk.metadata()
+            else:
+                text, metadata = chunk, None
+            
+            # 以 内容哈希 + 模型名 作为ID，相同内容的chunk只保留一份
+            key = chunk_id(text, self.model_name)
+            if key in seen_ids:
+                continue
+            seen_ids.add(key)
+            
+            if self.lexical_index is not None:
+                lexical_ids.append(key)
+                lexical_documents.append(text)
+            
+            if key not in existing_ids:
+                pending.append((key, text, metadata))
+                if len(pending) >= self.write_batch_size:
+                    added += self._index_batch(pending)
+                    pending = []
+        
+        if pending:
+            added += self._index_batch(pending)
+        
+        stale_ids = [key for key in existing_ids if key not in seen_ids]
+        if stale_ids:
+            self.store.delete(stale_ids)
+        
+        if self.lexical_index is not None:
+            self.lexical_index.build(lexical_ids, lexical_documents)
+        self.store.persist()
+        observe('index_build', time.perf_counter() - build_start)
+        
+        return {
+            'added': added,
+            'deleted': len(stale_ids),
+            'unchanged': len(seen_ids) - added
+        }
+    
+    def load_index(self) -> int:
+        """
+        直接使用已持久化的索引（如 ingest.py 离线构建的），不重新分块，只重建内存中的BM25索引
+        
+        Returns:
+            int: 索引中的chunk数量
+        """
+        ids, documents = self.store.get_documents()
+        if self.lexical_index is not None:
+            self.lexical_index.build(ids, documents)
+        return len(ids)
+    
+    def _index_batch(self, batch: List[tuple]) -> int:
+        """为一批新chunk生成向量并写入向量库"""
+        ids = [key for key, _, _ in batch]
+        texts = [text for _, text, _ in batch]
+        metadatas = [metadata for _, _, metadata in batch]
+        with timer('embedding_batch'):
+            embeddings = self.embed_chunks(texts)
+        self.save_embeddings(texts, embeddings, ids, metadatas if any(metadatas) else None)
+        return len(batch)
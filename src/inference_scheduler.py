@@ -0,0 +1,118 @@
+from typing import Any, Callable, Dict, List, Optional
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+
+class InferenceScheduler:
+    """
+    跨请求的微批推理调度器
+
+    各请求线程提交的向量化、重排任务进入同一个队列，由专用推理线程在
+    max_wait_ms 时间窗口内合并成不超过 max_batch_size 的批次统一执行，
+    结果通过 Future 返回给各请求。
+    """
+
+    def __init__(self, max_batch_size: int = 32, max_wait_ms: float = 5.0, num_threads: Optional[int] = None):
+        """
+        Args:
+            max_batch_size: 单批最多合并的任务数
+            max_wait_ms: 收到第一个任务后最多等待多久以凑满一批（毫秒）
+            num_threads: 推理时 torch 使用的线程数，None 表示保持默认
+        """
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.num_threads = num_threads
+        self._handlers: Dict[str, Callable[[List[Any]], List[Any]]] = {}
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="inference-worker", daemon=True)
+        self._worker.start()
+
+    def register(self, kind: str, batch_fn: Callable[[List[Any]], List[Any]]) -> None:
+        """注册一类任务的批处理函数，batch_fn 接收输入列表并返回等长的结果列表"""
+        self._handlers[kind] = batch_fn
+
+    def register_embedding_model(self, embedding_model, kind: str = "embed") -> None:
+
+        def encode(texts: List[str]) -> List[List[float]]:
+            embeddings = embedding_model.encode(texts, batch_size=len(texts), normalize_embeddings=True)
+            return [embedding.tolist() for embedding in embeddings]
+
+        self.register(kind, encode)
+
+    def register_cross_encoder(self, cross_encoder, kind: str = "rerank") -> None:
+
+        def predict(pairs: List[tuple]) -> List[float]:
+            return [float(score) for score in cross_encoder.predict(pairs, batch_size=len(pairs))]
+
+        self.register(kind, predict)
+
+    def submit(self, kind: str, item: Any) -> Future:
+
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown inference task kind: {kind}")
+        future: Future = Future()
+        self._queue.put((kind, item, future))
+        return future
+
+    def submit_many(self, kind: str, items: List[Any]) -> List[Future]:
+
+        return [self.submit(kind, item) for item in items]
+
+    def shutdown(self) -> None:
+
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self) -> None:
+
+        if self.num_threads:
+            try:
+                import torch
+                torch.set_num_threads(self.num_threads)
+            except ImportError:
+                # 只使用 ONNX 后端时可以不安装 torch，线程数由各 InferenceSession 自行设置
+                pass
+
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+
+            batch = [task]
+            stopping = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    task = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if task is None:
+                    stopping = True
+                    break
+                batch.append(task)
+
+            self._execute(batch)
+            if stopping:
+                return
+
+    def _execute(self, batch: List[tuple]) -> None:
+
+        # 按任务类型分组，每组调用一次批处理函数
+        groups: Dict[str, List[tuple]] = {}
+        for kind, item, future in batch:
+            groups.setdefault(kind, []).append((item, future))
+
+        for kind, tasks in groups.items():
+            try:
+                results = self._handlers[kind]([item for item, _ in tasks])
+            except Exception as e:
+                for _, future in tasks:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(tasks, results):
+                future.set_result(result)
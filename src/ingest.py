@@ -0,0 +1,258 @@
+"""
+离线并行构建知识库索引
+
+按文档文件分片，在进程池中并行完成分块和向量化，主进程分批写入持久化向量库，
+并按时间间隔落盘、记录检查点，中断后重新运行会跳过已完成且未修改的文件。
+
+用法:
+    python src/ingest.py --source data/ --index-dir index --workers 4
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chunking import iter_chunks, iter_document_files
+from indexing import VectorIndexer, chunk_id
+from onnx_backend import backend_options_from_env, export_embedding_model, is_exported
+from vector_store import STORE_PRESETS, create_vector_store
+
+CHECKPOINT_FILE = "ingest_checkpoint.json"
+
+# 每个工作进程各自加载一次的向量模型
+_worker_indexer: Optional[VectorIndexer] = None
+_worker_existing_ids: Set[str] = set()
+
+
+def _init_worker(model_path: str, batch_size: int, existing_ids: Set[str], num_threads: int,
+                 backend: str = "torch") -> None:
+
+    global _worker_indexer, _worker_existing_ids
+    backend_options = None
+    if backend == "onnx":
+        backend_options = dict(backend_options_from_env(), num_threads=num_threads)
+    else:
+        import torch
+        torch.set_num_threads(num_threads)
+    # 工作进程只需要向量模型，使用不落盘的内存存储
+    _worker_indexer = VectorIndexer(model_path, batch_size=batch_size, lexical=False, store="numpy",
+                                    backend=backend, backend_options=backend_options)
+    _worker_existing_ids = existing_ids
+
+
+def _process_file(file_path: str, chunking: str) -> Dict[str, Any]:
+    """在工作进程中对单个文件分块并为向量库中尚不存在的chunk生成向量"""
+    indexer = _worker_indexer
+    fingerprint = _fingerprint(file_path)
+    if chunking == "tokens":
+        chunks = iter_chunks(file_path, use_semantic=False, tokenizer=indexer.embedding_model.tokenizer,
+                             max_tokens=indexer.max_chunk_tokens)
+    else:
+        chunks = iter_chunks(file_path, use_semantic=(chunking == "title"))
+
+    ids, texts, metadatas, seen = [], [], [], []
+    new_ids = set()
+    for chunk in chunks:
+        key = chunk_id(chunk.text, indexer.model_name)
+        seen.append(key)
+        if key in _worker_existing_ids or key in new_ids:
+            continue
+        new_ids.add(key)
+        ids.append(key)
+        texts.append(chunk.text)
+        metadatas.append(chunk.metadata())
+
+    embeddings = indexer.embed_chunks(texts) if texts else []
+    return {'file': file_path, 'fingerprint': fingerprint, 'chunk_ids': seen, 'ids': ids, 'texts': texts,
+            'metadatas': metadatas, 'embeddings': embeddings}
+
+
+def _fingerprint(file_path: str) -> List[int]:
+
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_checkpoint(path: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    """读取检查点，配置（模型、分块方式）不一致时视为无效"""
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('config') == config:
+                return checkpoint
+        except Exception as e:
+            print(f"读取检查点失败，将重新构建: {e}")
+    return {'config': config, 'files': {}}
+
+
+def save_checkpoint(path: str, checkpoint: Dict[str, Any]) -> None:
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def ingest(source: str, index_dir: str, store: str = "chroma", model_path: str = "shibing624/text2vec-base-chinese",
+           chunking: str = "title", workers: Optional[int] = None, batch_size: int = 32,
+           write_batch_size: int = 1000, restart: bool = False, backend: str = "torch",
+           checkpoint_interval: float = 60.0) -> Dict[str, Any]:
+    """
+    并行构建索引
+
+    Args:
+        source: 文档来源（文件、目录或 glob 表达式）
+        index_dir: 持久化索引目录，检查点也保存在这里
+        store: 向量存储后端：chroma、numpy、numpy-int8 或 numpy-pca
+        model_path: 向量模型
+        chunking: 分块方式：title、chars 或 tokens
+        workers: 工作进程数，默认为CPU核数
+        batch_size: 向量化批大小
+        write_batch_size: 写入向量库的批大小
+        restart: 忽略已有检查点，重新处理所有文件
+        backend: 推理后端：torch 或 onnx
+        checkpoint_interval: 落盘并保存检查点的最短间隔（秒），0 表示每批写入后都保存
+
+    Returns:
+        Dict: 处理的文件数、跳过的文件数、新增/删除的chunk数、耗时和吞吐
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(index_dir, exist_ok=True)
+    # numpy-int8 / numpy-pca 写入期间按普通 numpy 存储落盘，全部写完后只构建一次粗排向量
+    first_pass_preset = store in STORE_PRESETS
+    vector_store = create_vector_store(store, index_dir, **({'first_pass': None} if first_pass_preset else {}))
+    checkpoint_path = os.path.join(index_dir, CHECKPOINT_FILE)
+    config = {'model': model_path, 'chunking': chunking, 'store': store}
+    if backend != "torch":
+        config['backend'] = backend
+    checkpoint = {'config': config, 'files': {}} if restart else load_checkpoint(checkpoint_path, config)
+
+    existing_ids = set(vector_store.get_ids())
+    files = list(iter_document_files(source))
+    seen_ids: Set[str] = set()
+    pending_files: List[str] = []
+    for file_path in files:
+        entry = checkpoint['files'].get(file_path)
+        if entry and entry['fingerprint'] == _fingerprint(file_path):
+            # 已完成且未修改的文件直接跳过
+            seen_ids.update(entry['chunk_ids'])
+        else:
+            pending_files.append(file_path)
+    print(f"共 {len(files)} 个文件，跳过 {len(files) - len(pending_files)} 个已完成文件，使用 {workers} 个进程处理其余文件")
+
+    start = time.perf_counter()
+    added = 0
+    processed_chunks = 0
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    batch: List[Tuple[str, str, List[float], Dict[str, Any]]] = []
+    done_files: List[Dict[str, Any]] = []
+    last_checkpoint = time.perf_counter()
+
+    def flush(force: bool = False) -> None:
+        nonlocal batch, done_files, last_checkpoint
+        if batch:
+            vector_store.add(
+                ids=[item[0] for item in batch],
+                embeddings=[item[2] for item in batch],
+                documents=[item[1] for item in batch],
+                metadatas=[item[3] for item in batch]
+            )
+            batch = []
+        # numpy 存储每次落盘都重写整个索引，每批都落盘时总写入量随知识库规模平方增长
+        if not force and time.perf_counter() - last_checkpoint < checkpoint_interval:
+            return
+        vector_store.persist()
+        # 文件的全部chunk落盘后才写入检查点
+        for result in done_files:
+            checkpoint['files'][result['file']] = {
+                'fingerprint': result['fingerprint'],
+                'chunk_ids': result['chunk_ids']
+            }
+        if done_files:
+            save_checkpoint(checkpoint_path, checkpoint)
+        done_files = []
+        last_checkpoint = time.perf_counter()
+
+    if pending_files and backend == "onnx" and not is_exported(backend_options_from_env()['onnx_dir'], model_path):
+        # 先在主进程中导出一次，避免各工作进程同时导出
+        export_embedding_model(model_path, backend_options_from_env()['onnx_dir'])
+
+    if pending_files:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_path, batch_size, existing_ids, threads_per_worker, backend)) as executor:
+            futures = [executor.submit(_process_file, file_path, chunking) for file_path in pending_files]
+            for completed, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                for key, text, embedding, metadata in zip(result['ids'], result['texts'],
+                                                           result['embeddings'], result['metadatas']):
+                    if key in existing_ids or key in seen_ids:
+                        continue
+                    batch.append((key, text, embedding, metadata))
+                    existing_ids.add(key)
+                    added += 1
+                seen_ids.update(result['chunk_ids'])
+                processed_chunks += len(result['chunk_ids'])
+                done_files.append(result)
+                if len(batch) >= write_batch_size:
+                    flush()
+
+                elapsed = time.perf_counter() - start
+                print(f"[{completed}/{len(pending_files)}] {result['file']}: {len(result['chunk_ids'])} 个片段，"
+                      f"累计 {processed_chunks} 个，{processed_chunks / elapsed:.1f} chunks/s")
+    flush(force=True)
+
+    # 全部文件处理完后删除已不存在的chunk，并清理已删除文件的检查点
+    stale_ids = [key for key in vector_store.get_ids() if key not in seen_ids]
+    if stale_ids:
+        vector_store.delete(stale_ids)
+        vector_store.persist()
+    if first_pass_preset:
+        # 重新打开时发现粗排向量缺失或过期，persist 只写入粗排向量
+        create_vector_store(store, index_dir).persist()
+    current_files = set(files)
+    checkpoint['files'] = {path: entry for path, entry in checkpoint['files'].items() if path in current_files}
+    save_checkpoint(checkpoint_path, checkpoint)
+
+    elapsed = time.perf_counter() - start
+    return {
+        'files': len(pending_files),
+        'skipped_files': len(files) - len(pending_files),
+        'chunks': processed_chunks,
+        'added': added,
+        'deleted': len(stale_ids),
+        'seconds': round(elapsed, 2),
+        'chunks_per_second': round(processed_chunks / elapsed, 1) if elapsed else 0.0
+    }
+
+
+def main():
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="并行构建 EduAgent 知识库索引")
+    parser.add_argument('--source', default=os.getenv("EDUAGENT_DOCS", os.path.join(root_dir, 'data', 'doc.md')),
+                        help='文档来源：文件、目录或 glob 表达式')
+    parser.add_argument('--index-dir', default=os.getenv("EDUAGENT_INDEX_DIR", os.path.join(root_dir, 'index')))
+    parser.add_argument('--store', default=os.getenv("EDUAGENT_VECTOR_STORE", "chroma"),
+                        choices=['chroma', 'numpy', 'numpy-int8', 'numpy-pca'])
+    parser.add_argument('--model', default="shibing624/text2vec-base-chinese")
+    parser.add_argument('--chunking', default=os.getenv("EDUAGENT_CHUNKING", "title"), choices=['title', 'chars', 'tokens'])
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数，默认为CPU核数')
+    parser.add_argument('--batch-size', type=int, default=32, help='向量化批大小')
+    parser.add_argument('--write-batch-size', type=int, default=1000, help='写入向量库的批大小')
+    parser.add_argument('--restart', action='store_true', help='忽略检查点，重新处理所有文件')
+    parser.add_argument('--checkpoint-interval', type=float, default=60.0, help='落盘并保存检查点的最短间隔（秒）')
+    parser.add_argument('--backend', default=os.getenv("EDUAGENT_INFERENCE_BACKEND", "torch"), choices=['torch', 'onnx'],
+                        help='推理后端，onnx 使用 int8 量化的 ONNX Runtime 模型')
+    args = parser.parse_args()
+
+    stats = ingest(args.source, args.index_dir, args.store, args.model, args.chunking, args.workers,
+                   args.batch_size, args.write_batch_size, args.restart, args.backend, args.checkpoint_interval)
+    print(f"索引构建完成: 处理 {stats['files']} 个文件（跳过 {stats['skipped_files']} 个），"
+          f"新增 {stats['added']}，删除 {stats['deleted']}，用时 {stats['seconds']}s，"
+          f"{stats['chunks_per_second']} chunks/s")
+
+
+if __name__ == "__main__":
+    main()
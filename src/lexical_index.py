@@ -0,0 +1,79 @@
+from typing import Dict, List, Tuple
+from collections import Counter
+import heapq
+import math
+import re
+import unicodedata
+
+# 中文按连续汉字切分，其余按字母/数字/希腊字母组成的词切分（如 mu、F_N、0.3）
+_CJK_PATTERN = re.compile(r'[\u4e00-\u9fff]+')
+_WORD_PATTERN = re.compile(r'[a-z0-9_\u0370-\u03ff]+(?:\.[0-9]+)?')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文字符二元组分词：连续汉字切成相邻两字的二元组（单字片段保留单字），
+    字母、数字和公式符号按整词保留
+    """
+    text = unicodedata.normalize('NFKC', text).lower()
+    tokens = []
+    for run in _CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(_WORD_PATTERN.findall(_CJK_PATTERN.sub(' ', text)))
+    return tokens
+
+
+class BM25Index:
+    """基于中文字符二元组的内存BM25倒排索引"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.documents: Dict[str, str] = {}
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+        self.avg_doc_length = 0.0
+
+    def build(self, ids: List[str], documents: List[str]) -> None:
+        """用全部文档重建索引"""
+        self.ids = list(ids)
+        self.documents = dict(zip(ids, documents))
+        self.postings = {}
+        self.doc_lengths = []
+
+        for doc_index, document in enumerate(documents):
+            term_counts = Counter(tokenize(document))
+            self.doc_lengths.append(sum(term_counts.values()))
+            for term, count in term_counts.items():
+                self.postings.setdefault(term, []).append((doc_index, count))
+
+        self.avg_doc_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """
+        检索与查询最相关的文档
+
+        Returns:
+            List[Tuple[str, float]]: 按BM25得分降序排列的 (文档ID, 得分)
+        """
+        if not self.ids:
+            return []
+
+        num_docs = len(self.ids)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_index, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_index] / self.avg_doc_length)
+                scores[doc_index] = scores.get(doc_index, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = heapq.nlargest(top_k, scores.items(), key=lambda x: x[1])
+        return [(self.ids[doc_index], score) for doc_index, score in ranked]
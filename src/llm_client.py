@@ -0,0 +1,236 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import collections
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import httpx
+import openai
+from dotenv import load_dotenv
+from openai import OpenAI
+
+# 可以重试的错误：超时、连接失败、限流和服务端 5xx
+RETRYABLE_ERRORS = (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                    openai.InternalServerError)
+
+
+class LLMClient:
+    """
+    共享的 OpenAI 兼容 LLM 客户端
+
+    所有调用复用同一个 HTTP 连接池，每次调用有总截止时间，失败时按带抖动的指数退避重试；
+    可选地在调用耗时超过近期延迟的某个百分位后发出一次对冲请求，取先返回的结果。
+    """
+
+    def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com", timeout: float = 60.0,
+                 connect_timeout: float = 5.0, max_retries: int = 2, backoff: float = 0.5,
+                 max_connections: int = 32, hedge_percentile: Optional[float] = None,
+                 hedge_min_samples: int = 20):
+        """
+        Args:
+            api_key: API密钥
+            base_url: OpenAI 兼容接口地址，测试时可指向本地桩服务
+            timeout: 单次调用（含重试）的默认总截止时间（秒）
+            connect_timeout: 建立连接的超时时间（秒）
+            max_retries: 最多重试次数
+            backoff: 退避基数（秒），第 n 次重试前随机等待 [0, backoff * 2^n]
+            max_connections: 连接池大小
+            hedge_percentile: 非流式调用超过近期延迟的该百分位（如 95）仍未返回时发出对冲请求，为 None 时关闭；
+                延迟按 (模型, 调用分组) 分别统计，短的分类调用不会拉低生成调用的对冲阈值
+            hedge_min_samples: 启用对冲前至少需要的延迟样本数（同一分组内）
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout)
+        )
+        # 重试由本类统一处理，关闭 SDK 自带的重试
+        self.client = OpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client, max_retries=0)
+        # (模型, 调用分组) -> 近期成功调用的延迟
+        self._latencies: Dict[Tuple[str, str], collections.deque] = {}
+        self._lock = threading.Lock()
+        self._hedge_executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="llm-hedge") \
+            if hedge_percentile else None
+
+    def chat(self, messages: List[Dict[str, str]], model: str, timeout: Optional[float] = None,
+             latency_group: str = "default", **kwargs) -> Any:
+        """
+        非流式对话补全
+
+        Args:
+            messages: 对话消息
+            model: 模型名
+            timeout: 本次调用的总截止时间（秒），默认使用构造时的 timeout
+            latency_group: 延迟统计分组（如 classify、generate），对冲阈值只参考同一模型、同一分组的近期延迟
+
+        Returns:
+            ChatCompletion 响应
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        key = (model, latency_group)
+        return self._with_retries(lambda remaining: self._create_hedged(messages, model, remaining, key, **kwargs),
+                                  deadline)
+
+    def chat_stream(self, messages: List[Dict[str, str]], model: str, timeout: Optional[float] = None,
+                    usage: Optional[Dict[str, int]] = None, **kwargs) -> Iterator[str]:
+        """
+        流式对话补全，逐段返回文本；只在建立连接时重试，超过截止时间后停止读取
+
+        Args:
+            usage: 传入字典时请求服务端在流末尾返回用量，并按 prompt_cache_usage 的格式填入
+
+        Yields:
+            str: 模型新生成的文本片段
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        if usage is not None:
+            kwargs['stream_options'] = {'include_usage': True}
+        stream = self._with_retries(
+            lambda remaining: self.client.chat.completions.create(
+                model=model, messages=messages, stream=True, timeout=remaining, **kwargs),
+            deadline
+        )
+        try:
+            for event in stream:
+                if time.monotonic() > deadline:
+                    raise TimeoutError("LLM stream exceeded its deadline")
+                if usage is not None and getattr(event, 'usage', None):
+                    usage.update(prompt_cache_usage(event.usage))
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            stream.close()
+
+    def latency_percentile(self, percentile: float, model: str, latency_group: str = "default") -> Optional[float]:
+        """某个模型、某个分组近期成功调用延迟（秒）的百分位，样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._latencies.get((model, latency_group), ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(percentile / 100 * len(samples)))]
+
+    def close(self) -> None:
+
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.http_client.close()
+
+    def _with_retries(self, call, deadline: float) -> Any:
+
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("LLM call exceeded its deadline")
+            try:
+                return call(remaining)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                # full jitter，避免大量请求同时重试
+                delay = random.uniform(0, self.backoff * (2 ** attempt))
+                if time.monotonic() + delay >= deadline:
+                    raise
+                print(f"LLM调用失败，{delay:.2f}s 后重试（第 {attempt + 1} 次）: {e}")
+                time.sleep(delay)
+                attempt += 1
+
+    def _create(self, messages: List[Dict[str, str]], model: str, timeout: float, key: Tuple[str, str],
+                **kwargs) -> Any:
+
+        start = time.monotonic()
+        response = self.client.chat.completions.create(model=model, messages=messages, stream=False,
+                                                       timeout=timeout, **kwargs)
+        with self._lock:
+            self._latencies.setdefault(key, collections.deque(maxlen=512)).append(time.monotonic() - start)
+        return response
+
+    def _create_hedged(self, messages: List[Dict[str, str]], model: str, timeout: float, key: Tuple[str, str],
+                       **kwargs) -> Any:
+
+        hedge_after = self.latency_percentile(self.hedge_percentile, *key) if self.hedge_percentile else None
+        if hedge_after is None or hedge_after >= timeout:
+            return self._create(messages, model, timeout, key, **kwargs)
+
+        start = time.monotonic()
+        futures = [self._hedge_executor.submit(self._create, messages, model, timeout, key, **kwargs)]
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            # 首个请求慢于近期大多数请求，再发一次，取先返回的结果
+            futures.append(self._hedge_executor.submit(
+                self._create, messages, model, timeout - (time.monotonic() - start), key, **kwargs))
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, timeout - (time.monotonic() - start)),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error or TimeoutError("LLM call exceeded its deadline")
+
+
+def prompt_cache_usage(usage: Any) -> Dict[str, int]:
+    """
+    从响应的 usage 字段中取出token用量，区分命中上下文缓存的prompt token：
+    DeepSeek 返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens，
+    OpenAI 返回 prompt_tokens_details.cached_tokens
+    """
+    if usage is None:
+        return {}
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, 'model_dump') else dict(vars(usage))
+    prompt_tokens = usage.get('prompt_tokens') or 0
+    if usage.get('prompt_cache_hit_tokens') is not None:
+        cached = usage['prompt_cache_hit_tokens']
+    else:
+        cached = (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+    return {
+        'prompt_tokens': prompt_tokens,
+        'cached_prompt_tokens': cached,
+        'uncached_prompt_tokens': prompt_tokens - cached,
+        'completion_tokens': usage.get('completion_tokens') or 0,
+    }
+
+
+_shared_client: Optional[LLMClient] = None
+_shared_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """
+    进程内共享的 LLM 客户端，配置来自环境变量：
+    LLM_API_KEY（默认读取 DEEPSEEK_API_KEY）、LLM_BASE_URL、LLM_TIMEOUT、LLM_CONNECT_TIMEOUT、
+    LLM_MAX_RETRIES、LLM_MAX_CONNECTIONS、LLM_HEDGE_PERCENTILE
+    """
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            load_dotenv()
+            api_key = os.getenv("LLM_API_KEY") or os.getenv("DEEPSEEK_API_KEY")
+            if not api_key:
+                raise ValueError("DEEPSEEK_API_KEY not found in environment variables")
+            hedge_percentile = os.getenv("LLM_HEDGE_PERCENTILE")
+            _shared_client = LLMClient(
+                api_key=api_key,
+                base_url=os.getenv("LLM_BASE_URL", "https://api.deepseek.com"),
+                timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+                connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", "5")),
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+                max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "32")),
+                hedge_percentile=float(hedge_percentile) if hedge_percentile else None
+            )
+        return _shared_client
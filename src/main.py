@@ -1,13 +1,19 @@
 import os
 from dotenv import load_dotenv
-from chunking import split_into_chunks
+from chunking import iter_chunks
 from indexing import VectorIndexer
 from retrieval import Retriever
 from reranking import Reranker
 from generation import ResponseGenerator
+from query_classifier import QueryClassifier
+from pipeline import RAGPipeline
+from onnx_backend import backend_options_from_env
 
 # 加载环境变量
 load_dotenv()
+# 召回与重排深度，可用 benchmarks/eval_retrieval.py 在标注问题集上评估后调整
+TOP_K_RETRIEVE = int(os.getenv("EDUAGENT_TOP_K_RETRIEVE", "5"))
+TOP_K_RERANK = int(os.getenv("EDUAGENT_TOP_K_RERANK", "3"))
 HF_TOKEN = os.getenv("HF_TOKEN")
 if HF_TOKEN:
     os.environ["HF_TOKEN"] = HF_TOKEN
@@ -17,28 +23,42 @@ def main():
     # Path setup
     current_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(os.path.dirname(current_dir), 'data')
-    doc_file = os.path.join(data_dir, 'doc.md')
+    # 文档来源可以是单个文件、目录或 glob 表达式
+    doc_source = os.getenv("EDUAGENT_DOCS", os.path.join(data_dir, 'doc.md'))
+    index_dir = os.getenv("EDUAGENT_INDEX_DIR", os.path.join(os.path.dirname(current_dir), 'index'))
     
-    # 1. 分片
-    chunks = split_into_chunks(doc_file)
+    # EDUAGENT_INFERENCE_BACKEND=onnx 时使用 int8 量化的 ONNX Runtime 推理
+    backend = os.getenv("EDUAGENT_INFERENCE_BACKEND", "torch")
+    backend_options = backend_options_from_env() if backend == "onnx" else None
+    indexer = VectorIndexer(persist_dir=index_dir, show_progress=True, store=os.getenv("EDUAGENT_VECTOR_STORE", "chroma"),
+                            backend=backend, backend_options=backend_options)
+    
+    # 1. 分片（流式产出，在建索引时按批消费）
+    # EDUAGENT_CHUNKING: title 按标题（默认）、chars 按字符数、tokens 按向量模型token数
+    chunking = os.getenv("EDUAGENT_CHUNKING", "title")
+    if chunking == "tokens":
+        chunks = iter_chunks(doc_source, use_semantic=False, tokenizer=indexer.embedding_model.tokenizer,
+                             max_tokens=indexer.max_chunk_tokens)
+    else:
+        chunks = iter_chunks(doc_source, use_semantic=(chunking == "title"))
     # for i, chunk in enumerate(chunks):
     #     print(f"[{i}] {chunk}\n")
     
     # 2. 索引
-    indexer = VectorIndexer()
     # embeddings = [indexer.embed_chunk(chunk) for chunk in chunks]
     # print(len(embeddings))
     # print(embeddings[0])
-    indexer.build_index(chunks)
+    stats = indexer.build_index(chunks)
+    print(f"索引更新完成: 新增 {stats['added']}，删除 {stats['deleted']}，未变化 {stats['unchanged']}")
     
     # 3. 初始化召回和重排
-    retriever = Retriever(indexer)
+    retriever = Retriever(indexer, mode=os.getenv("EDUAGENT_RETRIEVAL_MODE", "hybrid"))
     # query = "哆啦A梦使用的3个秘密道具分别是什么？"
     # retrieved_chunks = retriever.retrieve(query, 5)
     # for i, chunk in enumerate(retrieved_chunks):
     #     print(f"[{i}] {chunk}\n")
 
-    reranker = Reranker()
+    reranker = Reranker(backend=backend, backend_options=backend_options)
     # query = "哆啦A梦使用的3个秘密道具分别是什么？"
     # retrieved_chunks = retriever.retrieve(query, 5)
     # reranked_chunks = reranker.rerank(query, retrieved_chunks, 3)
@@ -46,7 +66,10 @@ def main():
     #     print(f"[{i}] {chunk}\n")
 
     # 4. 单次生成回答
-    generator = ResponseGenerator()
+    # 复用已加载的向量模型做本地分类，低置信度时才调用LLM
+    classifier = QueryClassifier(embedding_model=indexer.embedding_model)
+    generator = ResponseGenerator(classifier=classifier)
+    pipeline = RAGPipeline(retriever, reranker, generator)
     # query = "什么是滑动摩擦力？"
     # retrieved_chunks = retriever.retrieve(query, 5)
     # reranked_chunks = reranker.rerank(query, retrieved_chunks, 3)
@@ -67,20 +90,26 @@ def main():
         if not query:
             continue
         
-        # 4.1 召回
-        retrieved_chunks = retriever.retrieve(query, top_k=5)
-        
-        # 4.2 重排
-        reranked_chunks = reranker.rerank(query, retrieved_chunks, top_k=3)
-        
-        # 4.3 生成
-        answer = generator.generate(query, reranked_chunks[0])
-        
         print("\n" + "-" * 60)
         print("回答:")
         print("-" * 60)
-        print(answer)
+        
+        # 召回 -> 重排 -> 生成，查询分类在后台与召回、重排并行，回答流式输出
+        timings = {}
+        usage = {}
+        for event, payload in pipeline.answer_stream(query, top_k_retrieve=TOP_K_RETRIEVE, top_k_rerank=TOP_K_RERANK):
+            if event == 'token':
+                print(payload['text'], end="", flush=True)
+            elif event == 'usage':
+                usage = payload
+            elif event == 'timings':
+                timings = payload
+        print()
         print("-" * 60)
+        print("各阶段耗时(ms): " + ", ".join(f"{stage}={ms}" for stage, ms in timings.items()))
+        if usage:
+            print(f"prompt tokens: {usage['prompt_tokens']}（缓存命中 {usage['cached_prompt_tokens']}，"
+                  f"未命中 {usage['uncached_prompt_tokens']}），completion tokens: {usage['completion_tokens']}")
 
 
 if __name__ == "__main__":
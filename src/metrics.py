@@ -0,0 +1,182 @@
+"""
+轻量级指标收集：直方图与计数器，按 Prometheus 文本格式导出
+
+各模块通过 observe / timer / inc 记录到进程内共享的 REGISTRY，
+Web 服务在 /api/metrics 中输出 REGISTRY.render() 的结果。
+"""
+from typing import Dict, Iterable, Iterator, List, Tuple
+import bisect
+import contextlib
+import threading
+import time
+
+# 延迟直方图的默认分桶（秒），覆盖从本地检索的毫秒级到LLM生成的数十秒
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """带标签的累积直方图"""
+
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # 标签 -> [各桶计数..., 总数, 总和]
+        self._series: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(series)) for key, series in sorted(self._series.items())]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {int(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {int(series[-2])}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(series[-1])}")
+        return lines
+
+
+class Counter:
+    """带标签的单调递增计数器"""
+
+    def __init__(self, name: str, help_text: str):
+
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, buckets)
+            return self._metrics[name]
+
+    def counter(self, name: str, help_text: str) -> Counter:
+
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help_text)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram("eduagent_stage_latency_seconds", "Latency of each pipeline stage in seconds")
+LLM_TOKENS = REGISTRY.counter("eduagent_llm_tokens_total", "LLM tokens by kind (cached_prompt, uncached_prompt, completion)")
+REQUESTS = REGISTRY.counter("eduagent_requests_total", "HTTP requests by endpoint and status")
+REQUEST_LATENCY = REGISTRY.histogram("eduagent_request_latency_seconds", "HTTP request latency in seconds")
+
+
+def observe(stage: str, seconds: float) -> None:
+    """记录一个阶段的耗时（秒）"""
+    STAGE_LATENCY.observe(seconds, stage=stage)
+
+
+@contextlib.contextmanager
+def timer(stage: str) -> Iterator[None]:
+    """with timer("rerank"): ... 记录代码块耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def timed_iter(iterable: Iterable, stage: str) -> Iterator:
+    """
+    包装一个惰性迭代器，累计其产出元素所花的时间（不含调用方处理元素的时间），
+    迭代结束后作为一次观测记录
+    """
+    total = 0.0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                total += time.perf_counter() - start
+                return
+            total += time.perf_counter() - start
+            yield item
+    finally:
+        observe(stage, total)
+
+
+def record_token_usage(usage: Dict[str, int]) -> None:
+
+    for kind in ('cached_prompt', 'uncached_prompt', 'completion'):
+        tokens = usage.get(f'{kind}_tokens')
+        if tokens:
+            LLM_TOKENS.inc(tokens, kind=kind)
+
+
+def _format_labels(key: LabelKey) -> str:
+
+    if not key:
+        return ""
+    pairs = []
+    for name, value in key:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
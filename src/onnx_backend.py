@@ -0,0 +1,320 @@
+"""
+ONNX Runtime 推理后端：向量模型与交叉编码器导出为 ONNX 并做动态 int8 量化，在 CPU 上推理
+
+导出只需执行一次（需要 torch、sentence-transformers、onnx），结果保存在 onnx_dir 下；
+推理时只依赖 onnxruntime 和分词器，不加载 PyTorch。OnnxEmbeddingModel / OnnxCrossEncoder
+与 SentenceTransformer.encode / CrossEncoder.predict 接口一致，可直接传给 VectorIndexer 和 Reranker。
+
+用法:
+    python src/onnx_backend.py export --output models/onnx
+    python src/onnx_backend.py verify --output models/onnx --tolerance 0.02
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+DEFAULT_ONNX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', 'onnx')
+DEFAULT_EMBEDDING_MODEL = "shibing624/text2vec-base-chinese"
+DEFAULT_CROSS_ENCODER = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+CONFIG_FILE = "onnx_config.json"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+# 导出格式版本，版本不同的已导出模型会重新导出（2：向量模型输出的序列维度改为动态）
+EXPORT_VERSION = 2
+
+# 校验一致性用的样例
+SAMPLE_QUERIES = ["什么是摩擦力？", "滑动摩擦力的大小和哪些因素有关？", "怎样用弹簧测力计测量滑动摩擦力？"]
+SAMPLE_PASSAGES = [
+    "两个相互接触并挤压的物体，当它们发生相对运动或具有相对运动趋势时，就会在接触面上产生阻碍相对运动的力，这种力叫做摩擦力。",
+    "滑动摩擦力的大小与接触面的粗糙程度与接触面上的压力有关，与接触面积的大小、运动速度的大小均无关。",
+    "测量滑动摩擦力时用弹簧测力计沿水平方向匀速拉动木块，根据二力平衡，拉力等于滑动摩擦力。",
+    "给门轴合页加润滑剂可以形成油膜使表面不直接接触从而减小摩擦。",
+]
+
+
+def backend_options_from_env() -> Dict[str, Any]:
+    """ONNX 后端的加载参数：EDUAGENT_ONNX_DIR（模型目录）与 EDUAGENT_INFERENCE_THREADS（线程数）"""
+    threads = os.getenv("EDUAGENT_INFERENCE_THREADS")
+    return {'onnx_dir': os.getenv("EDUAGENT_ONNX_DIR", DEFAULT_ONNX_DIR), 'num_threads': int(threads) if threads else None}
+
+
+def model_dir(onnx_dir: str, model_name: str) -> str:
+
+    return os.path.join(onnx_dir, model_name.replace('/', '__'))
+
+
+def is_exported(onnx_dir: str, model_name: str) -> bool:
+
+    config_path = os.path.join(model_dir(onnx_dir, model_name), CONFIG_FILE)
+    if not os.path.exists(config_path):
+        return False
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('export_version') == EXPORT_VERSION
+
+
+class _OnnxModel:
+    """加载导出目录中的 ONNX 模型、分词器和配置"""
+
+    def __init__(self, path: str, num_threads: Optional[int] = None, quantized: bool = True):
+
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(path, CONFIG_FILE), 'r', encoding='utf-8') as f:
+            self.config: Dict[str, Any] = json.load(f)
+        model_file = QUANTIZED_MODEL_FILE if quantized and self.config.get('quantized') else MODEL_FILE
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(os.path.join(path, model_file), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.max_seq_length = self.config['max_seq_length']
+
+    def _run(self, *texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """分词并推理，返回模型输出和 attention_mask"""
+        features = self.tokenizer(*texts, padding=True, truncation=True, max_length=self.max_seq_length,
+                                  return_tensors="np")
+        inputs = {name: features[name].astype(np.int64) for name in self.input_names}
+        return self.session.run(None, inputs)[0], features['attention_mask']
+
+
+class OnnxEmbeddingModel(_OnnxModel):
+    """ONNX 向量模型，encode 的行为与 SentenceTransformer 一致（按长度分批、池化、可选归一化）"""
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, normalize_embeddings: bool = False,
+               **kwargs) -> np.ndarray:
+
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        # 与 SentenceTransformer 相同，按长度降序分批以减少padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        embeddings = np.zeros((len(texts), self.config['dimension']), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            hidden, mask = self._run([texts[i] for i in indices])
+            embeddings[indices] = self._pool(hidden, mask)
+
+        if normalize_embeddings:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+
+        if self.config['pooling'] == 'cls':
+            return hidden[:, 0]
+        weights = mask[:, :, None].astype(np.float32)
+        return (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+
+
+class OnnxCrossEncoder(_OnnxModel):
+    """ONNX 交叉编码器，predict 的行为与 CrossEncoder 一致（单标签输出，按导出时的激活函数变换）"""
+
+    def predict(self, sentences: Sequence[Tuple[str, str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+
+        pairs = list(sentences)
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            logits, _ = self._run([query for query, _ in batch], [text for _, text in batch])
+            scores[start:start + len(batch)] = logits[:, 0]
+        if self.config.get('activation') == 'sigmoid':
+            scores = 1.0 / (1.0 + np.exp(-scores))
+        return scores
+
+
+def load_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL, onnx_dir: str = DEFAULT_ONNX_DIR,
+                         num_threads: Optional[int] = None, quantized: bool = True) -> OnnxEmbeddingModel:
+    """加载导出的向量模型，尚未导出时先导出"""
+    if not is_exported(onnx_dir, model_name):
+        print(f"未找到 {model_name} 的 ONNX 模型，开始导出到 {onnx_dir}")
+        export_embedding_model(model_name, onnx_dir, quantize=quantized)
+    return OnnxEmbeddingModel(model_dir(onnx_dir, model_name), num_threads, quantized)
+
+
+def load_cross_encoder(model_name: str = DEFAULT_CROSS_ENCODER, onnx_dir: str = DEFAULT_ONNX_DIR,
+                       num_threads: Optional[int] = None, quantized: bool = True) -> OnnxCrossEncoder:
+    """加载导出的交叉编码器，尚未导出时先导出"""
+    if not is_exported(onnx_dir, model_name):
+        print(f"未找到 {model_name} 的 ONNX 模型，开始导出到 {onnx_dir}")
+        export_cross_encoder(model_name, onnx_dir, quantize=quantized)
+    return OnnxCrossEncoder(model_dir(onnx_dir, model_name), num_threads, quantized)
+
+
+def export_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL, onnx_dir: str = DEFAULT_ONNX_DIR,
+                           quantize: bool = True) -> str:
+    """把 SentenceTransformer 的 Transformer 部分导出为 ONNX，池化方式写入配置，在推理时用 NumPy 完成"""
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    pooling = model[1]
+    if getattr(pooling, 'pooling_mode_cls_token', False):
+        pooling_mode = 'cls'
+    elif getattr(pooling, 'pooling_mode_mean_tokens', True):
+        pooling_mode = 'mean'
+    else:
+        raise ValueError(f"Unsupported pooling for ONNX export: {pooling}")
+    if len(model) > 2:
+        # Dense / Normalize 等额外模块未实现
+        raise ValueError(f"Unsupported modules for ONNX export: {[type(module).__name__ for module in model]}")
+
+    config = {
+        'kind': 'embedding',
+        'source': model_name,
+        'pooling': pooling_mode,
+        'max_seq_length': model.max_seq_length,
+        'dimension': model.get_sentence_embedding_dimension(),
+    }
+    # last_hidden_state 的形状为 (batch, sequence, hidden)，序列长度随输入变化
+    return _export(model[0].auto_model, model.tokenizer, (["示例文本"],), 'last_hidden_state',
+                   {0: 'batch', 1: 'sequence'}, model_dir(onnx_dir, model_name), config, quantize)
+
+
+def export_cross_encoder(model_name: str = DEFAULT_CROSS_ENCODER, onnx_dir: str = DEFAULT_ONNX_DIR,
+                         quantize: bool = True) -> str:
+    """导出 CrossEncoder 的分类模型，记录其默认激活函数，使打分与 CrossEncoder.predict 一致"""
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    model = CrossEncoder(model_name, device="cpu")
+    if model.config.num_labels != 1:
+        raise ValueError(f"Only single-label cross-encoders are supported, got {model.config.num_labels} labels")
+    activation = getattr(model, 'activation_fn', None) or getattr(model, 'default_activation_function', None)
+    config = {
+        'kind': 'cross_encoder',
+        'source': model_name,
+        'max_seq_length': model.max_length or model.tokenizer.model_max_length,
+        'activation': 'sigmoid' if isinstance(activation, torch.nn.Sigmoid) else 'identity',
+    }
+    return _export(model.model, model.tokenizer, (["示例问题"], ["示例文本"]), 'logits', {0: 'batch'},
+                   model_dir(onnx_dir, model_name), config, quantize)
+
+
+def _export(model, tokenizer, sample: Tuple[List[str], ...], output_name: str, output_axes: Dict[int, str],
+            path: str, config: Dict[str, Any], quantize: bool) -> str:
+
+    import torch
+
+    os.makedirs(path, exist_ok=True)
+    features = tokenizer(*sample, return_tensors="pt")
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in features]
+
+    class Wrapper(torch.nn.Module):
+
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)), return_dict=False)[0]
+
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes[output_name] = output_axes
+    model.eval()
+    with torch.no_grad():
+        torch.onnx.export(Wrapper(), tuple(features[name] for name in input_names), os.path.join(path, MODEL_FILE),
+                          input_names=input_names, output_names=[output_name], dynamic_axes=dynamic_axes,
+                          opset_version=14, do_constant_folding=True)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        # 动态量化：权重离线量化为 int8，激活在推理时按批量化
+        quantize_dynamic(os.path.join(path, MODEL_FILE), os.path.join(path, QUANTIZED_MODEL_FILE),
+                         weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(path)
+    config['quantized'] = quantize
+    config['export_version'] = EXPORT_VERSION
+    # 配置文件最后写入，作为导出完成的标记
+    with open(os.path.join(path, CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def verify_agreement(embedding_model_name: str = DEFAULT_EMBEDDING_MODEL,
+                     cross_encoder_name: str = DEFAULT_CROSS_ENCODER, onnx_dir: str = DEFAULT_ONNX_DIR,
+                     tolerance: float = 0.02, num_threads: Optional[int] = None, repeats: int = 20) -> Dict[str, Any]:
+    """
+    对比 ONNX 与 PyTorch 的输出和单查询延迟
+
+    向量以余弦相似度衡量（要求 >= 1 - tolerance），交叉编码器以得分的最大绝对差衡量（要求 <= tolerance），
+    并检查每个查询的最高分文本是否一致。
+
+    Returns:
+        Dict: 各项指标与是否通过（passed）
+    """
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+
+    torch_embedder = SentenceTransformer(embedding_model_name, device="cpu")
+    torch_cross_encoder = CrossEncoder(cross_encoder_name, device="cpu")
+    onnx_embedder = load_embedding_model(embedding_model_name, onnx_dir, num_threads)
+    onnx_cross_encoder = load_cross_encoder(cross_encoder_name, onnx_dir, num_threads)
+
+    texts = SAMPLE_QUERIES + SAMPLE_PASSAGES
+    reference = torch_embedder.encode(texts, normalize_embeddings=True)
+    candidate = onnx_embedder.encode(texts, normalize_embeddings=True)
+    min_cosine = float(np.min(np.sum(reference * candidate, axis=1)))
+
+    pairs = [(query, passage) for query in SAMPLE_QUERIES for passage in SAMPLE_PASSAGES]
+    reference_scores = np.asarray(torch_cross_encoder.predict(pairs), dtype=np.float32)
+    candidate_scores = onnx_cross_encoder.predict(pairs)
+    max_score_diff = float(np.max(np.abs(reference_scores - candidate_scores)))
+    shape = (len(SAMPLE_QUERIES), len(SAMPLE_PASSAGES))
+    top1_agreement = float(np.mean(reference_scores.reshape(shape).argmax(axis=1)
+                                   == candidate_scores.reshape(shape).argmax(axis=1)))
+
+    def latency_ms(fn) -> float:
+        fn()
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+        return round(float(np.median(samples)), 3)
+
+    query = SAMPLE_QUERIES[0]
+    rerank_pairs = [(query, passage) for passage in SAMPLE_PASSAGES]
+    result = {
+        'min_embedding_cosine': round(min_cosine, 5),
+        'max_rerank_score_diff': round(max_score_diff, 5),
+        'rerank_top1_agreement': top1_agreement,
+        'torch_embed_ms': latency_ms(lambda: torch_embedder.encode(query, normalize_embeddings=True)),
+        'onnx_embed_ms': latency_ms(lambda: onnx_embedder.encode(query, normalize_embeddings=True)),
+        'torch_rerank_ms': latency_ms(lambda: torch_cross_encoder.predict(rerank_pairs)),
+        'onnx_rerank_ms': latency_ms(lambda: onnx_cross_encoder.predict(rerank_pairs)),
+    }
+    result['passed'] = (min_cosine >= 1 - tolerance and max_score_diff <= tolerance and top1_agreement == 1.0)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出并校验 ONNX int8 推理后端")
+    parser.add_argument('command', choices=['export', 'verify'])
+    parser.add_argument('--output', default=os.getenv("EDUAGENT_ONNX_DIR", DEFAULT_ONNX_DIR), help='ONNX 模型目录')
+    parser.add_argument('--embedding-model', default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument('--cross-encoder', default=DEFAULT_CROSS_ENCODER)
+    parser.add_argument('--no-quantize', action='store_true', help='只导出 float32 模型')
+    parser.add_argument('--tolerance', type=float, default=0.02, help='与 PyTorch 输出的允许偏差')
+    parser.add_argument('--threads', type=int, default=None, help='ONNX Runtime 线程数')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        for export in (export_embedding_model, export_cross_encoder):
+            model_name = args.embedding_model if export is export_embedding_model else args.cross_encoder
+            print(f"已导出: {export(model_name, args.output, quantize=not args.no_quantize)}")
+        return
+
+    result = verify_agreement(args.embedding_model, args.cross_encoder, args.output, args.tolerance, args.threads)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if not result['passed']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+from typing import Any, Dict, Iterator, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import time
+from metrics import observe
+
+
+class RAGPipeline:
+    """召回 -> 重排 -> 生成 的完整问答流程，查询分类与召回、重排并行执行"""
+
+    def __init__(self, retriever, reranker, generator, max_workers: int = 4, max_context_chunks: int = 1):
+
+        self.retriever = retriever
+        self.reranker = reranker
+        self.generator = generator
+        # 生成时使用的重排片段数，默认只用最相关的片段；大于 1 时其余片段只补充知识点，prompt 会变长
+        self.max_context_chunks = max_context_chunks
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="classifier")
+
+    def _classify(self, query: str) -> Tuple[str, float]:
+
+        start = time.perf_counter()
+        query_type = self.generator.classifier.classify(query)
+        return query_type, _elapsed_ms(start)
+
+    def prepare(self, query: str, top_k_retrieve: int = 5, top_k_rerank: int = 3) -> Dict[str, Any]:
+        """
+        并行完成查询分类和召回、重排
+
+        Returns:
+            Dict: chunks（重排后的文本块）、query_type（查询类型）、timings（各阶段耗时，毫秒）
+        """
+        events = list(self._prepare_steps(query, top_k_retrieve, top_k_rerank))
+        return events[-1][1]
+
+    def _prepare_steps(self, query: str, top_k_retrieve: int, top_k_rerank: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+
+        # 分类只依赖查询本身，先提交到后台线程
+        classify_future = self.executor.submit(self._classify, query)
+        timings: Dict[str, float] = {}
+
+        # 召回
+        start = time.perf_counter()
+        retrieved_chunks = self.retriever.retrieve(query, top_k=top_k_retrieve)
+        timings['retrieval'] = _elapsed_ms(start)
+        yield 'stage', {'stage': 'retrieval', 'count': len(retrieved_chunks), 'elapsed_ms': timings['retrieval']}
+
+        # 重排
+        start = time.perf_counter()
+        reranked_chunks = self.reranker.rerank(query, retrieved_chunks, top_k=top_k_rerank)
+        timings['rerank'] = _elapsed_ms(start)
+        yield 'stage', {'stage': 'rerank', 'count': len(reranked_chunks), 'elapsed_ms': timings['rerank']}
+
+        # 在构建prompt前等待分类结果
+        start = time.perf_counter()
+        query_type, timings['classification'] = classify_future.result()
+        timings['classification_wait'] = _elapsed_ms(start)
+
+        yield 'prepared', {'chunks': reranked_chunks, 'query_type': query_type, 'timings': timings}
+
+    def answer(self, query: str, top_k_retrieve: int = 5, top_k_rerank: int = 3) -> Tuple[str, Dict[str, float]]:
+        """
+        回答问题
+
+        Returns:
+            Tuple[str, Dict[str, float]]: 回答文本和各阶段耗时（毫秒）
+        """
+        total_start = time.perf_counter()
+        prepared = self.prepare(query, top_k_retrieve, top_k_rerank)
+        timings = prepared['timings']
+
+        start = time.perf_counter()
+        if prepared['chunks']:
+            answer = self.generator.generate(query, prepared['chunks'][:self.max_context_chunks],
+                                             query_type=prepared['query_type'])
+        else:
+            answer = "抱歉，没有找到相关信息来回答您的问题。"
+        timings['generation'] = _elapsed_ms(start)
+        timings['total'] = _elapsed_ms(total_start)
+        _record_timings(timings)
+
+        return answer, timings
+
+    def answer_stream(self, query: str, top_k_retrieve: int = 5, top_k_rerank: int = 3) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """流式回答问题，依次产出 (事件类型, 数据) 元组：stage、token、usage（token用量），最后是 timings"""
+        total_start = time.perf_counter()
+        prepared = None
+        for event, payload in self._prepare_steps(query, top_k_retrieve, top_k_rerank):
+            if event == 'prepared':
+                prepared = payload
+            else:
+                yield event, payload
+        timings = prepared['timings']
+
+        start = time.perf_counter()
+        usage: Dict[str, int] = {}
+        if prepared['chunks']:
+            for text in self.generator.generate_stream(query, prepared['chunks'][:self.max_context_chunks],
+                                                       query_type=prepared['query_type'], usage=usage):
+                if 'first_token' not in timings:
+                    timings['first_token'] = _elapsed_ms(start)
+                yield 'token', {'text': text}
+        else:
+            yield 'token', {'text': "抱歉，没有找到相关信息来回答您的问题。"}
+        timings['generation'] = _elapsed_ms(start)
+        timings['total'] = _elapsed_ms(total_start)
+
+        _record_timings(timings)
+        if usage:
+            yield 'usage', usage
+        yield 'timings', timings
+
+
+def _record_timings(timings: Dict[str, float]) -> None:
+    """把各阶段耗时（毫秒）记入延迟直方图"""
+    for stage, ms in timings.items():
+        observe(stage, ms / 1000)
+
+
+def _elapsed_ms(start: float) -> float:
+
+    return round((time.perf_counter() - start) * 1000, 2)
@@ -1,22 +1,75 @@
-from typing import Literal
+from typing import Dict, Literal, Optional, Tuple
+import json
 import os
-from dotenv import load_dotenv
-from openai import OpenAI
+import numpy as np
+from cache import LRUCache, normalize_query
+from llm_client import LLMClient, get_llm_client
+
+QUERY_TYPES = ["concept", "calculation", "experiment", "other"]
+
+DEFAULT_EXAMPLES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'query_examples.json')
 
 
 class QueryClassifier:
     """查询分类器，将用户问题分类为不同的教学类型"""
     
-    def __init__(self, model_name: str = "deepseek-chat"):
-        load_dotenv()
-        api_key = os.getenv("DEEPSEEK_API_KEY")
-        if not api_key:
-            raise ValueError("DEEPSEEK_API_KEY not found in environment variables")
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com"
-        )
+    def __init__(self, model_name: str = "deepseek-chat", embedding_model=None,
+                 examples_file: str = DEFAULT_EXAMPLES_FILE, confidence_threshold: float = 0.05,
+                 cache_size: int = 1024, scheduler=None, llm_client: Optional[LLMClient] = None,
+                 llm_timeout: float = 10.0):
+        """
+        Args:
+            model_name: 用于兜底分类的LLM模型名
+            embedding_model: 已加载的 SentenceTransformer，提供时启用本地最近质心分类
+            examples_file: 各类别标注样例文件（JSON：类别 -> 问题列表）
+            confidence_threshold: 最近与次近质心相似度之差低于该值时回退到LLM
+            cache_size: 分类结果缓存大小，为 0 时关闭
+            scheduler: 已注册 "embed" 任务的 InferenceScheduler，提供时查询向量化走批量调度
+            llm_client: LLM 客户端，默认使用进程内共享的客户端
+            llm_timeout: LLM 分类的截止时间（秒），超时后按 "other" 处理
+        """
+        self.llm = llm_client or get_llm_client()
+        self.llm_timeout = llm_timeout
         self.model_name = model_name
+        self.embedding_model = embedding_model
+        self.scheduler = scheduler
+        self.confidence_threshold = confidence_threshold
+        self.cache = LRUCache(cache_size) if cache_size > 0 else None
+        self.labels = []
+        self.centroids = None
+        if embedding_model is not None:
+            self._build_centroids(examples_file)
+    
+    def _build_centroids(self, examples_file: str) -> None:
+        """用标注样例的向量均值作为各类别质心"""
+        with open(examples_file, 'r', encoding='utf-8') as f:
+            examples: Dict[str, list] = json.load(f)
+        
+        centroids = []
+        for label in QUERY_TYPES:
+            if not examples.get(label):
+                continue
+            embeddings = self.embedding_model.encode(examples[label], normalize_embeddings=True)
+            centroid = np.mean(embeddings, axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+            self.labels.append(label)
+        self.centroids = np.vstack(centroids).astype(np.float32)
+    
+    def classify_local(self, query: str) -> Tuple[str, float]:
+        """
+        本地最近质心分类
+        
+        Returns:
+            (类别, 置信度)，置信度为最近与次近质心余弦相似度之差
+        """
+        if self.scheduler is not None:
+            embedding = self.scheduler.submit("embed", query).result()
+        else:
+            embedding = self.embedding_model.encode(query, normalize_embeddings=True)
+        similarities = self.centroids @ np.asarray(embedding, dtype=np.float32)
+        ranked = np.argsort(similarities)[::-1]
+        margin = float(similarities[ranked[0]] - similarities[ranked[1]]) if len(ranked) > 1 else 1.0
+        return self.labels[ranked[0]], margin
     
     def classify(self, query: str) -> Literal["concept", "calculation", "experiment", "other"]:
         """
@@ -33,6 +86,32 @@ class QueryClassifier:
             - "other": 其他类型（与中学物理摩擦力知识无关）
         """
         
+        key = normalize_query(query)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        result = None
+        if self.centroids is not None:
+            label, confidence = self.classify_local(key)
+            if confidence >= self.confidence_threshold:
+                result = label
+        
+        if result is None:
+            result = self._classify_with_llm(query)
+        
+        if result is None:
+            # 出错时默认为其他类型，且不缓存
+            return "other"
+        
+        if self.cache is not None:
+            self.cache.put(key, result)
+        return result
+    
+    def _classify_with_llm(self, query: str) -> Optional[str]:
+        """调用LLM进行分类，出错时返回None"""
+        
         classification_prompt = f"""
         ## 任务说明
         请将下面的物理问题分类到以下四个类别之一，只需要返回类别名称：
@@ -76,19 +155,20 @@ class QueryClassifier:
         """
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
+            response = self.llm.chat(
+                [
                     {"role": "system", "content": "You are a helpful assistant that classifies physics questions. Return only one of: concept, calculation, experiment, other"},
                     {"role": "user", "content": classification_prompt}
                 ],
-                stream=False
+                model=self.model_name,
+                timeout=self.llm_timeout,
+                latency_group="classify"
             )
             
             result = response.choices[0].message.content.strip().lower()
             
             # 确保返回值是有效的分类
-            if result in ["concept", "calculation", "experiment", "other"]:
+            if result in QUERY_TYPES:
                 return result
             else:
                 # 默认分类为其他类型
@@ -96,5 +176,4 @@ class QueryClassifier:
                 
         except Exception as e:
             print(f"分类出错: {e}")
-            # 出错时默认为其他类型
-            return "other"
+            return None
@@ -1,21 +1,84 @@
-from typing import List
-from sentence_transformers import CrossEncoder
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import heapq
+from cache import LRUCache, normalize_query
 
 class Reranker:
-    
-    def __init__(self, model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"):
 
-        self.cross_encoder = CrossEncoder(model_name, cache_folder="d:/MyProject/EduAgent/models")
-    
+    def __init__(self, model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1", scheduler=None,
+                 cache_size: int = 4096, cache_ttl: Optional[float] = 3600, cross_encoder=None,
+                 backend: str = "torch", backend_options: Optional[Dict] = None):
+
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Unknown inference backend: {backend}")
+        # 推理后端：torch（CrossEncoder）或 onnx（ONNX Runtime int8，见 onnx_backend.py）
+        if cross_encoder is None and backend == "onnx":
+            from onnx_backend import load_cross_encoder
+            cross_encoder = load_cross_encoder(model_name, **(backend_options or {}))
+        elif cross_encoder is None:
+            from sentence_transformers import CrossEncoder
+            cross_encoder = CrossEncoder(model_name, cache_folder="d:/MyProject/EduAgent/models")
+        # 可传入已加载的模型或接口兼容的替身（predict）
+        self.cross_encoder = cross_encoder
+        # 提供 InferenceScheduler 时，打分与其他请求合并批量执行
+        self.scheduler = scheduler
+        if scheduler is not None:
+            scheduler.register_cross_encoder(self.cross_encoder)
+        # 打分缓存：(归一化查询, chunk哈希) -> 得分，cache_size 为 0 时关闭
+        self.score_cache = LRUCache(cache_size, cache_ttl) if cache_size > 0 else None
+
     def rerank(self, query: str, chunks: List[str], top_k: int = 3) -> List[str]:
 
-        # 为每个 (query, chunk) 对生成得分
-        pairs = [(query, chunk) for chunk in chunks]
-        scores = self.cross_encoder.predict(pairs)
-        
-        # 按得分降序排序
-        scored_chunks = list(zip(chunks, scores))
-        scored_chunks.sort(key=lambda x: x[1], reverse=True)
-        
-        # 返回前 top_k 个
-        return [chunk for chunk, _ in scored_chunks][:top_k]
+        return [chunk for chunk, _ in self.rerank_with_scores(query, chunks, top_k)]
+
+    def rerank_with_scores(self, query: str, chunks: List[str], top_k: int = 3) -> List[Tuple[str, float]]:
+        """
+        对候选文本块打分并返回得分最高的 top_k 个
+
+        Args:
+            query: 查询文本
+            chunks: 候选文本块
+            top_k: 返回数量
+
+        Returns:
+            List[Tuple[str, float]]: 按得分降序排列的 (文本块, 得分)
+        """
+        scores = self.score(query, chunks)
+
+        # 部分选择前 top_k 个，无需对全部候选排序
+        best = heapq.nlargest(top_k, range(len(chunks)), key=scores.__getitem__)
+        return [(chunks[i], scores[i]) for i in best]
+
+    def score(self, query: str, chunks: List[str]) -> List[float]:
+        """为每个 (query, chunk) 对打分，已缓存的直接复用，其余一次性批量打分"""
+        if self.score_cache is None:
+            return self._predict([(query, chunk) for chunk in chunks])
+
+        # 归一化查询只用于缓存键，交叉编码器仍对原始查询打分
+        normalized = normalize_query(query)
+        keys = [(normalized, hashlib.sha1(chunk.encode("utf-8")).hexdigest()) for chunk in chunks]
+        scores: List[Optional[float]] = [self.score_cache.get(key) for key in keys]
+
+        # 同一批中重复的chunk只打分一次
+        missing = {}
+        for i, score in enumerate(scores):
+            if score is None:
+                missing.setdefault(keys[i], i)
+
+        if missing:
+            indices = list(missing.values())
+            new_scores = self._predict([(query, chunks[i]) for i in indices])
+            for i, score in zip(indices, new_scores):
+                self.score_cache.put(keys[i], score)
+            computed = dict(zip(missing.keys(), new_scores))
+            scores = [computed[key] if score is None else score for key, score in zip(keys, scores)]
+
+        return scores
+
+    def _predict(self, pairs: List[Tuple[str, str]]) -> List[float]:
+
+        if not pairs:
+            return []
+        if self.scheduler is not None:
+            return [future.result() for future in self.scheduler.submit_many("rerank", pairs)]
+        return [float(score) for score in self.cross_encoder.predict(pairs)]
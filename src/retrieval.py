@@ -1,20 +1,102 @@
-from typing import List
-from sentence_transformers import SentenceTransformer
+from typing import Any, Dict, List, Optional
+import heapq
+from cache import LRUCache, normalize_query
+from metrics import timer
 
 
 class Retriever:
-    
-    def __init__(self, indexer):
+
+    def __init__(self, indexer, cache_size: int = 1024, cache_ttl: Optional[float] = 3600, scheduler=None,
+                 mode: str = "vector", rrf_k: int = 60, candidate_multiplier: int = 2):
+        """
+        Args:
+            indexer: 已构建索引的 VectorIndexer
+            cache_size: 查询向量缓存大小，为 0 时关闭
+            cache_ttl: 查询向量缓存过期时间（秒）
+            scheduler: InferenceScheduler，提供时查询向量化走批量调度
+            mode: "vector" 仅向量检索；"hybrid" 向量检索与BM25检索按倒数排名融合
+            rrf_k: 倒数排名融合（RRF）的平滑常数
+            candidate_multiplier: 混合检索时每路召回 top_k * candidate_multiplier 个候选
+        """
+        if mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        if mode == "hybrid" and indexer.lexical_index is None:
+            raise ValueError("Hybrid retrieval requires an indexer built with lexical=True")
 
         self.indexer = indexer
+        self.mode = mode
+        self.rrf_k = rrf_k
+        self.candidate_multiplier = candidate_multiplier
+        # 提供 InferenceScheduler 时，查询向量化与其他请求合并批量执行
+        self.scheduler = scheduler
         self.embedding_model = indexer.embedding_model
-        self.collection = indexer.collection
-    
+        if scheduler is not None:
+            scheduler.register_embedding_model(self.embedding_model)
+        self.store = indexer.store
+        # 查询向量缓存：归一化查询文本 -> 向量，cache_size 为 0 时关闭
+        self.query_cache = LRUCache(cache_size, cache_ttl) if cache_size > 0 else None
+
+    def embed_query(self, query: str) -> List[float]:
+
+        if self.query_cache is None:
+            return self._encode(query)
+
+        # 归一化文本只作为缓存键，未命中时用原始查询计算向量；只有大小写、全半角等写法不同的查询
+        # 共用缓存中第一次出现的写法的向量
+        key = normalize_query(query)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = self._encode(query)
+            self.query_cache.put(key, embedding)
+        return embedding
+
+    def _encode(self, text: str) -> List[float]:
+
+        with timer('query_embedding'):
+            if self.scheduler is not None:
+                return self.scheduler.submit("embed", text).result()
+            return self.indexer.embed_chunk(text)
+
+    def cache_stats(self) -> Dict[str, Any]:
+
+        return self.query_cache.stats() if self.query_cache is not None else {}
+
     def retrieve(self, query: str, top_k: int = 5) -> List[str]:
 
-        query_embedding = self.indexer.embed_chunk(query)
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
-        )
+        if self.mode == "hybrid":
+            return self._retrieve_hybrid(query, top_k)
+
+        query_embedding = self.embed_query(query)
+        with timer('vector_search'):
+            results = self.store.query([query_embedding], top_k)
         return results['documents'][0]
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 5) -> List[List[str]]:
+        """批量召回，向量模式下多个查询只做一次存储查询"""
+        if self.mode == "hybrid":
+            return [self._retrieve_hybrid(query, top_k) for query in queries]
+
+        query_embeddings = [self.embed_query(query) for query in queries]
+        return self.store.query(query_embeddings, top_k)['documents']
+
+    def _retrieve_hybrid(self, query: str, top_k: int) -> List[str]:
+
+        candidate_k = top_k * self.candidate_multiplier
+        query_embedding = self.embed_query(query)
+        with timer('vector_search'):
+            results = self.store.query([query_embedding], candidate_k)
+        vector_ids = results['ids'][0]
+        with timer('lexical_search'):
+            lexical_ids = [doc_id for doc_id, _ in self.indexer.lexical_index.search(query, candidate_k)]
+
+        # 倒数排名融合：score = sum(1 / (rrf_k + rank))
+        fused: Dict[str, float] = {}
+        for ranked_ids in (vector_ids, lexical_ids):
+            for rank, doc_id in enumerate(ranked_ids, start=1):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank)
+
+        documents = dict(zip(vector_ids, results['documents'][0]))
+        documents.update((doc_id, self.indexer.lexical_index.documents[doc_id]) for doc_id in lexical_ids)
+
+        best = heapq.nlargest(top_k, fused.items(), key=lambda x: x[1])
+        return [documents[doc_id] for doc_id, _ in best]
@@ -0,0 +1,382 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json
+import os
+import uuid
+import numpy as np
+
+
+class VectorStore:
+    """向量存储接口：VectorIndexer 写入，Retriever 查询"""
+
+    def get_ids(self) -> List[str]:
+        raise NotImplementedError
+
+    def add(self, ids: List[str], embeddings: Sequence[Sequence[float]], documents: List[str],
+            metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]) -> None:
+        raise NotImplementedError
+
+    def get_documents(self) -> Tuple[List[str], List[str]]:
+        """返回全部 (ID列表, 文本列表)"""
+        raise NotImplementedError
+
+    def query(self, query_embeddings: Sequence[Sequence[float]], top_k: int) -> Dict[str, List[List[Any]]]:
+        """
+        批量查询最相似的向量
+
+        Returns:
+            Dict: ids、documents、scores（余弦相似度），每项为与查询一一对应的列表
+        """
+        raise NotImplementedError
+
+    def persist(self) -> None:
+        """将内存中的改动落盘（不需要时为空操作）"""
+
+    def __len__(self) -> int:
+        return len(self.get_ids())
+
+
+class ChromaVectorStore(VectorStore):
+    """基于 ChromaDB 的向量存储"""
+
+    def __init__(self, persist_dir: Optional[str] = None, name: str = "documents"):
+
+        import chromadb
+
+        if persist_dir:
+            self.client = chromadb.PersistentClient(path=persist_dir)
+        else:
+            self.client = chromadb.EphemeralClient()
+        self.collection = self.client.get_or_create_collection(name=name)
+
+    def get_ids(self) -> List[str]:
+
+        return self.collection.get(include=[])['ids']
+
+    def add(self, ids: List[str], embeddings: Sequence[Sequence[float]], documents: List[str],
+            metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+
+        self.collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids: List[str]) -> None:
+
+        self.collection.delete(ids=ids)
+
+    def get_documents(self) -> Tuple[List[str], List[str]]:
+
+        results = self.collection.get(include=['documents'])
+        return results['ids'], results['documents']
+
+    def query(self, query_embeddings: Sequence[Sequence[float]], top_k: int) -> Dict[str, List[List[Any]]]:
+
+        results = self.collection.query(query_embeddings=query_embeddings, n_results=top_k)
+        # 默认的平方L2距离在单位向量上满足 d = 2 - 2cos
+        scores = [[1 - distance / 2 for distance in distances] for distances in results['distances']]
+        return {'ids': results['ids'], 'documents': results['documents'], 'scores': scores}
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    进程内 NumPy 向量存储
+
+    归一化向量保存在一个连续的 float32（或 float16）矩阵中，查询为一次矩阵乘法
+    加 argpartition。指定 persist_dir 时以 .npy 保存，加载时使用内存映射。
+
+    设置 first_pass 时先在压缩后的向量上做粗排：int8 为逐维标量量化，pca 为投影到前
+    reduced_dim 个主成分；粗排取 top_k * oversample 个候选，再用原始精度向量精确重算得分。
+    落盘后原始精度矩阵改为内存映射，常驻内存的只有压缩向量，精排只读取候选所在的行。
+    每次写入 embeddings.npy 都会生成新的版本号，粗排向量记录其对应的版本号和参数，
+    加载时不一致（例如之后被 numpy 后端重写过）则在首次查询前重建。
+    """
+
+    EMBEDDINGS_FILE = "embeddings.npy"
+    DOCUMENTS_FILE = "documents.json"
+    FIRST_PASS_FILE = "first_pass_{}.npy"
+    FIRST_PASS_PARAMS_FILE = "first_pass_{}_params.npy"
+    FIRST_PASS_META_FILE = "first_pass_{}.json"
+    # 重建粗排向量时每次转换为 float32 的行数，限制临时内存
+    BLOCK_ROWS = 16384
+    # 粗排打分时每块的行数，块较小时转换后的数据仍在 CPU 缓存中
+    SCORE_BLOCK_ROWS = 512
+
+    def __init__(self, persist_dir: Optional[str] = None, dtype: str = "float32", first_pass: Optional[str] = None,
+                 oversample: int = 4, reduced_dim: int = 128):
+        """
+        Args:
+            persist_dir: 持久化目录，为 None 时只保存在内存中
+            dtype: 原始向量的存储精度：float32 或 float16（内存减半，但查询时需逐块转换，延迟更高）
+            first_pass: 粗排使用的压缩向量：None（不压缩，直接精确检索）、int8 或 pca
+            oversample: 粗排候选数为 top_k 的倍数
+            reduced_dim: pca 模式下保留的维数
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        if first_pass not in (None, "int8", "pca"):
+            raise ValueError(f"Unsupported first pass: {first_pass}")
+        self.persist_dir = persist_dir
+        self.dtype = np.dtype(dtype)
+        self.first_pass = first_pass
+        self.oversample = oversample
+        self.reduced_dim = reduced_dim
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Optional[Dict[str, Any]]] = []
+        self.matrix = np.empty((0, 0), dtype=self.dtype)
+        # 粗排向量及其参数（int8 为逐维缩放系数，pca 为投影矩阵），为 None 时在下次查询前重建
+        self._codes: Optional[np.ndarray] = None
+        self._params: Optional[np.ndarray] = None
+        self._rows: Dict[str, int] = {}
+        self._dirty = False
+        # 已落盘的 embeddings.npy 的版本号，以及落盘的粗排向量是否与之一致
+        self._generation: Optional[str] = None
+        self._first_pass_saved = False
+
+        if persist_dir and os.path.exists(os.path.join(persist_dir, self.EMBEDDINGS_FILE)):
+            self.load()
+
+    def get_ids(self) -> List[str]:
+
+        return list(self.ids)
+
+    def get_documents(self) -> Tuple[List[str], List[str]]:
+
+        return list(self.ids), list(self.documents)
+
+    def add(self, ids: List[str], embeddings: Sequence[Sequence[float]], documents: List[str],
+            metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+
+        if not ids:
+            return
+        new_rows = np.asarray(embeddings, dtype=self.dtype)
+        if self.matrix.size:
+            self.matrix = np.ascontiguousarray(np.vstack([self.matrix, new_rows]))
+        else:
+            self.matrix = np.ascontiguousarray(new_rows)
+        for doc_id, document, metadata in zip(ids, documents, metadatas or [None] * len(ids)):
+            self._rows[doc_id] = len(self.ids)
+            self.ids.append(doc_id)
+            self.documents.append(document)
+            self.metadatas.append(metadata)
+        self._codes = None
+        self._dirty = True
+
+    def delete(self, ids: List[str]) -> None:
+
+        remove = {self._rows[doc_id] for doc_id in ids if doc_id in self._rows}
+        if not remove:
+            return
+        keep = [row for row in range(len(self.ids)) if row not in remove]
+        self.matrix = np.ascontiguousarray(self.matrix[keep])
+        self.ids = [self.ids[row] for row in keep]
+        self.documents = [self.documents[row] for row in keep]
+        self.metadatas = [self.metadatas[row] for row in keep]
+        self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        if self._codes is not None:
+            # 量化参数不依赖被删除的行，直接删去对应的粗排向量
+            self._codes = self._codes[keep]
+        self._dirty = True
+
+    def query(self, query_embeddings: Sequence[Sequence[float]], top_k: int) -> Dict[str, List[List[Any]]]:
+
+        results: Dict[str, List[List[Any]]] = {'ids': [], 'documents': [], 'scores': []}
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        if not self.ids:
+            for _ in range(len(queries)):
+                results['ids'].append([])
+                results['documents'].append([])
+                results['scores'].append([])
+            return results
+
+        top_k = min(top_k, len(self.ids))
+        if self.first_pass is not None and top_k * self.oversample < len(self.ids):
+            return self._query_two_pass(queries, top_k, results)
+
+        # (查询数, 文档数) 的相似度矩阵；float16 存储节省一半内存，计算时分块转换为 float32
+        similarities = self._block_scores(queries, self.matrix)
+        candidates = np.argpartition(-similarities, top_k - 1, axis=1)[:, :top_k]
+
+        for row_scores, row_candidates in zip(similarities, candidates):
+            order = row_candidates[np.argsort(-row_scores[row_candidates])]
+            self._append_result(results, order, row_scores[order])
+        return results
+
+    def _query_two_pass(self, queries: np.ndarray, top_k: int, results: Dict[str, List[List[Any]]]
+                        ) -> Dict[str, List[List[Any]]]:
+        """在压缩向量上粗排出 top_k * oversample 个候选，再用原始精度向量精确重算得分"""
+        self._ensure_first_pass()
+        candidate_k = top_k * self.oversample
+        approximate = self._approximate_scores(queries)
+        candidates = np.argpartition(-approximate, candidate_k - 1, axis=1)[:, :candidate_k]
+
+        for query, row_candidates in zip(queries, candidates):
+            # 按行号顺序读取，内存映射时访问更连续
+            row_candidates = np.sort(row_candidates)
+            exact = self.matrix[row_candidates].astype(np.float32, copy=False) @ query
+            best = np.argpartition(-exact, top_k - 1)[:top_k]
+            best = best[np.argsort(-exact[best])]
+            self._append_result(results, row_candidates[best], exact[best])
+        return results
+
+    def _approximate_scores(self, queries: np.ndarray) -> np.ndarray:
+
+        if self.first_pass == "int8":
+            # q·x ≈ (q * scale / 127)·codes
+            queries = queries * (self._params / 127.0)
+        else:
+            queries = queries @ self._params.T
+        return self._block_scores(queries, self._codes)
+
+    def _block_scores(self, queries: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        """计算每个查询与 matrix 各行的内积；非 float32 的矩阵逐块转换到同一块缓冲区后再用 BLAS 计算"""
+        if matrix.dtype == np.float32:
+            return queries @ matrix.T
+        scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+        buffer = np.empty((min(self.SCORE_BLOCK_ROWS, len(matrix)), matrix.shape[1]), dtype=np.float32)
+        for start in range(0, len(matrix), self.SCORE_BLOCK_ROWS):
+            block = matrix[start:start + self.SCORE_BLOCK_ROWS]
+            np.copyto(buffer[:len(block)], block, casting='unsafe')
+            scores[:, start:start + len(block)] = queries @ buffer[:len(block)].T
+        return scores
+
+    def _ensure_first_pass(self) -> None:
+        """根据原始精度矩阵重建粗排向量（写入或删除后首次查询时）"""
+        if self._codes is not None:
+            return
+        if self.first_pass == "int8":
+            # 逐维对称量化：每一维按该维的最大绝对值缩放到 [-127, 127]
+            scale = np.zeros(self.matrix.shape[1], dtype=np.float32)
+            for start in range(0, len(self.matrix), self.BLOCK_ROWS):
+                block = np.abs(self.matrix[start:start + self.BLOCK_ROWS]).astype(np.float32)
+                scale = np.maximum(scale, block.max(axis=0))
+            scale[scale == 0] = 1.0
+            codes = np.empty(self.matrix.shape, dtype=np.int8)
+            for start in range(0, len(self.matrix), self.BLOCK_ROWS):
+                block = self.matrix[start:start + self.BLOCK_ROWS].astype(np.float32)
+                codes[start:start + len(block)] = np.round(block / scale * 127)
+            self._params = scale
+        else:
+            # 不中心化的 SVD：保留内积的最优低秩近似；在最多 20000 行样本上拟合
+            step = max(1, len(self.matrix) // 20000)
+            sample = np.asarray(self.matrix[::step], dtype=np.float32)
+            _, _, components = np.linalg.svd(sample, full_matrices=False)
+            dim = min(self.reduced_dim, len(components))
+            self._params = np.ascontiguousarray(components[:dim])
+            codes = np.empty((len(self.matrix), dim), dtype=np.float16)
+            for start in range(0, len(self.matrix), self.BLOCK_ROWS):
+                block = self.matrix[start:start + self.BLOCK_ROWS].astype(np.float32)
+                codes[start:start + len(block)] = block @ self._params.T
+        self._codes = codes
+
+    def _append_result(self, results: Dict[str, List[List[Any]]], rows: np.ndarray, scores: np.ndarray) -> None:
+
+        results['ids'].append([self.ids[i] for i in rows])
+        results['documents'].append([self.documents[i] for i in rows])
+        results['scores'].append([float(score) for score in scores])
+
+    def memory_usage(self) -> Dict[str, int]:
+        """各部分占用的字节数；内存映射的原始精度矩阵不计入常驻内存"""
+        mapped = isinstance(self.matrix, np.memmap)
+        return {
+            'full_precision_bytes': int(self.matrix.nbytes),
+            'full_precision_resident': not mapped,
+            'first_pass_bytes': int(self._codes.nbytes) if self._codes is not None else 0,
+        }
+
+    def persist(self) -> None:
+
+        if not self.persist_dir:
+            return
+        embeddings_path = os.path.join(self.persist_dir, self.EMBEDDINGS_FILE)
+        # 旧版本的索引没有版本号，启用粗排时重写一次以便之后复用粗排向量
+        if self._dirty or (self.first_pass is not None and self.ids and self._generation is None):
+            os.makedirs(self.persist_dir, exist_ok=True)
+            documents_path = os.path.join(self.persist_dir, self.DOCUMENTS_FILE)
+            self._generation = uuid.uuid4().hex
+
+            # 先写临时文件再替换，避免中断时留下不完整的索引
+            np.save(embeddings_path + ".tmp.npy", self.matrix)
+            with open(documents_path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump({'ids': self.ids, 'documents': self.documents, 'metadatas': self.metadatas,
+                           'generation': self._generation}, f, ensure_ascii=False)
+            os.replace(embeddings_path + ".tmp.npy", embeddings_path)
+            os.replace(documents_path + ".tmp", documents_path)
+            self._dirty = False
+            self._first_pass_saved = False
+        if self.first_pass is not None and self.ids and not self._first_pass_saved:
+            self._save_first_pass()
+            # 精排只需读取少量行，原始精度矩阵改为内存映射，不再常驻内存
+            self.matrix = np.load(embeddings_path, mmap_mode='r')
+
+    def _first_pass_meta(self) -> Dict[str, Any]:
+        """粗排向量对应的索引版本和参数，加载时据此判断能否复用"""
+        meta = {'generation': self._generation, 'first_pass': self.first_pass}
+        if self.first_pass == "pca":
+            meta['reduced_dim'] = self.reduced_dim
+        return meta
+
+    def _first_pass_paths(self) -> Tuple[str, str, str]:
+
+        return tuple(os.path.join(self.persist_dir, name.format(self.first_pass)) for name in
+                     (self.FIRST_PASS_FILE, self.FIRST_PASS_PARAMS_FILE, self.FIRST_PASS_META_FILE))
+
+    def _save_first_pass(self) -> None:
+
+        self._ensure_first_pass()
+        codes_path, params_path, meta_path = self._first_pass_paths()
+        np.save(codes_path + ".tmp.npy", self._codes)
+        np.save(params_path + ".tmp.npy", self._params)
+        os.replace(codes_path + ".tmp.npy", codes_path)
+        os.replace(params_path + ".tmp.npy", params_path)
+        # 元数据最后写入，中断时残留的粗排向量因版本号不一致而不会被复用
+        with open(meta_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self._first_pass_meta(), f)
+        os.replace(meta_path + ".tmp", meta_path)
+        self._first_pass_saved = True
+
+    def load(self) -> None:
+
+        self.matrix = np.load(os.path.join(self.persist_dir, self.EMBEDDINGS_FILE), mmap_mode='r')
+        if self.matrix.dtype != self.dtype:
+            self.matrix = self.matrix.astype(self.dtype)
+        with open(os.path.join(self.persist_dir, self.DOCUMENTS_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.ids = data['ids']
+        self.documents = data['documents']
+        self.metadatas = data.get('metadatas') or [None] * len(self.ids)
+        self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._generation = data.get('generation')
+        self._codes = self._params = None
+        self._first_pass_saved = False
+        if self.first_pass is not None and self._generation is not None:
+            codes_path, params_path, meta_path = self._first_pass_paths()
+            # 粗排向量整体读入内存；文件缺失或版本号、参数与索引不一致时在首次查询前重建
+            if all(os.path.exists(path) for path in (codes_path, params_path, meta_path)):
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                if meta == self._first_pass_meta():
+                    self._codes, self._params = np.load(codes_path), np.load(params_path)
+                    self._first_pass_saved = True
+        self._dirty = False
+
+
+# 预设的存储后端：名称 -> (后端, 默认参数)
+STORE_PRESETS = {
+    "numpy-int8": ("numpy", {"first_pass": "int8"}),
+    "numpy-pca": ("numpy", {"first_pass": "pca"}),
+}
+
+
+def create_vector_store(backend: str = "chroma", persist_dir: Optional[str] = None, **kwargs) -> VectorStore:
+    """根据名称创建向量存储后端：chroma、numpy，或 STORE_PRESETS 中的 numpy-int8 / numpy-pca"""
+    if backend in STORE_PRESETS:
+        backend, defaults = STORE_PRESETS[backend]
+        kwargs = {**defaults, **kwargs}
+    if backend == "chroma":
+        return ChromaVectorStore(persist_dir, **kwargs)
+    if backend == "numpy":
+        return NumpyVectorStore(persist_dir, **kwargs)
+    raise ValueError(f"Unknown vector store backend: {backend}")
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# src 下的模块以平铺方式相互导入，与 main.py / app.py 的运行方式一致
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'web'))
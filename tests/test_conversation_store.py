@@ -0,0 +1,56 @@
+import sqlite3
+
+from conversation_store import SQLiteConversationStore, WriteBehindWriter
+
+
+class FlakyStore(SQLiteConversationStore):
+    """前 failures 次 apply 抛出异常，之后正常写入"""
+
+    def __init__(self, db_path, failures=1):
+        super().__init__(db_path)
+        self.failures = failures
+        self.calls = 0
+
+    def apply(self, operations):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise sqlite3.OperationalError("database is locked")
+        super().apply(operations)
+
+
+def conversation(conversation_id, text):
+    return {'_id': conversation_id, 'title': conversation_id, 'created_at': '2026-01-01T00:00:00',
+            'updated_at': '2026-01-01T00:00:00', 'messages': [{'sender': 'user', 'text': text}]}
+
+
+def test_failed_batch_is_retried(tmp_path):
+    store = FlakyStore(str(tmp_path / 'conversations.db'), failures=1)
+    writer = WriteBehindWriter(store, max_delay_ms=1)
+    writer.submit('save', conversation('a', 'hello'))
+    writer.submit('save', conversation('b', 'world'))
+    writer.submit('append', 'a', [{'sender': 'bot', 'text': 'hi'}], '2026-01-01T00:00:01')
+    writer.flush()
+    writer.close()
+
+    assert store.calls >= 2
+    assert [message['text'] for message in store.load('a')['messages']] == ['hello', 'hi']
+    assert [message['text'] for message in store.load('b')['messages']] == ['world']
+
+
+def test_persistent_failure_only_drops_the_failing_operation(tmp_path):
+    class PoisonStore(SQLiteConversationStore):
+
+        def apply(self, operations):
+            if any(name == 'save' and args[0]['_id'] == 'bad' for name, args in operations):
+                raise sqlite3.IntegrityError("constraint failed")
+            super().apply(operations)
+
+    store = PoisonStore(str(tmp_path / 'conversations.db'))
+    writer = WriteBehindWriter(store, max_delay_ms=1, max_retries=2)
+    writer.submit('save', conversation('good', 'kept'))
+    writer.submit('save', conversation('bad', 'lost'))
+    writer.flush()
+    writer.close()
+
+    assert store.load('good')['messages'] == [{'sender': 'user', 'text': 'kept'}]
+    assert store.load('bad') is None
@@ -0,0 +1,54 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("openai")
+pytest.importorskip("dotenv")
+
+from llm_client import LLMClient
+
+
+class FakeCompletions:
+    """按模型返回固定耗时的补全接口，记录每个模型收到的请求数"""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.calls = {}
+
+    def create(self, model, **kwargs):
+        self.calls[model] = self.calls.get(model, 0) + 1
+        time.sleep(self.delays[model])
+        return model
+
+
+def make_client(delays):
+    client = LLMClient(api_key="test", base_url="http://127.0.0.1:9", hedge_percentile=95, hedge_min_samples=5)
+    completions = FakeCompletions(delays)
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return client, completions
+
+
+def test_slow_model_is_not_hedged_by_fast_model_history():
+    client, completions = make_client({"fast": 0.0, "slow": 0.2})
+    try:
+        for _ in range(10):
+            client.chat([], model="fast")
+        for _ in range(3):
+            client.chat([], model="slow")
+        assert completions.calls["slow"] == 3
+        assert client.latency_percentile(95, "slow") is None
+    finally:
+        client.close()
+
+
+def test_latency_groups_are_kept_apart_for_same_model():
+    client, completions = make_client({"deepseek-chat": 0.0})
+    try:
+        for _ in range(10):
+            client.chat([], model="deepseek-chat", latency_group="classify")
+        assert client.latency_percentile(95, "deepseek-chat", "classify") is not None
+        assert client.latency_percentile(95, "deepseek-chat", "generate") is None
+    finally:
+        client.close()
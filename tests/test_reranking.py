@@ -0,0 +1,35 @@
+from reranking import Reranker
+
+
+class RecordingCrossEncoder:
+    """记录收到的 (query, chunk) 对，得分为 chunk 长度"""
+
+    def __init__(self):
+        self.pairs = []
+
+    def predict(self, pairs):
+        self.pairs.extend(pairs)
+        return [float(len(chunk)) for _, chunk in pairs]
+
+
+def test_cross_encoder_receives_original_query_with_cache():
+    encoder = RecordingCrossEncoder()
+    reranker = Reranker(cross_encoder=encoder)
+    reranker.score("ＡＢＣ 摩擦力", ["片段一", "片段二"])
+    assert [query for query, _ in encoder.pairs] == ["ＡＢＣ 摩擦力", "ＡＢＣ 摩擦力"]
+
+
+def test_cross_encoder_receives_original_query_without_cache():
+    encoder = RecordingCrossEncoder()
+    reranker = Reranker(cross_encoder=encoder, cache_size=0)
+    reranker.score("ＡＢＣ 摩擦力", ["片段一"])
+    assert encoder.pairs == [("ＡＢＣ 摩擦力", "片段一")]
+
+
+def test_normalized_variants_share_cached_scores():
+    encoder = RecordingCrossEncoder()
+    reranker = Reranker(cross_encoder=encoder)
+    first = reranker.score("ABC 摩擦力", ["片段一", "片段二"])
+    second = reranker.score("abc  摩擦力", ["片段一", "片段二"])
+    assert second == first
+    assert len(encoder.pairs) == 2
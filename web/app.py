@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 import os
 import sys
@@ -7,9 +7,18 @@ import logging
 from datetime import datetime
 from dotenv import load_dotenv
 import uuid
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from conversation_store import SQLiteConversationStore, WriteBehindWriter
 
 # 加载环境变量
 load_dotenv()
+# 召回与重排深度，可用 benchmarks/eval_retrieval.py 在标注问题集上评估后调整
+TOP_K_RETRIEVE = int(os.getenv("EDUAGENT_TOP_K_RETRIEVE", "5"))
+TOP_K_RERANK = int(os.getenv("EDUAGENT_TOP_K_RERANK", "3"))
 HF_TOKEN = os.getenv("HF_TOKEN")
 if HF_TOKEN:
     os.environ["HF_TOKEN"] = HF_TOKEN
@@ -23,12 +32,19 @@ os.environ["TRANSFORMERS_VERBOSITY"] = "error"  # 减少transformers输出
 # 添加src目录到路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+# 指标模块只依赖标准库，演示模式下同样可用
+from metrics import REGISTRY, REQUESTS, REQUEST_LATENCY
+
 try:
-    from chunking import split_into_chunks
+    from chunking import iter_chunks, iter_document_files
     from indexing import VectorIndexer
     from retrieval import Retriever
     from reranking import Reranker
     from generation import ResponseGenerator
+    from query_classifier import QueryClassifier
+    from pipeline import RAGPipeline
+    from inference_scheduler import InferenceScheduler
+    from onnx_backend import backend_options_from_env
 except ImportError as e:
     print(f"Warning: Could not import EduAgent modules: {e}")
     print("Running in demo mode...")
@@ -58,86 +74,108 @@ logger.setLevel(logging.INFO)  # 但保持我们自己的日志为INFO级别
 
 # ===== 会话存储管理器 =====
 class ConversationManager:
-    """管理对话的存储和检索"""
+    """
+    管理对话的存储和检索（SQLite，首次启动时导入旧版 JSON 会话文件）
+    
+    更新和追加消息由后台线程合并后批量写入，读取前先等待已提交的写入完成。
+    """
+    
+    store = None
+    writer = None
+    _lock = threading.Lock()
     
     @staticmethod
-    def _get_session_filename(session_id):
-        """生成会话文件名"""
-        return f"Session_{session_id}.json"
+    def _get_store():
+        """获取会话存储，首次调用时创建数据库并迁移 TEMP_DIR 下的 JSON 文件"""
+        with ConversationManager._lock:
+            if ConversationManager.store is None:
+                db_path = os.getenv("EDUAGENT_CONVERSATION_DB", os.path.join(TEMP_DIR, 'conversations.db'))
+                store = SQLiteConversationStore(db_path)
+                imported = store.migrate_json_dir(TEMP_DIR)
+                if imported:
+                    logger.info(f"✓ Migrated {imported} JSON conversations into {db_path}")
+                ConversationManager.writer = WriteBehindWriter(
+                    store, max_delay_ms=float(os.getenv("EDUAGENT_CONVERSATION_WRITE_DELAY_MS", "50")))
+                atexit.register(ConversationManager.writer.close)
+                ConversationManager.store = store
+        return ConversationManager.store
     
     @staticmethod
-    def _get_session_filepath(session_id):
-        """获取会话文件完整路径"""
-        return os.path.join(TEMP_DIR, ConversationManager._get_session_filename(session_id))
+    def _flush():
+        """等待后台写入完成，保证随后的读取能看到之前的更新"""
+        ConversationManager._get_store()
+        ConversationManager.writer.flush()
+        return ConversationManager.store
     
     @staticmethod
     def save_conversation(session_id, conversation_data):
-        """保存对话到本地文件"""
+        """新建或整体保存对话（同步写入）"""
         try:
-            filepath = ConversationManager._get_session_filepath(session_id)
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(conversation_data, f, ensure_ascii=False, indent=2)
-            logger.info(f"✓ Conversation saved to: {filepath}")
+            conversation_data['_id'] = session_id
+            ConversationManager._flush().save(conversation_data)
+            logger.info(f"✓ Conversation saved: {session_id}")
             return True
         except Exception as e:
             logger.error(f"Failed to save conversation: {e}")
             return False
     
+    @staticmethod
+    def update_conversation(session_id, updated_at, title=None, messages=None):
+        """更新标题或整体替换消息（后台写入）"""
+        try:
+            ConversationManager._get_store()
+            ConversationManager.writer.submit('update', session_id, updated_at, title, messages)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to update conversation: {e}")
+            return False
+    
+    @staticmethod
+    def append_messages(session_id, messages, updated_at):
+        """在对话末尾追加消息（后台写入），每轮只写入新消息"""
+        try:
+            ConversationManager._get_store()
+            ConversationManager.writer.submit('append', session_id, messages, updated_at)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to append messages: {e}")
+            return False
+    
+    @staticmethod
+    def conversation_exists(session_id):
+        """新建和删除都是同步写入，无需等待后台队列"""
+        return ConversationManager._get_store().exists(session_id)
+    
     @staticmethod
     def load_conversation(session_id):
-        """加载对话（从本地文件）"""
-        # 从本地文件读取
+        """加载对话"""
         try:
-            filepath = ConversationManager._get_session_filepath(session_id)
-            if os.path.exists(filepath):
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                logger.info(f"Loaded conversation from file: {session_id}")
-                return data
+            data = ConversationManager._flush().load(session_id)
+            if data:
+                logger.info(f"Loaded conversation: {session_id}")
+            return data
         except Exception as e:
             logger.error(f"Failed to load conversation: {e}")
         
         return None
     
     @staticmethod
-    def list_conversations():
-        """列出所有本地对话"""
+    def list_conversations(limit=50, cursor=None):
+        """按更新时间倒序分页列出对话，返回 (对话列表, 下一页游标)"""
         try:
-            conversations = []
-            if os.path.exists(TEMP_DIR):
-                for filename in os.listdir(TEMP_DIR):
-                    if filename.startswith('Session_') and filename.endswith('.json'):
-                        filepath = os.path.join(TEMP_DIR, filename)
-                        try:
-                            with open(filepath, 'r', encoding='utf-8') as f:
-                                data = json.load(f)
-                                conversations.append({
-                                    '_id': data.get('_id', filename.replace('Session_', '').replace('.json', '')),
-                                    'title': data.get('title', '未命名对话'),
-                                    'created_at': data.get('created_at'),
-                                    'updated_at': data.get('updated_at'),
-                                    'message_count': len(data.get('messages', []))
-                                })
-                        except Exception as e:
-                            logger.warning(f"Failed to load conversation file {filename}: {e}")
-            
-            # 按更新时间排序
-            conversations.sort(key=lambda x: x.get('updated_at', ''), reverse=True)
-            return conversations
+            return ConversationManager._flush().list(limit, cursor)
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Failed to list conversations: {e}")
-            return []
+            return [], None
     
     @staticmethod
     def delete_conversation(session_id):
         """删除对话"""
         try:
-            # 删除本地文件
-            filepath = ConversationManager._get_session_filepath(session_id)
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                logger.info(f"Deleted conversation file: {session_id}")
-            
+            if ConversationManager._flush().delete(session_id):
+                logger.info(f"Deleted conversation: {session_id}")
             return True
         except Exception as e:
             logger.error(f"Failed to delete conversation: {e}")
@@ -147,6 +185,52 @@ class ConversationManager:
 edu_agent = None
 initialized = False
 
+class ReadinessTracker:
+    """记录各组件的加载状态与耗时，供 /api/ready 查询"""
+    
+    COMPONENTS = ['embedding_model', 'cross_encoder', 'index', 'warmup', 'pipeline']
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = None
+        self.components = {name: {'status': 'pending', 'seconds': None} for name in self.COMPONENTS}
+    
+    def start(self, name):
+        with self._lock:
+            if self.started_at is None:
+                self.started_at = time.perf_counter()
+            self.components[name] = {'status': 'loading', 'seconds': None, '_start': time.perf_counter()}
+    
+    def finish(self, name, error=None):
+        with self._lock:
+            component = self.components[name]
+            seconds = round(time.perf_counter() - component.pop('_start', time.perf_counter()), 3)
+            component.update({'status': 'failed' if error else 'ready', 'seconds': seconds})
+            if error:
+                component['error'] = str(error)
+    
+    def track(self, name, fn, *args, **kwargs):
+        """执行 fn 并记录组件 name 的状态"""
+        self.start(name)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.finish(name, e)
+            raise
+        self.finish(name)
+        return result
+    
+    def snapshot(self):
+        with self._lock:
+            components = {name: {k: v for k, v in info.items() if not k.startswith('_')}
+                          for name, info in self.components.items()}
+            elapsed = round(time.perf_counter() - self.started_at, 3) if self.started_at else None
+        return {'components': components, 'elapsed_seconds': elapsed}
+
+readiness = ReadinessTracker()
+init_thread = None
+init_lock = threading.Lock()
+
 class EduAgentDemo:
     """演示模式的EduAgent"""
     
@@ -168,6 +252,14 @@ class EduAgentDemo:
                 return response
         
         return f"感谢您的提问：\"{question}\"。这是一个很好的学习问题。在实际部署中，EduAgent会通过RAG技术从知识库中检索相关信息并生成准确的答案。目前演示模式下，请尝试询问关于摩擦力、牛顿第一定律、加速度或动能势能的问题。"
+    
+    def answer_question_with_timings(self, question):
+        
+        return self.answer_question(question), {}
+    
+    def answer_question_stream(self, question):
+        """演示模式流式回答问题（整段输出）"""
+        yield 'token', {'text': self.answer_question(question)}
 
 class EduAgentWrapper:
     """EduAgent包装器"""
@@ -176,6 +268,7 @@ class EduAgentWrapper:
         self.retriever = None
         self.reranker = None
         self.generator = None
+        self.pipeline = None
         self._initialize()
     
     def _initialize(self):
@@ -187,25 +280,40 @@ class EduAgentWrapper:
             current_dir = os.path.dirname(os.path.abspath(__file__))
             src_dir = os.path.join(os.path.dirname(current_dir), 'src')
             data_dir = os.path.join(os.path.dirname(current_dir), 'data')
-            doc_file = os.path.join(data_dir, 'doc.md')
+            # 文档来源可以是单个文件、目录或 glob 表达式
+            doc_source = os.getenv("EDUAGENT_DOCS", os.path.join(data_dir, 'doc.md'))
+            index_dir = os.getenv("EDUAGENT_INDEX_DIR", os.path.join(os.path.dirname(current_dir), 'index'))
             
             # 检查文档文件是否存在
-            if not os.path.exists(doc_file):
-                raise FileNotFoundError(f"Document file not found: {doc_file}")
+            if next(iter_document_files(doc_source), None) is None:
+                raise FileNotFoundError(f"Document file not found: {doc_source}")
             
-            # 1. 分片
-            chunks = split_into_chunks(doc_file)
-            logger.info(f"知识库文档分片完成，共 {len(chunks)} 个片段")
+            # 并发请求的向量化和重排打分由推理调度器合并成批执行
+            threads = os.getenv("EDUAGENT_INFERENCE_THREADS")
+            scheduler = InferenceScheduler(
+                max_batch_size=int(os.getenv("EDUAGENT_BATCH_MAX_SIZE", "32")),
+                max_wait_ms=float(os.getenv("EDUAGENT_BATCH_MAX_WAIT_MS", "5")),
+                num_threads=int(threads) if threads else None
+            )
             
-            # 2. 索引
-            indexer = VectorIndexer()
-            indexer.build_index(chunks)
-            logger.info("知识库向量索引构建完成")
+            # 向量模型与重排模型互不依赖，并行加载；索引构建只需等待向量模型
+            # EDUAGENT_INFERENCE_BACKEND=onnx 时两个模型都使用 int8 量化的 ONNX Runtime 推理
+            backend = os.getenv("EDUAGENT_INFERENCE_BACKEND", "torch")
+            backend_options = backend_options_from_env() if backend == "onnx" else None
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                reranker_future = executor.submit(readiness.track, 'cross_encoder', Reranker, scheduler=scheduler,
+                                                  backend=backend, backend_options=backend_options)
+                indexer = readiness.track('embedding_model', VectorIndexer, persist_dir=index_dir,
+                                          store=os.getenv("EDUAGENT_VECTOR_STORE", "chroma"),
+                                          backend=backend, backend_options=backend_options)
+                readiness.track('index', self._build_index, indexer, doc_source)
+                self.reranker = reranker_future.result()
+            
+            # 预热：各跑一次推理，触发权重加载到内存和算子初始化，避免首个请求变慢
+            readiness.track('warmup', self._warm_up, indexer, self.reranker)
             
             # 3. 初始化组件
-            self.retriever = Retriever(indexer)
-            self.reranker = Reranker()
-            self.generator = ResponseGenerator()
+            readiness.track('pipeline', self._build_pipeline, indexer, scheduler)
             
             logger.info("EduAgent初始化成功")
             
@@ -213,28 +321,61 @@ class EduAgentWrapper:
             logger.error(f"EduAgent初始化失败: {e}")
             raise
     
-    def answer_question(self, question, top_k_retrieve=5, top_k_rerank=3):
-        """回答问题"""
+    def _build_pipeline(self, indexer, scheduler):
+        
+        self.retriever = Retriever(indexer, scheduler=scheduler, mode=os.getenv("EDUAGENT_RETRIEVAL_MODE", "hybrid"))
+        classifier = QueryClassifier(embedding_model=indexer.embedding_model, scheduler=scheduler)
+        self.generator = ResponseGenerator(classifier=classifier)
+        self.pipeline = RAGPipeline(self.retriever, self.reranker, self.generator)
+    
+    @staticmethod
+    def _build_index(indexer, doc_source):
+        """1. 分片（流式产出）+ 2. 索引（分批向量化和写入）"""
+        if os.getenv("EDUAGENT_SKIP_INDEX_BUILD") == "1":
+            # 索引已由 src/ingest.py 离线构建，启动时直接加载
+            count = indexer.load_index()
+            logger.info(f"已加载离线构建的向量索引，共 {count} 个片段")
+            return
+        # EDUAGENT_CHUNKING: title 按标题（默认）、chars 按字符数、tokens 按向量模型token数
+        chunking = os.getenv("EDUAGENT_CHUNKING", "title")
+        if chunking == "tokens":
+            chunks = iter_chunks(doc_source, use_semantic=False, tokenizer=indexer.embedding_model.tokenizer,
+                                 max_tokens=indexer.max_chunk_tokens)
+        else:
+            chunks = iter_chunks(doc_source, use_semantic=(chunking == "title"))
+        stats = indexer.build_index(chunks)
+        logger.info(f"知识库分片与向量索引构建完成，共 {stats['added'] + stats['unchanged']} 个片段: "
+                    f"新增 {stats['added']}，删除 {stats['deleted']}，未变化 {stats['unchanged']}")
+    
+    @staticmethod
+    def _warm_up(indexer, reranker):
+        
+        indexer.embedding_model.encode(["预热"], normalize_embeddings=True)
+        reranker.cross_encoder.predict([("预热", "预热")])
+    
+    def answer_question(self, question, top_k_retrieve=TOP_K_RETRIEVE, top_k_rerank=TOP_K_RERANK):
+        """回答问题（查询分类与召回、重排并行执行）"""
+        return self.answer_question_with_timings(question, top_k_retrieve, top_k_rerank)[0]
+    
+    def answer_question_with_timings(self, question, top_k_retrieve=TOP_K_RETRIEVE, top_k_rerank=TOP_K_RERANK):
+        """回答问题，同时返回各阶段耗时（毫秒）"""
         try:
-            # 召回
-            retrieved_chunks = self.retriever.retrieve(question, top_k=top_k_retrieve)
-            logger.info(f"检索到 {len(retrieved_chunks)} 个相关片段")
-            
-            # 重排
-            reranked_chunks = self.reranker.rerank(question, retrieved_chunks, top_k=top_k_rerank)
-            logger.info(f"重排后保留 {len(reranked_chunks)} 个片段")
-            
-            # 生成回答
-            if reranked_chunks:
-                answer = self.generator.generate(question, reranked_chunks[0])
-            else:
-                answer = "抱歉，没有找到相关信息来回答您的问题。"
-            
-            return answer
+            answer, timings = self.pipeline.answer(question, top_k_retrieve=top_k_retrieve, top_k_rerank=top_k_rerank)
+            logger.info(f"各阶段耗时(ms): {timings}")
+            return answer, timings
             
         except Exception as e:
             logger.error(f"回答问题时出错: {e}")
-            return f"处理问题时出现错误: {str(e)}"
+            return f"处理问题时出现错误: {str(e)}", {}
+    
+    def answer_question_stream(self, question, top_k_retrieve=TOP_K_RETRIEVE, top_k_rerank=TOP_K_RERANK):
+        """流式回答问题，依次产出 (事件类型, 数据) 元组"""
+        for event, payload in self.pipeline.answer_stream(question, top_k_retrieve=top_k_retrieve, top_k_rerank=top_k_rerank):
+            if event == 'timings':
+                logger.info(f"各阶段耗时(ms): {payload}")
+            elif event == 'usage':
+                logger.info(f"token用量: {payload}")
+            yield event, payload
 
 def initialize_edu_agent():
     """初始化EduAgent"""
@@ -253,6 +394,35 @@ def initialize_edu_agent():
     
     initialized = True
 
+def start_background_initialization():
+    """在后台线程中初始化EduAgent，请求在就绪前快速返回 503"""
+    global init_thread
+    
+    with init_lock:
+        if init_thread is None and not initialized:
+            init_thread = threading.Thread(target=initialize_edu_agent, name="eduagent-init", daemon=True)
+            init_thread.start()
+
+def not_ready_response():
+    """
+    EduAgent 尚未就绪时返回 503；关闭后台初始化（EDUAGENT_BACKGROUND_INIT=0）时同步初始化并返回 None
+    """
+    if initialized:
+        return None
+    if os.getenv("EDUAGENT_BACKGROUND_INIT", "1") == "0":
+        initialize_edu_agent()
+        return None
+    
+    start_background_initialization()
+    response = jsonify({
+        'success': False,
+        'error': '系统正在加载模型，请稍后再试',
+        'ready': False,
+        **readiness.snapshot()
+    })
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
 @app.route('/')
 def index():
     """主页"""
@@ -278,12 +448,13 @@ def ask_question():
                 'error': '问题不能为空'
             }), 400
         
-        # 确保EduAgent已初始化
-        if not initialized:
-            initialize_edu_agent()
+        # EduAgent 未就绪时快速返回
+        pending = not_ready_response()
+        if pending is not None:
+            return pending
         
         # 获取回答
-        answer = edu_agent.answer_question(question)
+        answer, timings = edu_agent.answer_question_with_timings(question)
         
         # 返回结果
         response = {
@@ -292,6 +463,9 @@ def ask_question():
             'timestamp': datetime.now().isoformat(),
             'question': question
         }
+        # 请求中带 "include_timings": true 时附上各阶段耗时（毫秒）
+        if data.get('include_timings'):
+            response['timings'] = timings
         
         logger.info(f"问题: {question[:50]}... | 回答长度: {len(answer)}")
         
@@ -304,6 +478,63 @@ def ask_question():
             'error': f'服务器内部错误: {str(e)}'
         }), 500
 
+def format_sse(event, data):
+    """格式化一条 server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """流式处理问题API（server-sent events）"""
+    data = request.get_json(silent=True)
+    
+    if not data or 'question' not in data:
+        return jsonify({
+            'success': False,
+            'error': '缺少问题参数'
+        }), 400
+    
+    question = data['question'].strip()
+    
+    if not question:
+        return jsonify({
+            'success': False,
+            'error': '问题不能为空'
+        }), 400
+    
+    # EduAgent 未就绪时快速返回
+    pending = not_ready_response()
+    if pending is not None:
+        return pending
+    
+    def event_stream():
+        answer_parts = []
+        try:
+            for event, payload in edu_agent.answer_question_stream(question):
+                if event == 'token':
+                    answer_parts.append(payload['text'])
+                yield format_sse(event, payload)
+            
+            answer = ''.join(answer_parts)
+            logger.info(f"问题: {question[:50]}... | 回答长度: {len(answer)}")
+            yield format_sse('done', {
+                'success': True,
+                'answer': answer,
+                'timestamp': datetime.now().isoformat(),
+                'question': question
+            })
+        except Exception as e:
+            logger.error(f"流式处理问题时出错: {e}")
+            yield format_sse('error', {
+                'success': False,
+                'error': f'服务器内部错误: {str(e)}'
+            })
+    
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/status')
 def get_status():
     """获取系统状态"""
@@ -318,6 +549,9 @@ def get_status():
         if initialized and isinstance(edu_agent, EduAgentWrapper):
             status['mode'] = 'production'
             status['knowledge_base'] = 'loaded'
+            status['query_cache'] = edu_agent.retriever.cache_stats()
+            status['rerank_cache'] = edu_agent.reranker.score_cache.stats() if edu_agent.reranker.score_cache else {}
+            status['llm_usage'] = edu_agent.generator.usage_stats()
         else:
             status['mode'] = 'demo'
             status['knowledge_base'] = 'demo_data'
@@ -331,6 +565,37 @@ def get_status():
             'error': str(e)
         }), 500
 
+@app.route('/api/ready')
+def ready_check():
+    """就绪检查：各组件的加载状态与耗时，全部就绪前返回 503"""
+    ready = initialized
+    body = {
+        'ready': ready,
+        'mode': 'production' if isinstance(edu_agent, EduAgentWrapper) else ('demo' if ready else 'loading'),
+        'timestamp': datetime.now().isoformat(),
+        **readiness.snapshot()
+    }
+    return jsonify(body), 200 if ready else 503
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Prometheus 文本格式的各阶段延迟直方图、请求与 token 计数"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """按路由记录请求数与耗时（流式接口只统计到响应头返回为止）"""
+    if request.url_rule is not None and request.url_rule.rule.startswith('/api/'):
+        endpoint = request.url_rule.rule
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+        if hasattr(g, 'request_start'):
+            REQUEST_LATENCY.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    return response
+
 @app.route('/api/health')
 def health_check():
     """健康检查"""
@@ -341,10 +606,14 @@ def health_check():
 
 @app.route('/api/conversations', methods=['GET'])
 def get_conversations():
-    """获取所有对话列表"""
+    """获取对话列表，支持 limit 和 cursor 分页参数"""
     try:
-        conversations = ConversationManager.list_conversations()
-        return jsonify({'conversations': conversations}), 200
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        cursor = request.args.get('cursor')
+        conversations, next_cursor = ConversationManager.list_conversations(limit, cursor)
+        return jsonify({'conversations': conversations, 'next_cursor': next_cursor}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"获取对话列表出错: {e}")
         return jsonify({'conversations': []}), 200
@@ -387,32 +656,40 @@ def create_conversation():
 
 @app.route('/api/conversations/<conversation_id>', methods=['PUT'])
 def update_conversation(conversation_id):
-    """更新对话（添加消息或更新内容）"""
+    """更新对话标题，或整体替换消息列表（如重新生成回复后）"""
     try:
         data = request.json or {}
         
-        # 加载现有对话
-        conversation = ConversationManager.load_conversation(conversation_id)
-        
-        if not conversation:
+        if not ConversationManager.conversation_exists(conversation_id):
             return jsonify({'error': '对话不存在'}), 404
         
-        # 更新字段
-        if 'messages' in data:
-            conversation['messages'] = data['messages']
-        if 'title' in data:
-            conversation['title'] = data['title']
-        
-        conversation['updated_at'] = datetime.now().isoformat()
-        
-        # 保存更新
-        ConversationManager.save_conversation(conversation_id, conversation)
+        ConversationManager.update_conversation(conversation_id, datetime.now().isoformat(),
+                                                title=data.get('title'), messages=data.get('messages'))
         
         return jsonify({'success': True}), 200
     except Exception as e:
         logger.error(f"更新对话出错: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/conversations/<conversation_id>/messages', methods=['POST'])
+def append_messages(conversation_id):
+    """在对话末尾追加新消息，请求体为 {"messages": [...]} 或单条 {"message": {...}}"""
+    try:
+        data = request.json or {}
+        messages = data.get('messages') or ([data['message']] if data.get('message') else [])
+        if not messages:
+            return jsonify({'error': '消息不能为空'}), 400
+        
+        if not ConversationManager.conversation_exists(conversation_id):
+            return jsonify({'error': '对话不存在'}), 404
+        
+        ConversationManager.append_messages(conversation_id, messages, datetime.now().isoformat())
+        
+        return jsonify({'success': True}), 202
+    except Exception as e:
+        logger.error(f"追加消息出错: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/conversations/<conversation_id>', methods=['DELETE'])
 def delete_conversation(conversation_id):
     """删除对话"""
@@ -447,23 +724,28 @@ if __name__ == '__main__':
     print("EduAgent Web Server Starting...")
     print("=" * 60)
     
-    # 初始化EduAgent
-    try:
-        initialize_edu_agent()
-        print(f"✓ EduAgent initialized successfully")
-    except Exception as e:
-        print(f"⚠ EduAgent initialization failed, using demo mode: {e}")
+    # 初始化EduAgent：默认在后台加载，服务立即可用，进度见 /api/ready
+    if os.getenv("EDUAGENT_BACKGROUND_INIT", "1") == "0":
+        try:
+            initialize_edu_agent()
+            print(f"✓ EduAgent initialized successfully")
+        except Exception as e:
+            print(f"⚠ EduAgent initialization failed, using demo mode: {e}")
+    else:
+        start_background_initialization()
+        print("✓ EduAgent is loading in the background, see /api/ready")
     
+    port = int(os.getenv("EDUAGENT_PORT", "5000"))
     print("\nServer will be available at:")
-    print("  Local:   http://localhost:5000")
-    print("  Network: http://0.0.0.0:5000")
+    print(f"  Local:   http://localhost:{port}")
+    print(f"  Network: http://0.0.0.0:{port}")
     print("\nPress Ctrl+C to stop the server")
     print("=" * 60)
     
-    # 启动服务器
+    # 启动服务器；压测时设置 EDUAGENT_DEBUG=0 关闭调试模式和自动重载
     app.run(
         host='0.0.0.0',
-        port=5000,
-        debug=True,
+        port=port,
+        debug=os.getenv("EDUAGENT_DEBUG", "1") != "0",
         threaded=True
     )
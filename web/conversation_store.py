@@ -0,0 +1,348 @@
+"""
+基于 SQLite 的会话存储
+
+会话元数据（标题、时间、消息数）与消息分表保存，updated_at 上建有索引，
+列表接口按 (updated_at, id) 游标分页，无需读取任何消息内容。
+"""
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created_at TEXT,
+    updated_at TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations (updated_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def encode_cursor(updated_at, conversation_id):
+    """把列表中最后一条的 (updated_at, id) 编码为不透明的游标"""
+    raw = json.dumps([updated_at, conversation_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+
+    try:
+        updated_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return updated_at, conversation_id
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+class SQLiteConversationStore:
+    """会话存储：每个线程使用独立连接，WAL 模式下读写互不阻塞"""
+
+    def __init__(self, db_path):
+
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def save(self, conversation):
+        """新建或整体覆盖一个会话（元数据与全部消息）"""
+        with self._connect() as conn:
+            self._save(conn, conversation)
+
+    def update(self, conversation_id, updated_at, title=None, messages=None):
+        """只更新给出的字段；messages 不为空时整体替换消息"""
+        with self._connect() as conn:
+            self._update(conn, conversation_id, updated_at, title, messages)
+
+    def append(self, conversation_id, messages, updated_at):
+        """在会话末尾追加消息，只写入新消息本身"""
+        with self._connect() as conn:
+            self._append(conn, conversation_id, messages, updated_at)
+
+    def apply(self, operations):
+        """在同一个事务中依次执行 (操作名, 参数) 列表，供后台写入线程批量提交"""
+        with self._connect() as conn:
+            for name, args in operations:
+                getattr(self, '_' + name)(conn, *args)
+
+    def exists(self, conversation_id):
+
+        row = self._connect().execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row is not None
+
+    def _save(self, conn, conversation):
+
+        messages = conversation.get('messages', [])
+        conn.execute(
+            "INSERT INTO conversations (id, title, created_at, updated_at, message_count) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET title = excluded.title, created_at = excluded.created_at, "
+            "updated_at = excluded.updated_at, message_count = excluded.message_count",
+            (conversation['_id'], conversation.get('title', '未命名对话'), conversation.get('created_at'),
+             conversation.get('updated_at') or '', len(messages))
+        )
+        self._replace_messages(conn, conversation['_id'], messages)
+
+    def _update(self, conn, conversation_id, updated_at, title=None, messages=None):
+
+        if title is not None:
+            conn.execute("UPDATE conversations SET title = ? WHERE id = ?", (title, conversation_id))
+        if messages is not None:
+            conn.execute("UPDATE conversations SET message_count = ? WHERE id = ?", (len(messages), conversation_id))
+            self._replace_messages(conn, conversation_id, messages)
+        conn.execute("UPDATE conversations SET updated_at = ? WHERE id = ?", (updated_at, conversation_id))
+
+    def _append(self, conn, conversation_id, messages, updated_at):
+
+        row = conn.execute("SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if row is None:
+            logger.warning(f"Dropped messages for missing conversation: {conversation_id}")
+            return
+        start = row['message_count']
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, seq, data) VALUES (?, ?, ?)",
+            [(conversation_id, start + offset, json.dumps(message, ensure_ascii=False))
+             for offset, message in enumerate(messages)]
+        )
+        conn.execute("UPDATE conversations SET message_count = ?, updated_at = ? WHERE id = ?",
+                     (start + len(messages), updated_at, conversation_id))
+
+    def _replace_messages(self, conn, conversation_id, messages):
+
+        conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, seq, data) VALUES (?, ?, ?)",
+            [(conversation_id, seq, json.dumps(message, ensure_ascii=False)) for seq, message in enumerate(messages)]
+        )
+
+    def load(self, conversation_id):
+
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if row is None:
+            return None
+        messages = conn.execute(
+            "SELECT data FROM messages WHERE conversation_id = ? ORDER BY seq", (conversation_id,)
+        ).fetchall()
+        return {
+            '_id': row['id'],
+            'title': row['title'],
+            'messages': [json.loads(message['data']) for message in messages],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+
+    def list(self, limit=50, cursor=None):
+        """
+        按更新时间倒序分页列出会话
+
+        Args:
+            limit: 每页数量
+            cursor: 上一页返回的 next_cursor，为空时从最新的会话开始
+
+        Returns:
+            tuple: (会话摘要列表, 下一页游标；没有更多时为 None)
+        """
+        query = "SELECT id, title, created_at, updated_at, message_count FROM conversations"
+        params = []
+        if cursor:
+            updated_at, conversation_id = decode_cursor(cursor)
+            query += " WHERE updated_at < ? OR (updated_at = ? AND id < ?)"
+            params += [updated_at, updated_at, conversation_id]
+        query += " ORDER BY updated_at DESC, id DESC LIMIT ?"
+        # 多取一条用来判断是否还有下一页
+        params.append(limit + 1)
+
+        rows = self._connect().execute(query, params).fetchall()
+        conversations = [{
+            '_id': row['id'],
+            'title': row['title'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+            'message_count': row['message_count']
+        } for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = conversations[-1]
+            next_cursor = encode_cursor(last['updated_at'], last['_id'])
+        return conversations, next_cursor
+
+    def delete(self, conversation_id):
+
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            cursor = conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+        return cursor.rowcount > 0
+
+    def migrate_json_dir(self, json_dir):
+        """
+        一次性导入旧版 Session_*.json 会话文件，完成后在 meta 表中记录，之后不再扫描目录
+
+        Returns:
+            int: 导入的会话数
+        """
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return 0
+        if not json_dir or not os.path.exists(json_dir):
+            return 0
+
+        imported = 0
+        for filename in os.listdir(json_dir):
+            if not (filename.startswith('Session_') and filename.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(json_dir, filename), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                data.setdefault('_id', filename[len('Session_'):-len('.json')])
+                # 已存在的会话以数据库为准
+                if not self.exists(data['_id']):
+                    self.save(data)
+                    imported += 1
+            except Exception as e:
+                logger.warning(f"Failed to migrate conversation file {filename}: {e}")
+
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (str(imported),))
+        return imported
+
+
+class WriteBehindWriter:
+    """
+    后台写入线程
+
+    写操作进入队列后立即返回，后台线程等待 max_delay_ms 收集一批操作，
+    合并被整体覆盖的旧操作后在一个事务中提交。读取前调用 flush() 保证读到自己的写入。
+    提交失败时整批放回队首重试，连续失败 max_retries 次后改为逐个提交，只丢弃自身无法写入的操作。
+    """
+
+    def __init__(self, store, max_delay_ms=50.0, max_retries=3):
+
+        self.store = store
+        self.max_delay = max_delay_ms / 1000.0
+        self.max_retries = max_retries
+        self._pending = []
+        self._condition = threading.Condition()
+        self._in_flight = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, name, *args):
+        """提交一个写操作：save、update 或 append，参数与 SQLiteConversationStore 的同名方法一致"""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Writer is closed")
+            self._pending.append((name, args))
+            self._condition.notify_all()
+
+    def flush(self):
+        """阻塞直到此前提交的写操作全部落盘"""
+        with self._condition:
+            while self._pending or self._in_flight:
+                self._condition.wait()
+
+    def close(self):
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+
+        failures = 0
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending and self._closed:
+                    return
+            # 留出时间窗口，让短时间内的连续更新合并为一次提交
+            if not self._closed:
+                time.sleep(self.max_delay)
+            with self._condition:
+                operations = self._pending
+                self._pending = []
+                self._in_flight = True
+            batch = self._coalesce(operations)
+            retry = False
+            try:
+                self.store.apply(batch)
+                failures = 0
+            except Exception as e:
+                # 整批在同一个事务中执行，失败时已回滚，可以原样重试
+                failures += 1
+                if failures < self.max_retries:
+                    logger.warning(f"Failed to write conversations, retrying ({failures}/{self.max_retries}): {e}")
+                    retry = True
+                else:
+                    failures = 0
+                    self._apply_each(batch)
+            finally:
+                with self._condition:
+                    if retry:
+                        self._pending = batch + self._pending
+                    self._in_flight = False
+                    self._condition.notify_all()
+            if retry:
+                time.sleep(self.max_delay * 2 ** failures)
+
+    def _apply_each(self, operations):
+        """逐个提交，一个操作失败不影响同批的其他会话"""
+        for name, args in operations:
+            try:
+                self.store.apply([(name, args)])
+            except Exception as e:
+                conversation_id = args[0]['_id'] if name == 'save' else args[0]
+                logger.error(f"Failed to write conversation {conversation_id} ({name}), dropping it: {e}")
+
+    @staticmethod
+    def _coalesce(operations):
+        """同一批中被后续整体覆盖消息的会话，之前的追加和消息替换已无意义，直接丢弃"""
+        def conversation_id(name, args):
+            return args[0]['_id'] if name == 'save' else args[0]
+
+        last_overwrite = {}
+        for position, (name, args) in enumerate(operations):
+            if name == 'save' or (name == 'update' and args[3] is not None):
+                last_overwrite[conversation_id(name, args)] = position
+
+        merged = []
+        for position, (name, args) in enumerate(operations):
+            if position < last_overwrite.get(conversation_id(name, args), -1):
+                if name == 'append':
+                    continue
+                if name == 'update':
+                    # 保留标题修改
+                    args = (args[0], args[1], args[2], None)
+            merged.append((name, args))
+        return merged
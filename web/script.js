@@ -10,9 +10,13 @@ const conversationsList = document.getElementById('conversationsList');
 // 应用状态
 let isLoading = false;
 let messageHistory = [];
+let historyRewritePending = false;
 let hasStartedConversation = false;
 let currentConversationId = null;
 let conversations = [];
+let conversationsCursor = null;
+let isLoadingConversations = false;
+let conversationsRequestId = 0;
 
 // 初始化
 document.addEventListener('DOMContentLoaded', function() {
@@ -38,8 +42,9 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
-    // 加载对话列表
+    // 加载对话列表，滚动到底部时加载下一页
     loadConversationsList();
+    conversationsList.addEventListener('scroll', handleConversationsScroll);
     
     // 初始化系统状态
     updateSystemStatus();
@@ -108,8 +113,8 @@ async function handleFormSubmit(e) {
     const loadingMessageId = showLoadingMessage();
     
     try {
-        // 模拟API调用 - 在实际应用中这里会调用后端API
-        const response = await simulateAPICall(question);
+        // 流式调用后端API，边生成边显示
+        const response = await askWithStreaming(question, loadingMessageId);
         
         // 移除加载消息，添加机器人回复
         removeLoadingMessage(loadingMessageId);
@@ -117,8 +122,7 @@ async function handleFormSubmit(e) {
         
     } catch (error) {
         console.error('Error:', error);
-        removeLoadingMessage(loadingMessageId);
-        addMessage('bot', '抱歉，处理您的问题时出现了错误。请稍后再试。');
+        showErrorMessage(loadingMessageId, errorText(error, '抱歉，处理您的问题时出现了错误。请稍后再试。'));
     } finally {
         questionInput.focus();
     }
@@ -148,7 +152,7 @@ function addMessage(sender, text) {
     };
     
     messageHistory.push(message);
-    saveMessageHistory();
+    saveMessageHistory(message);
     
     return messageId;
 }
@@ -288,13 +292,14 @@ async function regenerateResponse(messageId) {
     
     // 从历史记录中移除旧的机器人消息
     messageHistory = messageHistory.filter(msg => msg.id !== messageId);
+    historyRewritePending = true;
     
     // 显示加载状态
     const loadingMessageId = showLoadingMessage();
     
     try {
         // 调用API获取新的回复
-        const response = await simulateAPICall(userQuestion);
+        const response = await askWithStreaming(userQuestion, loadingMessageId);
         
         // 移除加载消息，添加新的机器人回复
         removeLoadingMessage(loadingMessageId);
@@ -302,8 +307,7 @@ async function regenerateResponse(messageId) {
         
     } catch (error) {
         console.error('Error:', error);
-        removeLoadingMessage(loadingMessageId);
-        addMessage('bot', '抱歉，重新生成回复时出现了错误。请稍后再试。');
+        showErrorMessage(loadingMessageId, errorText(error, '抱歉，重新生成回复时出现了错误。请稍后再试。'));
     }
 }
 
@@ -319,6 +323,133 @@ function setLoading(loading) {
     }
 }
 
+// 流式调用出错；canRetry 表示还没收到任何回答内容，可以改用普通API重新请求
+class StreamError extends Error {
+    constructor(message, canRetry) {
+        super(message);
+        this.canRetry = canRetry;
+    }
+}
+
+// 流式调用API，尚未收到回答内容时才回退到普通API
+async function askWithStreaming(question, loadingMessageId) {
+    try {
+        return await streamAPICall(question, partialAnswer => {
+            updateLoadingMessage(loadingMessageId, partialAnswer);
+        });
+    } catch (error) {
+        console.error('流式API调用失败:', error);
+        if (error instanceof StreamError && !error.canRetry) {
+            throw error;
+        }
+        return await simulateAPICall(question);
+    }
+}
+
+// 调用流式API（server-sent events），每收到一段文本就回调一次
+async function streamAPICall(question, onPartialAnswer) {
+    const response = await fetch('/api/ask/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ question: question })
+    });
+    
+    if (response.status === 503) {
+        // 模型仍在后台加载，普通API也会返回 503，不再重试
+        const data = await response.json().catch(() => ({}));
+        throw new StreamError(data.error || '系统正在加载模型，请稍后再试。', false);
+    }
+    
+    if (!response.ok || !response.body) {
+        throw new StreamError(`HTTP error! status: ${response.status}`, true);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let answer = '';
+    
+    while (true) {
+        let chunk;
+        try {
+            chunk = await reader.read();
+        } catch (error) {
+            throw new StreamError(error.message, answer === '');
+        }
+        const { done, value } = chunk;
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        
+        // 事件之间以空行分隔
+        let separatorIndex;
+        while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, separatorIndex);
+            buffer = buffer.slice(separatorIndex + 2);
+            
+            const { type, data } = parseSSEEvent(rawEvent);
+            if (type === 'token') {
+                answer += data.text;
+                onPartialAnswer(answer);
+            } else if (type === 'done') {
+                return data.answer;
+            } else if (type === 'error') {
+                throw new StreamError(data.error || '服务器返回错误', answer === '');
+            }
+        }
+    }
+    
+    // 没有收到 done 事件，连接中途断开
+    throw new StreamError('回答生成中断，请稍后再试。', answer === '');
+}
+
+// 解析单条 server-sent event
+function parseSSEEvent(rawEvent) {
+    let type = 'message';
+    let dataText = '';
+    
+    rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            type = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataText += line.slice(5).trim();
+        }
+    });
+    
+    return { type, data: dataText ? JSON.parse(dataText) : {} };
+}
+
+// 用已生成的部分回答替换加载动画
+function updateLoadingMessage(loadingId, text) {
+    const loadingElement = document.getElementById(loadingId);
+    if (!loadingElement) return;
+    
+    const textDiv = loadingElement.querySelector('.message-text');
+    textDiv.classList.remove('loading-text');
+    textDiv.innerHTML = formatMessage(text);
+    scrollToBottom();
+}
+
+// 把加载消息替换为错误提示；错误提示不写入对话记录
+function showErrorMessage(loadingId, text) {
+    const loadingElement = document.getElementById(loadingId);
+    if (!loadingElement) return;
+    
+    loadingElement.removeAttribute('id');
+    loadingElement.classList.add('error-message');
+    const textDiv = loadingElement.querySelector('.message-text');
+    textDiv.classList.remove('loading-text');
+    textDiv.textContent = text;
+    scrollToBottom();
+}
+
+// 流式调用给出的错误信息直接展示，其他错误使用通用提示
+function errorText(error, fallback) {
+    return error instanceof StreamError ? error.message : fallback;
+}
+
 // 模拟API调用
 async function simulateAPICall(question) {
     try {
@@ -463,19 +594,67 @@ function saveConversationToServer() {
     });
 }
 
+// 追加单条消息到服务器
+function appendMessageToServer(message) {
+    if (!currentConversationId) {
+        return;
+    }
+    
+    fetch(`/api/conversations/${currentConversationId}/messages`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ message })
+    }).catch(error => {
+        console.error('Failed to append message:', error);
+    });
+}
+
 // 加载对话列表
 function loadConversationsList() {
-    fetch('/api/conversations')
+    fetchConversationsPage(null);
+}
+
+// 加载下一页对话
+function loadMoreConversations() {
+    if (conversationsCursor && !isLoadingConversations) {
+        fetchConversationsPage(conversationsCursor);
+    }
+}
+
+function fetchConversationsPage(cursor) {
+    // 重新加载列表时，之前未返回的请求结果直接丢弃
+    const requestId = ++conversationsRequestId;
+    isLoadingConversations = true;
+    const url = cursor ? `/api/conversations?cursor=${encodeURIComponent(cursor)}` : '/api/conversations';
+    fetch(url)
         .then(response => response.json())
         .then(data => {
-            conversations = data.conversations || [];
+            if (requestId !== conversationsRequestId) return;
+            const page = data.conversations || [];
+            conversations = cursor ? conversations.concat(page) : page;
+            conversationsCursor = data.next_cursor || null;
             renderConversationsList();
         })
         .catch(error => {
             console.error('Failed to load conversations:', error);
+        })
+        .finally(() => {
+            if (requestId === conversationsRequestId) {
+                isLoadingConversations = false;
+            }
         });
 }
 
+// 对话列表滚动到接近底部时自动加载下一页
+function handleConversationsScroll() {
+    const remaining = conversationsList.scrollHeight - conversationsList.scrollTop - conversationsList.clientHeight;
+    if (remaining < 100) {
+        loadMoreConversations();
+    }
+}
+
 // 渲染对话列表
 function renderConversationsList() {
     conversationsList.innerHTML = '';
@@ -502,6 +681,15 @@ function renderConversationsList() {
         item.appendChild(deleteBtn);
         conversationsList.appendChild(item);
     });
+    
+    // 还有更多对话时显示加载按钮（列表不足一屏时无法靠滚动触发）
+    if (conversationsCursor) {
+        const loadMoreBtn = document.createElement('button');
+        loadMoreBtn.className = 'conversations-load-more';
+        loadMoreBtn.textContent = '加载更多';
+        loadMoreBtn.onclick = loadMoreConversations;
+        conversationsList.appendChild(loadMoreBtn);
+    }
 }
 
 // 加载指定对话
@@ -511,6 +699,7 @@ function loadConversation(conversationId) {
         .then(data => {
             currentConversationId = conversationId;
             messageHistory = data.messages || [];
+            historyRewritePending = false;
             chatMessages.innerHTML = '';
             
             if (messageHistory.length > 0) {
@@ -568,11 +757,7 @@ function deleteConversation(conversationId) {
 
 // 开始新对话
 function startNewConversation() {
-    // 保存当前对话
-    if (currentConversationId) {
-        saveConversationToServer();
-    }
-    
+    // 当前对话的消息已逐条追加保存，无需再整体保存
     // 创建新对话
     fetch('/api/conversations', {
         method: 'POST',
@@ -588,6 +773,7 @@ function startNewConversation() {
     .then(data => {
         currentConversationId = data._id;
         messageHistory = [];
+        historyRewritePending = false;
         chatMessages.innerHTML = '';
         showWelcomeSection();
         hasStartedConversation = false;
@@ -605,9 +791,14 @@ function toggleSidebar() {
     sidebar.classList.toggle('collapsed');
 }
 
-function saveMessageHistory() {
-    // MongoDB 版本：保存到服务器
-    saveConversationToServer();
+function saveMessageHistory(message) {
+    // 删除过消息（重新生成）后整体保存一次，其余情况只追加新消息
+    if (historyRewritePending) {
+        historyRewritePending = false;
+        saveConversationToServer();
+    } else {
+        appendMessageToServer(message);
+    }
 }
 
 // 加载消息历史